@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:54
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def renumber_duplicates(apps, schema_editor):
+    """
+    Blocks sharing a number with an older block of their CAM are given new numbers after the largest one
+    """
+    Block = apps.get_model('block', 'Block')
+    duplicated = Block.objects.values('CAM_id', 'num').annotate(count=Count('id')).filter(count__gt=1)
+    for cam_id in {row['CAM_id'] for row in duplicated}:
+        blocks = Block.objects.filter(CAM_id=cam_id)
+        num = blocks.aggregate(last=Max('num'))['last']
+        seen = set()
+        for block in blocks.order_by('id'):
+            if block.num in seen:
+                num += 1
+                block.num = num
+                block.save(update_fields=['num'])
+            seen.add(block.num)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('block', '0028_alter_block_resizable'),
+    ]
+
+    operations = [
+        migrations.RunPython(renumber_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='block',
+            constraint=models.UniqueConstraint(fields=('CAM', 'num'), name='unique_block_num'),
+        ),
+    ]
@@ -1,5 +1,7 @@
+from django.apps import apps
 from django.db import models
-from users.models import CustomUser, CAM
+from django.db.models import Q
+from users.models import CustomUser, CAM, CAMStats, count_changes
 # Create your models here.
 
 
@@ -23,9 +25,47 @@ class Block(models.Model):
     CAM = models.ForeignKey(CAM, on_delete=models.CASCADE, default='')
     resizable = models.BooleanField(null=True, blank=True, default=False)
 
+    class Meta:
+        # Blocks are looked up by their number on the canvas: the constraint also indexes (CAM, num)
+        constraints = [models.UniqueConstraint(fields=['CAM', 'num'], name='unique_block_num')]
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_shape = instance.__dict__.get('shape')  # See save (None when the field was deferred)
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        changes = None  # Change of the counts of the CAM (see CAMStats)
+        if self._state.adding:
+            changes = count_changes(added=[self.shape])
+        elif update_fields is None or 'shape' in update_fields:
+            saved = getattr(self, '_saved_shape', None)
+            if saved is None:
+                saved = Block.objects.filter(pk=self.pk).values_list('shape', flat=True).first()
+            if saved != self.shape:
+                changes = count_changes([saved] if saved is not None else [], [self.shape])
+        super().save(*args, **kwargs)
+        self._saved_shape = self.shape
+        CAM.bump_version(self.CAM_id)
+        if changes:
+            CAMStats.add(self.CAM_id, shapes=changes)
+
+    def delete(self, *args, **kwargs):
+        cam_id = self.CAM_id
+        # The links of the block are deleted with it
+        links = apps.get_model('link', 'Link').objects.filter(Q(starting_block=self) | Q(ending_block=self))
+        line_styles = count_changes(removed=links.values_list('line_style', flat=True))
+        shapes = count_changes(removed=[self.shape])
+        deleted = super().delete(*args, **kwargs)
+        CAM.bump_version(cam_id)
+        CAMStats.add(cam_id, shapes=shapes, line_styles=line_styles)
+        return deleted
+
     def update(self, form_info):
         if self._state.adding:
             # If instance doesn't exist!
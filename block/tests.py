@@ -1,8 +1,11 @@
+from unittest import mock
+from django.db import connection, IntegrityError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from users.models import CustomUser, CAM, Researcher, Project, logCamActions
 from .models import Block
+from link.models import Link
 from django.forms.models import model_to_dict
-import yaml
 
 # Create your tests here.
 class BlockTestCase(TestCase):
@@ -30,6 +33,33 @@ class BlockTestCase(TestCase):
         # Check that the new block was in fact created
         self.assertTrue('Meow', [block.title for block in Block.objects.all()])
 
+    def test_create_block_once(self):
+        """
+        Test that a block is added with a single INSERT and that adding the same block again is rejected
+        """
+        self.user.save()
+        data = {'add_valid': True, 'num_block': 1, 'title': 'Meow', 'shape': 3, 'x_pos': 0.0, 'y_pos': 0.0,
+                'width': 100, 'height': 100}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/block/add_block', data)
+        # The only block query is the INSERT (besides the statistics of the CAM), and links are not looked up
+        block_queries = [query['sql'] for query in queries.captured_queries
+                         if '"block_block"' in query['sql'] and 'COUNT(' not in query['sql']]
+        self.assertEqual(len(block_queries), 1)
+        self.assertTrue(block_queries[0].startswith('INSERT'))
+        self.assertFalse([query for query in queries.captured_queries if 'starting_block' in query['sql']])
+        block_ = self.cam.block_set.get()
+        self.assertEqual((response.json()['id'], response.json()['links']), (block_.id, []))
+        self.assertEqual((block_.title, block_.num, block_.shape), ('Meow', 1.0, 'neutral'))
+        response = self.client.post('/block/add_block', dict(data, title='Woof'))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(list(self.cam.block_set.values_list('title', flat=True)), ['Meow'])
+        # Any other integrity error (e.g. a CAM which no longer exists) leaves nothing behind
+        with mock.patch('block.views.record', side_effect=IntegrityError):
+            response = self.client.post('/block/add_block', dict(data, num_block=2))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.cam.block_set.filter(num=2).exists())
+
     def test_update_block(self):
         """
         Test to update an existing block
@@ -61,9 +91,10 @@ class BlockTestCase(TestCase):
                                       shape='ambivalent', CAM_id=self.cam.id)
         response = self.client.post('/block/delete_block', {'delete_valid': True, 'block_id': block_.num})
         self.assertTrue(response.status_code, 200)
-        logEntry = self.cam.logcamactions_set.latest('actionId').objDetails
-        logEntry = yaml.load(logEntry)
-        self.assertTrue(logEntry['title'], 'Meow3')
+        self.assertFalse(Block.objects.filter(id=block_.id).exists())
+        logEntry = self.cam.logcamactions_set.latest('actionId')
+        self.assertEqual(logEntry.actionType, logCamActions.DELETE)
+        self.assertEqual(logEntry.objDetails[-1]['before']['title'], 'Meow3')
 
     def test_drag_block(self):
         """
@@ -85,6 +116,51 @@ class BlockTestCase(TestCase):
         self.assertDictEqual(update_true, update_actual)
         block_.delete()
 
+    def test_drag_block_links(self):
+        """
+        Test that dragging writes the position with one UPDATE and returns the geometry of the attached links
+        """
+        block_1 = Block.objects.create(title='Meow1', x_pos=1.0, y_pos=1.0, height=100, width=100, creator=self.user,
+                                       shape='neutral', CAM_id=self.cam.id, num=1)
+        block_2 = Block.objects.create(title='Meow2', x_pos=200.0, y_pos=200.0, height=100, width=100,
+                                       creator=self.user, shape='neutral', CAM_id=self.cam.id, num=2)
+        link_ = Link.objects.create(starting_block=block_1, ending_block=block_2, creator=self.user,
+                                    CAM_id=self.cam.id, line_style='Dashed')
+        data = {
+            'drag_valid': True, 'block_id': 2, 'x_pos': '50.0px', 'y_pos': '60.0px', 'width': '100px',
+            'height': '100px', 'text_scale': 18
+        }
+        self.client.post('/block/drag_function', dict(data, x_pos='40.0px'))
+        # The next moves of the block update the same action: session, user, block, UPDATE, CAM version bump, last
+        # action, its UPDATE and a single joined query for the links
+        with self.assertNumQueries(8):
+            response = self.client.post('/block/drag_function', data)
+        geometry = response.json()
+        self.assertEqual(geometry['id'], [link_.id])
+        self.assertEqual((geometry['end_x'], geometry['end_y'], geometry['style']), ([50.0], [60.0], ['Dashed']))
+        block_2.refresh_from_db()
+        self.assertEqual((block_2.x_pos, block_2.y_pos, block_2.text_scale), (50.0, 60.0, 18))
+        # Both moves are undone at once
+        self.assertEqual(logCamActions.objects.filter(camId=self.cam).count(), 1)
+        self.client.post('/users/undo_action')
+        block_2.refresh_from_db()
+        self.assertEqual((block_2.x_pos, block_2.y_pos, block_2.text_scale), (200.0, 200.0, 14))
+
+    def test_resize_blocks(self):
+        """
+        Test that the blocks of the CAM are made resizable with a single UPDATE
+        """
+        self.user.save()
+        for num in range(3):
+            Block.objects.create(title='Meow%i' % num, creator=self.user, shape='neutral', CAM=self.cam, num=num)
+        # Session, user, UPDATE and CAM version bump
+        with self.assertNumQueries(4):
+            response = self.client.post('/block/resize_block', {'update_valid': True, 'resize': 'True'})
+        self.assertEqual(response.json()['resized'], 3)
+        self.assertEqual(self.cam.block_set.filter(resizable=True).count(), 3)
+        response = self.client.post('/block/resize_block', {'update_valid': True, 'resize': 'True'})
+        self.assertEqual(response.json()['resized'], 0)
+
 
 def trans_shape_to_slide(slide_val):
     """
@@ -1,13 +1,20 @@
-from .forms import BlockForm
+from .models import Block
+from link.models import Link
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.http import JsonResponse
 from django.template.defaulttags import register
 from datetime import datetime
 from django.forms.models import model_to_dict
 from users.models import CAM,logCamActions
+from users.journal import record, record_move, operation, snapshot
 from django.contrib.auth import get_user_model
-import numpy as np
 User = get_user_model()
 
+# Columns needed to redraw a link on the canvas
+LINK_GEOMETRY_FIELDS = ('id', 'line_style', 'starting_block__x_pos', 'starting_block__y_pos', 'starting_block__num',
+                        'ending_block__x_pos', 'ending_block__y_pos', 'ending_block__num')
+
 
 @register.filter
 def get_range(value):
@@ -29,15 +36,15 @@ def add_block(request):
     """
     Functionality to add a block to the databaase. This functionality is called from templates/Concept/Initial_Concept_Placement.html
     or templates/Concept/Initial_Placement. The Jquery/Ajax call passes all block information to django. The information is
-    augmented to include any other relavent features (i.e. creator id). The block is then created in the database
-    via the BlockForm form defined in block/forms.py. The complete block data is then passed back to the drawing canvas.
+    augmented to include any other relavent features (i.e. creator id). The block is then inserted in the database with
+    a single INSERT: a block whose number is already used in the CAM (e.g. a repeated request) is rejected by the
+    unique (CAM, num) constraint rather than looked up beforehand. The complete block data is then passed back to the
+    drawing canvas.
     """
     block_data = {}
     if request.method == 'POST':
         add_valid = request.POST.get('add_valid')
-        cam = CAM.objects.get(id=request.user.active_cam_num)
-        blocks_existing = cam.block_set.all().values_list('num', flat=True)
-        if add_valid and request.POST.get('num_block') not in blocks_existing:
+        if add_valid:
             # If we are only adding a new element
             # Getting basic block information
             block_data['title'] = request.POST.get('title')
@@ -53,14 +60,27 @@ def add_block(request):
                 block_data['creator'] = request.user.id
             else:
                 block_data['creator'] = 1
-            form_block = BlockForm(block_data)  # Getting our block form
-            block = form_block.save()  # Saving the form and getting the block
+            try:
+                block = Block(title=block_data['title'] or '', shape=block_data['shape'], num=float(block_data['num']),
+                              x_pos=float(block_data['x_pos']), y_pos=float(block_data['y_pos']),
+                              width=float(block_data['width']), height=float(block_data['height']),
+                              comment=block_data['comment'], CAM_id=block_data['CAM'],
+                              creator_id=block_data['creator'])
+            except (TypeError, ValueError):
+                return JsonResponse({'error_message': 'Invalid block information'}, status=400)
+            try:
+                with transaction.atomic():  # The block is only kept together with its journal entry
+                    block.save()
+                    record(block.CAM_id, logCamActions.ADD, logCamActions.BLOCK,
+                           [operation(block, after=snapshot(block))])
+            except IntegrityError:
+                if Block.objects.filter(CAM_id=block.CAM_id, num=block.num).exists():
+                    return JsonResponse({'error_message': 'Block %s already exists' % block_data['num']}, status=409)
+                return JsonResponse({'error_message': 'The block could not be added to this CAM'}, status=400)
             block_data['id'] = block.id  # Additional information about block
             if block_data['shape'] == 'circle':
                 block_data['shape'] = 'rounded-circle'
-            block_data['links'] = []  # Need associated links for JQuery purposes
-            if cam.link_set.filter(starting_block=block.id)|cam.link_set.filter(ending_block=block.id):
-                block_data['links'] = block.links
+            block_data['links'] = []  # Need associated links for JQuery purposes (a new block has none)
     return JsonResponse(block_data)
 
 
@@ -94,34 +114,31 @@ def update_block(request):
             block_data['y_pos'] = float(request.POST.get('y_pos')[:-2])
             block_data['width'] = float(request.POST.get('width')[:-2])  # Ignore the px at the end
             block_data['height'] = float(request.POST.get('height')[:-2])
+            before = snapshot(block, block_data)
             block.update(block_data)
+            record(cam.id, logCamActions.UPDATE, logCamActions.BLOCK,
+                   [operation(block, before, snapshot(block, block_data))])
             return JsonResponse(block_data)
 
 
 def resize_block(request):
     """
-    Function to turn on or off the resizable boolean for blocks
+    Function to turn on or off the resizable boolean for blocks. All the blocks of the CAM are switched with a single
+    UPDATE, and the number of blocks changed is passed back.
     """
+    message = 'Failed to change block resizeable'
+    resized = 0
     if request.method == 'POST':
         update_valid = request.POST.get('update_valid')
-        cam = CAM.objects.get(id=request.user.active_cam_num)
-        #blocks_existing = cam.block_set.all().values_list('num', flat=True)
-        resize_bool = request.POST.get('resize')
-        print(resize_bool)
+        resize_bool = request.POST.get('resize') == 'True'
         if update_valid:
-            for block in cam.block_set.all():
-                if resize_bool == 'True':
-                    block.resizable = True
-                else:
-                    block.resizable = False
-                block.save()
-            for block in cam.block_set.all():
-                print(block.resizable)
+            cam_id = request.user.active_cam_num
+            resized = Block.objects.filter(CAM_id=cam_id).exclude(resizable=resize_bool).update(resizable=resize_bool)
+            if resized:
+                CAM.bump_version(cam_id)
             message = 'Blocks resized'
-        else:
-            message = 'Failed to change block resizeable'
-        print(message)
-    return JsonResponse({'resize_message': message})
+    return JsonResponse({'resize_message': message, 'resized': resized})
+
 
 def delete_block(request):
     """
@@ -139,37 +156,13 @@ def delete_block(request):
             block_id = request.POST.get('block_id')
             block = cam.block_set.get(num=block_id)
             # Delete related links
-            links = cam.link_set.filter(starting_block=block.id)|cam.link_set.filter(ending_block=block.id)
+            links = list(cam.link_set.filter(starting_block=block.id)|cam.link_set.filter(ending_block=block.id))
             links_ = [model_to_dict(link) for link in links]
 
-            try:
-                actionId = cam.logcamactions_set.latest('actionId').actionId + 1
-            except:
-                actionId = 0
-
-            # Log block deletion in the logAction database
-            try:
-                logCamActions(camId=cam,
-                                actionId=actionId,
-                                actionType =0, # 0 = deleting
-                                objType = 1, # 1 = block
-                                objDetails = model_to_dict(block)
-                          ).save()
-                # Log link deletion in the logAction database
-                for link in links:
-                    logCamActions(camId=cam,
-                                    actionId=actionId,
-                                    actionType =0, # 0 = deleting
-                                    objType = 0, # 0 = link
-                                    objDetails = model_to_dict(link)
-                              ).save()
-
-                listActionIdDistinct = cam.logcamactions_set.order_by().values_list('actionId', flat=True).distinct()
-                if listActionIdDistinct.count() >9:
-                    minActionId = np.amin(listActionIdDistinct)
-                    logCamActions.objects.filter(actionId=minActionId).delete()
-            except:
-                pass
+            # Journal the deletion of the block and of its links so that it can be undone
+            operations = [operation(link, before=snapshot(link)) for link in links]
+            operations.append(operation(block, before=snapshot(block)))
+            record(cam.id, logCamActions.DELETE, logCamActions.BLOCK, operations)
             block.delete()
 
     return JsonResponse({'links': links_})
@@ -178,42 +171,54 @@ def delete_block(request):
 def drag_function(request):
     """
     Functionality to update a block's position after it is dragged on the canvas. This call is invoked via a Jquery/Ajax
-    call defined in templates/Concepts/drag_function.html. The function takes the new positions of the block and updates the current blocks
-    position. Then each link associated with the block is collected and their information is passed back to the drawing
-    canvas in order to be updated via a Jquery call.
+    call defined in templates/Concepts/drag_function.html. Only the position columns of the block are written (a single
+    UPDATE). Then each link associated with the block is collected, together with both of its blocks in the same query,
+    and their information is passed back to the drawing canvas in order to be updated via a Jquery call.
     """
     if request.method == 'POST':
         drag_valid = request.POST.get('drag_valid')
         if drag_valid:
-            cam = CAM.objects.get(id=request.user.active_cam_num)
+            cam_id = request.user.active_cam_num
+            block_id = request.POST.get('block_id')  # Grab block ID
+            position = {
+                'x_pos': float(request.POST.get('x_pos')[:-2]),  # get rid of px at the end
+                'y_pos': float(request.POST.get('y_pos')[:-2]),  # Ditto
+                'width': float(request.POST.get('width')[:-2]),
+                'height': float(request.POST.get('height')[:-2]),
+            }
+            try:
+                position['text_scale'] = float(request.POST.get('text_scale'))
+            except (TypeError, ValueError):
+                pass  # Keep the current text scale
+            block = Block.objects.filter(CAM_id=cam_id, num=block_id).only('id', *position).first()
+            if block is None:
+                return JsonResponse({'error_message': "This block doesn't exist!"}, status=404)
+            before = snapshot(block, position)
+            Block.objects.filter(id=block.id).update(**position)  # Update position
+            CAM.bump_version(cam_id)
+            record_move(cam_id, operation(block, before, position))  # Coalesced with the previous move
+            # Link will be automatically updated, but we need to get the information to pass to JQuery!
+            links = Link.objects.filter(CAM_id=cam_id).filter(
+                Q(starting_block__num=block_id) | Q(ending_block__num=block_id)
+            ).select_related('starting_block', 'ending_block').only(*LINK_GEOMETRY_FIELDS)
+            return JsonResponse(link_geometry(
+                (link.id, link.line_style, link.starting_block, link.ending_block) for link in links
+            ))
 
-            # Just need this information for later
-            ids = []; starting_x_ = []; ending_x_ = []; starting_y_ = []; ending_y_ = []
-            style_ = []; width_ = []; starting_block_ = []; ending_block_ = []
-            # Grab block ID
-            block_id = request.POST.get('block_id')
-            if cam.block_set.get(num=block_id):  # Make sure block exists (it really should)
-                block = cam.block_set.get(num=block_id)
-                try:
-                    text_scale = float(request.POST.get('text_scale'))
-                except:
-                    text_scale = block.text_scale
-                block.x_pos = float(request.POST.get('x_pos')[:-2])  # get rid of px at the end
-                block.y_pos = float(request.POST.get('y_pos')[:-2])  # Ditto
-                block.width = float(request.POST.get('width')[:-2])  # get rid of px at the end
-                block.height = float(request.POST.get('height')[:-2])  # Ditto
-                block.text_scale = text_scale
-                block.save()  # Update position
-                # Link will be automatically updated, but we need to get the information to pass to JQuery!
-                links = cam.link_set.filter(starting_block=block.id)|cam.link_set.filter(ending_block=block.id)
-                for link in links:
-                    # Get all that good info
-                    ids.append(link.id); starting_x_.append(link.starting_block.x_pos); starting_y_.append(link.starting_block.y_pos)
-                    ending_x_.append(link.ending_block.x_pos); ending_y_.append(link.ending_block.y_pos); style_.append(link.line_style)
-                    starting_block_.append(link.starting_block.num); ending_block_.append(link.ending_block.num)
-            return JsonResponse({'id':ids,'start_x':starting_x_,'start_y':starting_y_,'end_x':ending_x_,
-                                 'end_y':ending_y_,'style':style_,'width':width_,'starting_block':starting_block_,
-                                 'ending_block':ending_block_})
+
+def link_geometry(links):
+    """
+    Collect the information the canvas needs to redraw a set of links. Each link is given as a tuple
+    (id, line_style, starting_block, ending_block).
+    """
+    geometry = {'id': [], 'start_x': [], 'start_y': [], 'end_x': [], 'end_y': [], 'style': [], 'width': [],
+                'starting_block': [], 'ending_block': []}
+    for link_id, line_style, starting_block, ending_block in links:
+        geometry['id'].append(link_id); geometry['style'].append(line_style)
+        geometry['start_x'].append(starting_block.x_pos); geometry['start_y'].append(starting_block.y_pos)
+        geometry['end_x'].append(ending_block.x_pos); geometry['end_y'].append(ending_block.y_pos)
+        geometry['starting_block'].append(starting_block.num); geometry['ending_block'].append(ending_block.num)
+    return geometry
 
 
 def update_text_size(request):
@@ -137,6 +137,24 @@ EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 EMAIL_PORT = os.getenv("EMAIL_PORT")
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Snapshots of the CAMs' blocks and links are cached per process, keyed by CAM id and version (see users/cam_snapshot.py)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "valence",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    }
+}
+CAM_SNAPSHOT_CACHE_TIMEOUT = 3600
+
+# Canvas edits are sent in batches: successive moves of the same concept within this window (milliseconds) are
+# merged into a single write
+DRAG_COALESCE_WINDOW = 200
+
+# Long-running project operations are queued and run by `python manage.py run_jobs` when this is set. Without a worker
+# they are run inside the request
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED") is not None
+
 LOGIN_URL = "dashboard"
 LOGIN_REDIRECT_URL = "dashboard"
 LOGOUT_REDIRECT_URL = "loginpage"
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('link', '0015_auto_20200610_2016'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['CAM', 'starting_block'], name='link_cam_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['CAM', 'ending_block'], name='link_cam_end_idx'),
+        ),
+    ]
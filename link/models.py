@@ -1,6 +1,6 @@
 from django.db import models
 from block.models import Block
-from users.models import CustomUser, CAM
+from users.models import CustomUser, CAM, CAMStats, count_changes
 # Create your models here.
 
 
@@ -17,9 +17,44 @@ class Link(models.Model):
     timestamp = models.TimeField(auto_now=False, auto_now_add=False, null=True, blank=True)
     CAM = models.ForeignKey(CAM, on_delete=models.CASCADE, default='')
 
+    class Meta:
+        # Links of a block within a CAM (see block.views.delete_block)
+        indexes = [models.Index(fields=['CAM', 'starting_block'], name='link_cam_start_idx'),
+                   models.Index(fields=['CAM', 'ending_block'], name='link_cam_end_idx')]
+
     def __str__(self):
         return str(self.num)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_line_style = instance.__dict__.get('line_style')  # See save (None when the field was deferred)
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        changes = None  # Change of the counts of the CAM (see CAMStats)
+        if self._state.adding:
+            changes = count_changes(added=[self.line_style])
+        elif update_fields is None or 'line_style' in update_fields:
+            saved = getattr(self, '_saved_line_style', None)
+            if saved is None:
+                saved = Link.objects.filter(pk=self.pk).values_list('line_style', flat=True).first()
+            if saved != self.line_style:
+                changes = count_changes([saved] if saved is not None else [], [self.line_style])
+        super().save(*args, **kwargs)
+        self._saved_line_style = self.line_style
+        CAM.bump_version(self.CAM_id)
+        if changes:
+            CAMStats.add(self.CAM_id, line_styles=changes)
+
+    def delete(self, *args, **kwargs):
+        cam_id = self.CAM_id
+        deleted = super().delete(*args, **kwargs)
+        CAM.bump_version(cam_id)
+        CAMStats.add(cam_id, line_styles=count_changes(removed=[self.line_style]))
+        return deleted
+
     def update(self, form_info):
         if self._state.adding:
             # If instance doesn't exist!
@@ -2,7 +2,8 @@ from django.http import JsonResponse
 from link.models import Link
 from link.forms import LinkForm
 from datetime import datetime
-from users.models import CAM
+from users.models import CAM, logCamActions
+from users.journal import record, operation, snapshot
 
 
 def add_link(request):
@@ -39,6 +40,7 @@ def add_link(request):
                 link_data['id'] = link.id
                 link.timestamp = datetime.now()
                 link.save()
+                record(cam.id, logCamActions.ADD, logCamActions.LINK, [operation(link, after=snapshot(link))])
                 # Must change the starting and end block information to be passed to JQUERY
                 link_data['starting_block'] = start_block.num
                 link_data['ending_block'] = end_block.num
@@ -51,9 +53,12 @@ def update_link(request):
         link = Link.objects.get(id=request.POST.get("link_id"))  # Get link
         link_data['line_style'] = request.POST.get("line_style")  # Get updated link information
         link_data['arrow_type'] = request.POST.get('arrow_type')
+        before = snapshot(link, ['line_style', 'arrow_type', 'timestamp'])
         link.update(link_data)
         link.timestamp = datetime.now()
         link.save()
+        record(link.CAM_id, logCamActions.UPDATE, logCamActions.LINK,
+               [operation(link, before, snapshot(link, ['line_style', 'arrow_type', 'timestamp']))])
         # Get all info to pass
         link_data['start_x'] = link.starting_block.x_pos; link_data['start_y'] = link.starting_block.y_pos
         link_data['end_x'] = link.ending_block.x_pos; link_data['end_y'] = link.ending_block.y_pos
@@ -91,12 +96,15 @@ def swap_link_direction(request):
     link_data = {}
     if request.method == 'POST':
         link = Link.objects.get(id=request.POST.get("link_id"))  # Get link
+        before = snapshot(link, ['starting_block_id', 'ending_block_id', 'timestamp'])
         # Swap the start end end
         new_start_x = link.ending_block.x_pos; new_start_y = link.ending_block.y_pos; new_start_block = link.ending_block
         link.end_x = link.starting_block.x_pos; link.end_y = link.starting_block.y_pos; link.ending_block = link.starting_block
         link.start_x = new_start_x; link.start_y = new_start_y; link.starting_block = new_start_block
         link.timestamp = datetime.now()  # Add some time information
         link.save()
+        record(link.CAM_id, logCamActions.UPDATE, logCamActions.LINK,
+               [operation(link, before, snapshot(link, ['starting_block_id', 'ending_block_id', 'timestamp']))])
         # Get all info to pass
         link_data['start_x'] = link.starting_block.x_pos; link_data['start_y'] = link.starting_block.y_pos
         link_data['end_x'] = link.ending_block.x_pos; link_data['end_y'] = link.ending_block.y_pos; link_data['id'] = link.id
@@ -109,5 +117,6 @@ def delete_link(request):
         link_delete_valid = request.POST.get('link_delete_valid')
         if link_delete_valid:
             link = Link.objects.get(id=request.POST.get('link_id'))
+            record(link.CAM_id, logCamActions.DELETE, logCamActions.LINK, [operation(link, before=snapshot(link))])
             link.delete()
     return JsonResponse({})
\ No newline at end of file
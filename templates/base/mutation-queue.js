@@ -0,0 +1,78 @@
+// Batched canvas mutations. Edits are queued and sent to the server together in one asynchronous request instead of
+// one synchronous request per event. Each queued operation can carry a callback which receives that operation's result.
+// Successive moves of the same concept within the window are merged so that only the last position is written.
+// Pending edits are always sent before any other request writing to the CAM (delete, undo, redo, ...), so that the
+// server sees the edits in the order they were made.
+var mutation_queue = [];
+var mutation_callbacks = [];
+var mutation_timer = null;
+var mutation_flush_delay = {{ drag_coalesce_window|default:200 }};  // Milliseconds to wait for further edits
+
+function queue_mutation(operation, callback){
+    const last = mutation_queue.length - 1;
+    if (operation.op === 'move_block' && last >= 0 && mutation_queue[last].op === 'move_block' &&
+        mutation_queue[last].num === operation.num){
+        // Replace the pending move rather than queueing a second write
+        mutation_queue[last] = operation;
+        mutation_callbacks[last] = callback;
+        return
+    }
+    mutation_queue.push(operation);
+    mutation_callbacks.push(callback);
+    if (mutation_timer === null){
+        mutation_timer = window.setTimeout(flush_mutations, mutation_flush_delay);
+    }
+}
+
+function flush_mutations(synchronous){
+    window.clearTimeout(mutation_timer);
+    mutation_timer = null;
+    if (mutation_queue.length === 0){
+        return
+    }
+    const operations = mutation_queue;
+    const callbacks = mutation_callbacks;
+    mutation_queue = [];
+    mutation_callbacks = [];
+    $.ajax({
+        url: "{% url 'cam_mutations' user.active_cam_num %}",
+        type: "POST",
+        async: !synchronous,
+        mutation_queue: true,  // Not flushed again by the prefilter below
+        contentType: "application/json",
+        headers: {'X-CSRFToken': '{{ csrf_token }}'},
+        data: JSON.stringify({'operations': operations}),
+        success: function(data){
+            for (let i=0; i<callbacks.length; i++){
+                if (callbacks[i]){
+                    callbacks[i](data.results[i]);
+                }
+            }
+        },
+        error: function(){
+            console.log("Error")
+        }
+    }); //end ajax
+}
+
+// Send the pending edits before any other write. They are sent synchronously, so they are applied before the request
+// being issued even when that request is synchronous itself.
+$.ajaxPrefilter(function(options){
+    if (!options.mutation_queue && options.type.toUpperCase() !== 'GET' && mutation_queue.length > 0){
+        flush_mutations(true);
+    }
+})
+
+// Make sure nothing is lost when the page is closed
+$(window).on("beforeunload", function(){
+    if (mutation_queue.length > 0){
+        fetch("{% url 'cam_mutations' user.active_cam_num %}", {
+            method: "POST",
+            keepalive: true,
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': '{{ csrf_token }}'},
+            body: JSON.stringify({'operations': mutation_queue}),
+        });
+        mutation_queue = [];
+        mutation_callbacks = [];
+    }
+})
@@ -14,4 +14,21 @@ $(document).on("mousedown", "#UndoAction",function(event) {
             console.log("Error")
         }
     })//end ajax
-})
\ No newline at end of file
+})
+$(document).on("mousedown", "#RedoAction",function(event) {
+    // Ajax call to redo
+    $.ajax({
+        async: false,
+        type: "POST",
+        url: "{% url 'redo_action' %}",
+        data: {
+            'csrfmiddlewaretoken': '{{ csrf_token }}',
+        },
+        success: function (data) {
+            location.reload()  // Reload page
+        },
+        error: function () {
+            console.log("Error")
+        }
+    })//end ajax
+})
@@ -1,52 +1,109 @@
 """
-Code to take black and line csv information and create an image
+Code to take block and link information and create an image
+
+The blocks and links of a CAM are read in two queries into numpy arrays (links refer to their blocks by index), and the
+image is drawn directly at the requested resolution with antialiasing (see Shapes.py and Lines.py).
 """
 
 import cv2 as cv
 import numpy as np
-import pandas as pd
-from users.Plots.Shapes import shapes
+from block.models import Block
+from link.models import Link
+from users.Plots.Shapes import shapes, HEIGHT_SCALE
 from users.Plots.Lines import lines
-from users.models import CustomUser
-
-def data_to_plot(username,file_name):
-    scale = 5
-    # Read in data to pandas
-    #blocks = pd.read_csv('/home/carterrhea/Documents/CAM-proj/'+id+'_blocks.csv')
-    #links = pd.read_csv('/home/carterrhea/Documents/CAM-proj/'+id+'_links.csv')
-    blocks = pd.DataFrame.from_records(
-        CustomUser.objects.get(username=username).block_set.all().values_list('id', 'x_pos', 'y_pos', 'height', 'width', 'shape', 'title'),
-        columns=['id', 'x_pos', 'y_pos', 'height', 'width', 'shape', 'title']
-    )
-    links = pd.DataFrame.from_records(
-        CustomUser.objects.get(username=username).link_set.all().values_list('starting_block', 'ending_block', 'line_style', 'arrow_type'),
-        columns=['starting_block', 'ending_block', 'line_style', 'arrow_type']
-    )
-    # Create Background
-    x_size = int(blocks['y_pos'].max())
-    y_size = int(blocks['x_pos'].max())
-    image = np.zeros((int(1.3*scale*x_size), int(1.3*scale*y_size), 3), np.uint8)
-    image.fill(255)  # Make white background
-    # Step through each line
-    for index, row in links.iterrows():
-        starting_block = blocks[blocks['id'] == row['ending_block']]
-        ending_block = blocks[blocks['id'] == row['starting_block']]
-        image = lines(image, starting_block, ending_block, row['line_style'], row['arrow_type'], scale)
-    # Step through each block
-    for index, row in blocks.iterrows():
-        image = shapes(image, row['shape'], row['x_pos'], row['y_pos'], row['width'], row['height'], row['title'], scale)
-
-
-    # resize image
-    #percent by which the image is resized
-    scale_percent = int((1/(scale))*100)
-    #calculate the 50 percent of original dimensions
-    width = int(image.shape[1] * scale_percent / 100)
-    height = int(image.shape[0] * scale_percent / 100)
-
-    # dsize
-    dsize = (width, height)
-
-    image = cv.resize(image, dsize)
-
-    cv.imwrite(file_name, image)
\ No newline at end of file
+
+MARGIN = 20  # Space around the concepts, in canvas units
+BLOCK_COLUMNS = ('id', 'x_pos', 'y_pos', 'width', 'height', 'shape', 'title', 'text_scale')
+LINK_COLUMNS = ('starting_block_id', 'ending_block_id', 'line_style', 'arrow_type')
+
+
+class CAMData:
+    """
+    Blocks and links of a CAM as arrays.
+
+    Parameters
+    ----------
+    blocks : list of tuple
+        (id, x_pos, y_pos, width, height, shape, title, text_scale) of each block.
+    links : list of tuple
+        (starting_block, ending_block, line_style, arrow_type) of each link, with the blocks given by id.
+    """
+
+    def __init__(self, blocks, links):
+        blocks = sorted(blocks)
+        self.ids = np.array([block[0] for block in blocks], dtype=np.int64)
+        self.corners = np.array([block[1:3] for block in blocks], float).reshape(-1, 2)
+        self.sizes = np.array([block[3:5] for block in blocks], float).reshape(-1, 2)
+        self.shapes = [block[5] for block in blocks]
+        self.titles = [block[6] or '' for block in blocks]
+        self.text_scales = np.array([block[7] or 14 for block in blocks], float)
+        # Keep the links whose blocks both exist and replace the block ids by their index
+        known = set(self.ids.tolist())
+        links = [link for link in links if link[0] in known and link[1] in known]
+        self.starts = np.searchsorted(self.ids, np.array([link[0] for link in links], dtype=np.int64))
+        self.ends = np.searchsorted(self.ids, np.array([link[1] for link in links], dtype=np.int64))
+        self.line_styles = [link[2] for link in links]
+        self.arrow_types = [link[3] for link in links]
+
+    @classmethod
+    def from_cam(cls, cam_id):
+        """
+        Read the blocks and links of a CAM from the database
+        """
+        blocks = Block.objects.filter(CAM_id=cam_id).values_list(*BLOCK_COLUMNS)
+        links = Link.objects.filter(CAM_id=cam_id).values_list(*LINK_COLUMNS)
+        return cls(list(blocks), list(links))
+
+
+def bounds(data):
+    """
+    Top left corner and size of the area covered by the concepts of a CAM and a margin, in canvas units
+    """
+    if len(data.ids):
+        origin = data.corners.min(axis=0) - MARGIN
+        extent = (data.corners + data.sizes).max(axis=0) + MARGIN - origin
+    else:
+        origin = np.zeros(2)
+        extent = np.full(2, 2.0 * MARGIN)
+    return origin, extent
+
+
+def render(data, scale=1.0, max_size=None):
+    """
+    Draw a CAM.
+
+    Parameters
+    ----------
+    data : CAMData
+        The blocks and links of the CAM.
+    scale : float
+        Pixels per canvas unit.
+    max_size : int, optional
+        Largest width or height of the image; the scale is reduced to fit (for thumbnails).
+
+    Returns
+    -------
+    numpy.ndarray
+        The image (BGR).
+    """
+    origin, extent = bounds(data)
+    if max_size:
+        scale = min(scale, max_size / extent.max())
+    width, height = np.maximum(np.ceil(extent * scale).astype(int), 1)
+    image = np.full((height, width, 3), 255, np.uint8)  # White background
+    corners = (data.corners - origin) * scale
+    sizes = data.sizes * scale
+    centers = corners + sizes * np.array([0.5, 0.5 * HEIGHT_SCALE])
+    half_sizes = sizes * np.array([0.5, 0.5 * HEIGHT_SCALE])
+    image = lines(image, centers[data.starts], centers[data.ends], half_sizes[data.starts], half_sizes[data.ends],
+                  data.line_styles, data.arrow_types, scale)
+    return shapes(image, corners, sizes, data.shapes, data.titles, data.text_scales, scale)
+
+
+def data_to_plot(cam_id, file_name, scale=1.0, max_size=None):
+    """
+    Render a CAM and save it as an image file
+    """
+    image = render(CAMData.from_cam(cam_id), scale, max_size)
+    cv.imwrite(file_name, image)
+    return file_name
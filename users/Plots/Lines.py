@@ -1,150 +1,110 @@
+"""
+Draw the links of a CAM. The geometry of every link (end points on the block boundaries, dashes and arrow heads) is
+computed for all links at once with numpy, and the links are then drawn with one antialiased cv2 call per line width.
+"""
 import cv2 as cv
 import numpy as np
-import operator
 
+COLOR = (119, 119, 119)
+DASH = 8  # Length of a dash and of the gap after it
+GAP = 6
+ARROW_LENGTH = 4  # Size of the arrow heads, in multiples of the line thickness
+ARROW_WIDTH = 2
+SHIFT = 4  # Fractional bits of the coordinates passed to cv2
+PRECISION = 2 ** SHIFT
 
-def lines(image, starting_block, ending_block, line_style, arrow_type, scale):
-    x_start = float(starting_block['x_pos'])
-    x_end = float(ending_block['x_pos'])
-    y_start = float(starting_block['y_pos'])
-    y_end = float(ending_block['y_pos'])
-    starting_point = (int(scale*(starting_block['x_pos']+starting_block['width']/2)), int(scale*(starting_block['y_pos']+starting_block['height']/2)))
-    ending_point = (int(scale*(ending_block['x_pos']+ending_block['width']/2)), int(scale*(ending_block['y_pos']+ending_block['height']/2)))
+
+def thickness(line_style):
     if 'Strong' in line_style:
-        thickness = scale*4
+        return 4
     elif 'Weak' in line_style:
-        thickness = scale*2
-    else:
-        thickness = scale*3
-    color = (119, 119, 119)
-    if 'Solid' in line_style:
-        if arrow_type == 'none':
-            image = cv.line(image, starting_point, ending_point, color, thickness)
-        else:
-            if x_end > x_start:
-                temp = x_start
-                x_start = x_end
-                x_end = temp
-                temp = y_start
-                y_start = y_end
-                y_end = temp
-                x_end = x_end + 0.5*float(ending_block['width'])
-                y_start = y_start + 0.5*float(ending_block['height'])
-                x_start = x_start + 0.5*float(ending_block['width'])
-                y_end = y_end + 0.5*float(ending_block['height'])
-                angle = np.arctan((y_end-y_start)/(x_end-x_start))
-                length = np.sqrt((x_start - x_end) * (x_start - x_end) + (y_start - y_end ) * (y_start - y_end ))
-                x_end_new = scale*(x_start-0.5*np.sqrt(ending_block['width']**2+ending_block['height']**2)*np.cos(angle)) - 0.5*length*(1-np.cos(angle))
-                y_end_new = scale*(y_start-0.5*np.sqrt(ending_block['width']**2+ending_block['height']**2)*np.sin(angle)) + 0.5*length*np.sin(angle)
-                new_end = (int(x_end_new), int(y_end_new))  # tuple(np.subtract(ending_point,(scale*100,scale*100)))
-                image = cv.arrowedLine(image, starting_point, new_end, color, thickness,line_type=8)
-            else:
-                temp = x_start
-                x_start = x_end
-                x_end = temp
-                temp = y_start
-                y_start = y_end
-                y_end = temp
-                x_end = x_end + 0.5*float(ending_block['width'])
-                y_start = y_start + 0.5*float(ending_block['height'])
-                x_start = x_start + 0.5*float(ending_block['width'])
-                y_end = y_end + 0.5*float(ending_block['height'])
-                angle = np.arctan((y_end-y_start)/(x_end-x_start))
-                length = np.sqrt((x_start - x_end) * (x_start - x_end) + (y_start - y_end ) * (y_start - y_end ))
-                x_end_new = scale*(x_start+0.42*np.sqrt(ending_block['width']**2+ending_block['height']**2)*np.cos(angle)) - 0.5*length*(1-np.cos(angle))
-                y_end_new = scale*(y_start+0.42*np.sqrt(ending_block['width']**2+ending_block['height']**2)*np.sin(angle)) + 0.5*length*np.sin(angle)
-                new_end = (int(x_end_new), int(y_end_new))  # tuple(np.subtract(ending_point,(scale*100,scale*100)))
-                image = cv.arrowedLine(image, starting_point, new_end, color, thickness, line_type=8)
-    else:  # Dashed
-        if arrow_type == 'none':
-            length = np.sqrt((x_start - x_end)**2 + (y_start - y_end )**2)
-            angle = np.arctan((y_end-y_start)/(x_end-x_start))
-            k = 1*scale
-            for it in range(int(length)):
-                if it%8 == 0:
-                    if x_end > x_start:
-                        starting_point_new = tuple(map(operator.add,starting_point,(it*k*np.cos(angle), it*k*np.sin(angle))))
-                        ending_point_new = tuple(map(operator.add,starting_point,((it+1)*k*np.cos(angle), (it+1)*k*np.sin(angle))))
-                        starting_point_new = tuple(int(i) for i in starting_point_new)
-                        ending_point_new = tuple(int(i) for i in ending_point_new)
-                        image = cv.line(image, starting_point_new, ending_point_new, color, thickness)
-                    else:
-                        starting_point_new = tuple(map(operator.add,ending_point,(it*k*np.cos(angle), it*k*np.sin(angle))))
-                        ending_point_new = tuple(map(operator.add,ending_point,((it+1)*k*np.cos(angle), (it+1)*k*np.sin(angle))))
-                        starting_point_new = tuple(int(i) for i in starting_point_new)
-                        ending_point_new = tuple(int(i) for i in ending_point_new)
-                        image = cv.line(image, starting_point_new, ending_point_new, color, thickness)
-        else:  # Arrow
-            temp = x_start
-            x_start = x_end
-            x_end = temp
-            temp = y_start
-            y_start = y_end
-            y_end = temp
-            x_end = x_end - 0.5*scale*float(ending_block['width'])
-            y_start = y_start - 0.5*scale*float(ending_block['height'])
-            x_start = x_start - 0.5*scale*float(ending_block['width'])
-            y_end = y_end - 0.5*scale*float(ending_block['height'])
-            length = np.sqrt((x_start - x_end)**2 + (y_start - y_end )**2)
-            angle = np.arctan((y_end-y_start)/(x_end-x_start))
-            k = 1*scale
-            starting_point_new = None   # init
-            ending_point_new = None   # init
-            for it in range(int(length/2)):
-                if it%8 == 0:
-                    if x_end > x_start and y_start > y_end:
-                        starting_point_new = tuple(map(operator.add,starting_point,(it*k*np.cos(angle)-scale*np.cos(angle)*float(ending_block['width']), it*k*np.sin(angle)-np.sin(angle)*1.5*scale*float(ending_block['height']))))
-                        ending_point_new = tuple(map(operator.add,starting_point,((it+1)*k*np.cos(angle)-scale*np.cos(angle)*float(ending_block['width']), (it+1)*k*np.sin(angle)-np.sin(angle)*1.5*scale*float(ending_block['height']))))
-                        starting_point_new = tuple(int(i) for i in starting_point_new)
-                        ending_point_new = tuple(int(i) for i in ending_point_new)
-                        image = cv.line(image, starting_point_new, ending_point_new, color, thickness)
-                    elif x_end > x_start and y_start < y_end:
-                        ending_point_new = tuple(map(operator.add,starting_point,(it*k*np.cos(angle)-scale*np.cos(angle)*float(ending_block['width']), it*k*np.sin(angle)-np.sin(angle)*scale*0.5*float(ending_block['height']))))
-                        starting_point_new = tuple(map(operator.add,starting_point,((it+1)*k*np.cos(angle)-scale*np.cos(angle)*float(ending_block['width']), (it+1)*k*np.sin(angle)-np.sin(angle)*scale*0.5*float(ending_block['height']))))
-                        starting_point_new = tuple(int(i) for i in starting_point_new)
-                        ending_point_new = tuple(int(i) for i in ending_point_new)
-                        image = cv.line(image, starting_point_new, ending_point_new, color, thickness)
-                    elif x_end < x_start and y_start > y_end:
-                        starting_point_new = tuple(map(operator.add,starting_point,(it*k*np.cos(angle)+scale*np.cos(angle)*0.5*float(ending_block['width']), it*k*np.sin(angle)+np.sin(angle)*scale*0.5*float(ending_block['height']))))
-                        ending_point_new = tuple(map(operator.add,starting_point,((it+1)*k*np.cos(angle)+scale*np.cos(angle)*0.5*float(ending_block['width']), (it+1)*k*np.sin(angle)+np.sin(angle)*scale*0.5*float(ending_block['height']))))
-                        starting_point_new = tuple(int(i) for i in starting_point_new)
-                        ending_point_new = tuple(int(i) for i in ending_point_new)
-                        image = cv.line(image, starting_point_new, ending_point_new, color, thickness)
-                    elif x_end < x_start and y_start < y_end:
-                        starting_point_new = tuple(map(operator.add,starting_point,(it*k*np.cos(angle)+0.5*np.cos(angle)*scale*float(ending_block['width']), it*k*np.sin(angle)+np.sin(angle)*0.5*scale*float(ending_block['height']))))
-                        ending_point_new = tuple(map(operator.add,starting_point,((it+1)*k*np.cos(angle)+0.5*np.cos(angle)*scale*float(ending_block['width']), (it+1)*k*np.sin(angle)+np.sin(angle)*0.5*scale*float(ending_block['height']))))
-                        starting_point_new = tuple(int(i) for i in starting_point_new)
-                        ending_point_new = tuple(int(i) for i in ending_point_new)
-                        image = cv.line(image, starting_point_new, ending_point_new, color, thickness)
-            # Add final arrow
-            if x_end > x_start and y_start > y_end:
-                # Need for dash!
-                it = 0
-                starting_point_new = tuple(map(operator.add,starting_point,(it*k*np.cos(angle)-scale*np.cos(angle)*float(ending_block['width']), it*k*np.sin(angle)-np.sin(angle)*1.5*scale*float(ending_block['height']))))
-                ending_point_new = tuple(map(operator.add,starting_point,((it+1)*k*np.cos(angle)-scale*np.cos(angle)*float(ending_block['width']), (it+1)*k*np.sin(angle)-np.sin(angle)*1.5*scale*float(ending_block['height']))))
-                starting_point_new = tuple(int(i) for i in starting_point_new)
-                ending_point_new = tuple(int(i) for i in ending_point_new)
-                image = cv.arrowedLine(image, ending_point_new, starting_point_new, color, thickness, tipLength=thickness)
-            elif x_end > x_start and y_start < y_end:
-                # Need for dash!
-                it = 0
-                ending_point_new = tuple(map(operator.add,starting_point,(it*k*np.cos(angle)-scale*np.cos(angle)*float(ending_block['width']), it*k*np.sin(angle)-np.sin(angle)*0.5*scale*float(ending_block['height']))))
-                starting_point_new = tuple(map(operator.add,starting_point,((it+1)*k*np.cos(angle)-scale*np.cos(angle)*float(ending_block['width']), (it+1)*k*np.sin(angle)-np.sin(angle)*0.5*scale*float(ending_block['height']))))
-                starting_point_new = tuple(int(i) for i in starting_point_new)
-                ending_point_new = tuple(int(i) for i in ending_point_new)
-                image = cv.arrowedLine(image, starting_point_new, ending_point_new, color, thickness, tipLength=thickness)
-            elif x_end < x_start and y_start > y_end:
-                it = length/2
-                starting_point_new = tuple(map(operator.add,starting_point,(it*k*np.cos(angle)+scale*np.cos(angle)*0.5*float(ending_block['width']), it*k*np.sin(angle)+np.sin(angle)*scale*0.5*float(ending_block['height']))))
-                ending_point_new = tuple(map(operator.add,starting_point,((it+1)*k*np.cos(angle)+scale*np.cos(angle)*0.5*float(ending_block['width']), (it+1)*k*np.sin(angle)+np.sin(angle)*scale*0.5*float(ending_block['height']))))
-                starting_point_new = tuple(int(i) for i in starting_point_new)
-                ending_point_new = tuple(int(i) for i in ending_point_new)
-                image = cv.arrowedLine(image, starting_point_new, ending_point_new, color, thickness, tipLength=thickness)
-            elif x_end < x_start and y_start < y_end:
-                it = length/2
-                starting_point_new = tuple(map(operator.add,starting_point,(it*k*np.cos(angle)+0.5*np.cos(angle)*scale*float(ending_block['width']), it*k*np.sin(angle)+np.sin(angle)*0.5*scale*float(ending_block['height']))))
-                ending_point_new = tuple(map(operator.add,starting_point,((it+1)*k*np.cos(angle)+0.5*np.cos(angle)*scale*float(ending_block['width']), (it+1)*k*np.sin(angle)+np.sin(angle)*0.5*scale*float(ending_block['height']))))
-                starting_point_new = tuple(int(i) for i in starting_point_new)
-                ending_point_new = tuple(int(i) for i in ending_point_new)
-                image = cv.arrowedLine(image, starting_point_new, ending_point_new, color, thickness, tipLength=thickness)
+        return 2
+    return 3
+
+
+def fixed(points):
+    """
+    Convert float coordinates to the fixed point integers expected by cv2 (see SHIFT)
+    """
+    return np.round(points * PRECISION).astype(np.int32)
+
+
+def boundary_points(starts, ends, half_sizes):
+    """
+    Points where the segments from starts to ends enter the boxes centered on ends with the given half sizes
+    """
+    direction = ends - starts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.min(half_sizes / np.abs(direction), axis=1)
+    fraction = np.clip(np.nan_to_num(fraction, nan=0.0, posinf=0.0), 0.0, 0.5)
+    return ends - direction * fraction[:, None]
+
+
+def dash_segments(starts, ends, scale=1.0):
+    """
+    Split segments into dashes. Returns an (n, 2, 2) array of dash start and end points.
+    """
+    dash, period = DASH * scale, (DASH + GAP) * scale
+    direction = ends - starts
+    length = np.hypot(direction[:, 0], direction[:, 1])
+    unit = direction / np.maximum(length, 1e-9)[:, None]
+    counts = np.ceil(length / period).astype(int)
+    link = np.repeat(np.arange(len(starts)), counts)
+    offsets = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)) * period
+    dash_starts = starts[link] + unit[link] * offsets[:, None]
+    dash_ends = starts[link] + unit[link] * np.minimum(offsets + dash, length[link])[:, None]
+    return np.stack([dash_starts, dash_ends], axis=1)
+
+
+def arrow_heads(tips, tails, widths):
+    """
+    Triangles of arrow heads pointing at tips from the direction of tails. Returns an (n, 3, 2) array.
+    """
+    direction = tips - tails
+    unit = direction / np.maximum(np.hypot(direction[:, 0], direction[:, 1]), 1e-9)[:, None]
+    normal = np.stack([-unit[:, 1], unit[:, 0]], axis=1)
+    base = tips - unit * (ARROW_LENGTH * widths)[:, None]
+    return np.stack([tips, base + normal * (ARROW_WIDTH * widths)[:, None],
+                     base - normal * (ARROW_WIDTH * widths)[:, None]], axis=1)
+
+
+def lines(image, starts, ends, start_half_sizes, end_half_sizes, line_styles, arrow_types, scale=1.0):
+    """
+    Draw links between blocks.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        The image drawn on.
+    starts, ends : numpy.ndarray
+        (n, 2) arrays of the centers of the starting and ending blocks, in pixels.
+    start_half_sizes, end_half_sizes : numpy.ndarray
+        (n, 2) arrays of the half widths and heights of the starting and ending blocks, in pixels.
+    line_styles, arrow_types : list of str
+        Line style and arrow type of each link.
+    scale : float
+        Pixels per canvas unit, applied to line widths, dashes and arrows.
+    """
+    if len(starts) == 0:
+        return image
+    line_starts = boundary_points(ends, starts, start_half_sizes)
+    line_ends = boundary_points(starts, ends, end_half_sizes)
+    widths = np.array([thickness(style) for style in line_styles], float) * scale
+    dashed = np.array(['Dashed' in style for style in line_styles])
+    segments = np.stack([line_starts, line_ends], axis=1)
+    for width in np.unique(widths):
+        solid = (widths == width) & ~dashed
+        pieces = list(fixed(segments[solid]))
+        selected = (widths == width) & dashed
+        if selected.any():
+            pieces += list(fixed(dash_segments(line_starts[selected], line_ends[selected], scale)))
+        if pieces:
+            cv.polylines(image, pieces, False, COLOR, max(1, int(round(width))), cv.LINE_AA, SHIFT)
+    # Arrow heads at the ending block, and at the starting block for two-way links
+    arrows = np.array([arrow != 'none' for arrow in arrow_types])
+    both = np.array([arrow == 'bi' for arrow in arrow_types])
+    heads = np.concatenate([arrow_heads(line_ends[arrows], line_starts[arrows], widths[arrows]),
+                            arrow_heads(line_starts[both], line_ends[both], widths[both])])
+    if len(heads):
+        cv.fillPoly(image, list(fixed(heads)), COLOR, cv.LINE_AA, SHIFT)
     return image
@@ -1,101 +1,139 @@
+"""
+Draw the concepts of a CAM. Every shape (rectangle, hexagon, ellipse) is turned into a polygon with numpy for all
+blocks at once and the polygons of each color are filled and outlined with single antialiased cv2 calls.
+"""
 import cv2 as cv
-import math
 import numpy as np
+from users.Plots.Lines import fixed, SHIFT
 
-def shapes(image, shape_name, x_pos, y_pos, width, height, title, scale):
+# Fill and boundary colors (BGR) of each kind of concept
+COLORS = {
+    'negative': ((182, 186, 224), (66, 66, 184)),
+    'positive': ((214, 228, 216), (149, 188, 149)),
+    'neutral': ((192, 230, 242), (49, 180, 223)),
+    'ambivalent': ((210, 199, 207), (127, 90, 126)),
+}
+TEXT_COLOR = (0, 0, 0)
+FONT = cv.FONT_HERSHEY_SIMPLEX
+FONT_HEIGHT = 22  # Height in pixels of FONT at a font scale of 1
+ELLIPSE_POINTS = 48
+HEIGHT_SCALE = 0.6  # Drawn height of a concept relative to its height on the canvas
+
+
+def kind(shape_name):
+    for name in ('negative', 'positive', 'neutral'):
+        if name in shape_name:
+            return name
+    return 'ambivalent'
+
+
+def boundary_thickness(shape_name):
+    if 'strong' in shape_name:
+        return 4
+    elif 'weak' in shape_name:
+        return 1
+    return 2
+
+
+def rectangles(corners, sizes):
     """
-    Convert shape name from pandas file to shape to be used in cv2
+    (n, 4, 2) polygons of rectangles given their top left corners and sizes
     """
-    height = 0.6*height
-    start_point = (int(scale*x_pos), int(scale*(y_pos+height)))  # Top left
-    end_point = (int(scale*(x_pos+width)), int(scale*y_pos))  # Bottom right
-    if 'negative' in shape_name:
-        color = (182, 186, 224)
-        boundary_color = (66, 66, 184)
-        if 'strong' in shape_name:
-            thickness = scale*8
-        elif 'weak' in shape_name:
-            thickness = scale*1
-        else:
-            thickness = scale*4
-        # Hexagon points
-        p1 = [int(scale*(x_pos)), int(scale*(y_pos+height/2))]
-        p2 = [int(scale*(x_pos+width*0.8/3)), int(scale*(y_pos+height))]
-        p3 = [int(scale*(x_pos+width*2.2/3)), int(scale*(y_pos+height))]
-        p4 = [int(scale*(x_pos+width)), int(scale*(y_pos+height/2))]
-        p5 = [int(scale*(x_pos+width*2.2/3)), int(scale*(y_pos))]
-        p6 = [int(scale*(x_pos+width*0.8/3)), int(scale*(y_pos))]
-        Hex = np.array([[p1, p2, p3, p4, p5, p6]], np.int32)
-        Hex = Hex.reshape((-1, 1, 2))
-        image = cv.polylines(image, [Hex], True, boundary_color, thickness)  # Boundary
-        image = cv.fillPoly(image, [Hex], color)  # Main
-    elif 'positive' in shape_name:
-        color = (214, 228, 216)
-        boundary_color = (149, 188, 149)
-        if 'strong' in shape_name:
-            thickness = scale*8
-        elif 'weak' in shape_name:
-            thickness = scale*1
+    unit = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], float)
+    return corners[:, None, :] + unit[None, :, :] * sizes[:, None, :]
+
+
+def hexagons(corners, sizes):
+    """
+    (n, 6, 2) polygons of the hexagons inscribed in boxes given their top left corners and sizes
+    """
+    unit = np.array([[0, 0.5], [0.8 / 3, 1], [2.2 / 3, 1], [1, 0.5], [2.2 / 3, 0], [0.8 / 3, 0]])
+    return corners[:, None, :] + unit[None, :, :] * sizes[:, None, :]
+
+
+def ellipses(corners, sizes, ratio=1.0):
+    """
+    (n, ELLIPSE_POINTS, 2) polygons of the ellipses inscribed in boxes given their top left corners and sizes
+    """
+    angles = np.linspace(0, 2 * np.pi, ELLIPSE_POINTS, endpoint=False)
+    unit = np.stack([np.cos(angles), np.sin(angles)], axis=1) * 0.5 * ratio
+    return (corners + sizes / 2)[:, None, :] + unit[None, :, :] * sizes[:, None, :]
+
+
+def wrap(title, width, font_scale):
+    """
+    Split a title into lines no wider than width pixels
+    """
+    lines = []
+    for word in title.split():
+        if lines and cv.getTextSize(lines[-1] + ' ' + word, FONT, font_scale, 1)[0][0] <= width:
+            lines[-1] += ' ' + word
         else:
-            thickness = scale*4
-        center_coordinates = (int(scale*(x_pos+1/2*width)), int(scale*(y_pos+1/2*height)))
-        axesLength = (int(scale*(width/2)), int(scale*(height/2)))
-        image = cv.ellipse(image, center_coordinates, axesLength, 0, 0, 360, boundary_color, thickness)
-        image = cv.ellipse(image, center_coordinates, axesLength, 0, 0, 360, color, -1)
-    elif 'neutral' in shape_name:
-        color = (192, 230, 242)
-        boundary_color = (49, 180, 223)
-        thickness = scale*4
-        image = cv.rectangle(image, start_point, end_point, boundary_color, thickness)
-        image = cv.rectangle(image, start_point, end_point, color, -1)
-    else:  # Ambivalent
-
-        color = (210, 199, 207)
-        boundary_color = (127, 90, 126)
-        thickness = scale*4
-        # Hexagon points
-        p1 = [int(scale*(x_pos)), int(scale*(y_pos+height/2))]
-        p2 = [int(scale*(x_pos+width*0.8/3)), int(scale*(y_pos+height))]
-        p3 = [int(scale*(x_pos+width*2.2/3)), int(scale*(y_pos+height))]
-        p4 = [int(scale*(x_pos+width)), int(scale*(y_pos+height/2))]
-        p5 = [int(scale*(x_pos+width*2.2/3)), int(scale*(y_pos))]
-        p6 = [int(scale*(x_pos+width*0.8/3)), int(scale*(y_pos))]
-        Hex = np.array([[p1, p2, p3, p4, p5, p6]], np.int32)
-        Hex = Hex.reshape((-1, 1, 2))
-        image = cv.polylines(image, [Hex], True, boundary_color, thickness)  # Boundary
-        image = cv.fillPoly(image, [Hex], color)  # Main
-        # Ellipse
-        center_coordinates = (int(scale*(x_pos+1/2*width)), int(scale*(y_pos+1/2*height)))
-        axesLength = (int(scale*(width/2.25)), int(scale*(height/2.25)))
-        image = cv.ellipse(image, center_coordinates, axesLength, 0, 0, 360, boundary_color, thickness)
-        image = cv.ellipse(image, center_coordinates, axesLength, 0, 0, 360, color, -1)
-    #print(image)
-    # Add text
-    font = cv.FONT_HERSHEY_SIMPLEX
-    fontScale = 2.
-    text_color = (0, 0, 0)
-    thickness = scale*1
-    if math.ceil(fontScale*scale*len(title)/width) == 2:  # The text is too large! --> twice as long
-        text_length_half = int(len(title)/2)
-        # First half
-        org = (int(scale*((x_pos+1/2*width)-2.2*text_length_half-fontScale*scale)), int(scale*(y_pos+1/2*height)-4*fontScale*scale))
-        image = cv.putText(image, title[:text_length_half], org, font, fontScale, text_color, thickness, cv.LINE_AA)
-        # Second half
-        org = (int(scale*((x_pos+1/2*width)-2.2*text_length_half-fontScale*scale)), int(scale*(y_pos+1/2*height)+4*fontScale*scale))
-        image = cv.putText(image, title[text_length_half:], org, font, fontScale, text_color, thickness, cv.LINE_AA)
-    elif math.ceil(fontScale*scale*len(title)/width) == 3:  # The text is too large! --> twice as long
-        text_length_half = int(len(title)/3)
-        # First half
-        org = (int(scale*((x_pos+1/2*width)-4*text_length_half-fontScale*scale)), int(scale*(y_pos+1/2*height)-5*fontScale*scale))
-        image = cv.putText(image, title[:text_length_half], org, font, fontScale, text_color, thickness, cv.LINE_AA)
-        # Second half
-        org = (int(scale*((x_pos+1/2*width)-4*text_length_half-fontScale*scale)), int(scale*(y_pos+1/2*height)+0*fontScale*scale))
-        image = cv.putText(image, title[text_length_half:2*text_length_half], org, font, fontScale, text_color, thickness, cv.LINE_AA)
-        # Third half
-        org = (int(scale*((x_pos+1/2*width)-4*text_length_half-fontScale*scale)), int(scale*(y_pos+1/2*height)+5*fontScale*scale))
-        image = cv.putText(image, title[2*text_length_half:], org, font, fontScale, text_color, thickness, cv.LINE_AA)
-    else:
-        org = (int(scale*((x_pos+1/2*width)-scale/2*len(title)-fontScale*scale)), int(scale*(y_pos+1/2*height)))
-        image = cv.putText(image, title, org, font, fontScale, text_color, thickness, cv.LINE_AA)
+            lines.append(word)
+    return lines
+
+
+def titles(image, centers, sizes, texts, text_scales, scale=1.0):
+    """
+    Write the titles of the concepts centered in their shapes
+    """
+    for center, size, title, text_scale in zip(centers, sizes, texts, text_scales):
+        font_scale = text_scale * scale / FONT_HEIGHT
+        text_thickness = max(1, int(round(font_scale * 1.5)))
+        lines = wrap(title, 0.85 * size[0], font_scale)
+        line_height = FONT_HEIGHT * font_scale * 1.3
+        top = center[1] - line_height * (len(lines) - 1) / 2
+        for ct, line in enumerate(lines):
+            (text_width, text_height), baseline = cv.getTextSize(line, FONT, font_scale, text_thickness)
+            origin = (int(center[0] - text_width / 2), int(top + ct * line_height + text_height / 2))
+            cv.putText(image, line, origin, FONT, font_scale, TEXT_COLOR, text_thickness, cv.LINE_AA)
+    return image
+
+
+def polygons(image, polys, shape_names, fill, boundary, scale):
+    """
+    Fill and outline polygons of one color, grouped by boundary thickness
+    """
+    cv.fillPoly(image, list(fixed(polys)), fill, cv.LINE_AA, SHIFT)
+    widths = np.array([boundary_thickness(shape) for shape in shape_names])
+    for width in np.unique(widths):
+        cv.polylines(image, list(fixed(polys[widths == width])), True, boundary,
+                     max(1, int(round(width * scale))), cv.LINE_AA, SHIFT)
     return image
 
+
+def shapes(image, corners, sizes, shape_names, texts, text_scales, scale=1.0):
+    """
+    Draw concepts.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        The image drawn on.
+    corners, sizes : numpy.ndarray
+        (n, 2) arrays of the top left corners and sizes of the concepts, in pixels.
+    shape_names : list of str
+        The shape (valence) of each concept.
+    texts : list of str
+        The title of each concept.
+    text_scales : numpy.ndarray
+        Font size of each concept on the canvas.
+    scale : float
+        Pixels per canvas unit.
+    """
+    if len(corners) == 0:
+        return image
+    sizes = sizes * np.array([1, HEIGHT_SCALE])
+    kinds = np.array([kind(shape) for shape in shape_names])
+    shape_names = np.array(shape_names)
+    for name, outline in (('negative', hexagons), ('positive', ellipses), ('neutral', rectangles),
+                          ('ambivalent', hexagons)):
+        selected = kinds == name
+        if selected.any():
+            fill, boundary = COLORS[name]
+            polys = outline(corners[selected], sizes[selected])
+            image = polygons(image, polys, shape_names[selected], fill, boundary, scale)
+            if name == 'ambivalent':  # Ellipse inside the hexagon
+                polys = ellipses(corners[selected], sizes[selected], 1 / 1.125)
+                image = polygons(image, polys, shape_names[selected], fill, boundary, scale)
+    return titles(image, corners + sizes / 2, sizes, texts, text_scales, scale)
@@ -0,0 +1,124 @@
+"""
+Draw a CAM as an SVG document (and convert it to PDF with weasyprint) for print quality output. The layout is the same
+as the images drawn by DataToPlot.render and the concepts look like the shapes of static/concept_svgs.
+"""
+from xml.sax.saxutils import escape
+import numpy as np
+from users.Plots.DataToPlot import bounds
+from users.Plots.Shapes import kind, boundary_thickness, hexagons, wrap, HEIGHT_SCALE, FONT_HEIGHT
+from users.Plots.Lines import thickness, boundary_points, arrow_heads, DASH, GAP
+try:
+    import weasyprint
+except (ImportError, OSError):  # Optional (and needs pango), only needed for the PDF export
+    weasyprint = None
+
+# Fill and boundary colors of each kind of concept (see static/concept_svgs)
+COLORS = {
+    'negative': ('#ecd3d1', '#b84242'),
+    'positive': ('#e2ebe1', '#95bc95'),
+    'neutral': ('#f6efd6', '#dfb431'),
+    'ambivalent': ('#e7e3e9', '#7e5a7f'),
+}
+LINE_COLOR = '#777777'
+FONT_FAMILY = 'Helvetica, Arial, sans-serif'
+
+
+def points(polygon):
+    return ' '.join('%.2f,%.2f' % (x, y) for x, y in polygon)
+
+
+def shape_elements(corner, size, shape_name):
+    """
+    SVG elements of the shape of a concept given the top left corner and size of its box
+    """
+    fill, stroke = COLORS[kind(shape_name)]
+    style = 'fill="%s" stroke="%s" stroke-width="%i"' % (fill, stroke, boundary_thickness(shape_name))
+    center = corner + size / 2
+    ellipse = '<ellipse cx="%.2f" cy="%.2f" rx="%%.2f" ry="%%.2f" %s/>' % (center[0], center[1], style)
+    if kind(shape_name) == 'neutral':
+        return ['<rect x="%.2f" y="%.2f" width="%.2f" height="%.2f" %s/>' % (*corner, *size, style)]
+    if kind(shape_name) == 'positive':
+        return [ellipse % tuple(size / 2)]
+    hexagon = '<polygon points="%s" %s/>' % (points(hexagons(corner[None], size[None])[0]), style)
+    if kind(shape_name) == 'ambivalent':  # Ellipse inside the hexagon
+        return [hexagon, ellipse % tuple(size / 2 / 1.125)]
+    return [hexagon]
+
+
+def title_element(center, size, title, text_scale):
+    """
+    SVG text of the title of a concept, wrapped like the titles of the images
+    """
+    lines = wrap(title, 0.85 * size[0], text_scale / FONT_HEIGHT)
+    line_height = text_scale * 1.3
+    top = center[1] - line_height * (len(lines) - 1) / 2
+    spans = ''.join('<tspan x="%.2f" y="%.2f">%s</tspan>' % (center[0], top + ct * line_height, escape(line))
+                    for ct, line in enumerate(lines))
+    return ('<text font-size="%.1f" text-anchor="middle" dominant-baseline="central">%s</text>'
+            % (text_scale, spans))
+
+
+def link_elements(data, centers, half_sizes):
+    """
+    SVG elements of the links of a CAM: one line per link and a triangle per arrow head
+    """
+    if len(data.starts) == 0:
+        return []
+    starts = boundary_points(centers[data.ends], centers[data.starts], half_sizes[data.starts])
+    ends = boundary_points(centers[data.starts], centers[data.ends], half_sizes[data.ends])
+    widths = np.array([thickness(style) for style in data.line_styles], float)
+    elements = []
+    for start, end, width, style in zip(starts, ends, widths, data.line_styles):
+        dashes = ' stroke-dasharray="%i %i"' % (DASH, GAP) if 'Dashed' in style else ''
+        elements.append('<line x1="%.2f" y1="%.2f" x2="%.2f" y2="%.2f" stroke-width="%i"%s/>'
+                        % (*start, *end, width, dashes))
+    arrows = np.array([arrow != 'none' for arrow in data.arrow_types])
+    both = np.array([arrow == 'bi' for arrow in data.arrow_types])
+    heads = np.concatenate([arrow_heads(ends[arrows], starts[arrows], widths[arrows]),
+                            arrow_heads(starts[both], ends[both], widths[both])])
+    elements += ['<polygon points="%s"/>' % points(head) for head in heads]
+    return elements
+
+
+def cam_svg(data):
+    """
+    Draw a CAM as an SVG document.
+
+    Parameters
+    ----------
+    data : CAMData
+        The blocks and links of the CAM.
+
+    Returns
+    -------
+    str
+        The SVG document, in canvas units.
+    """
+    origin, extent = bounds(data)
+    corners = data.corners - origin
+    sizes = data.sizes * np.array([1, HEIGHT_SCALE])
+    centers = corners + sizes / 2
+    elements = ['<g stroke="%s" fill="%s">' % (LINE_COLOR, LINE_COLOR)]
+    elements += link_elements(data, centers, sizes / 2)
+    elements.append('</g>')
+    for corner, size, shape_name in zip(corners, sizes, data.shapes):
+        elements += shape_elements(corner, size, shape_name)
+    elements.append('<g font-family="%s" fill="#000000">' % FONT_FAMILY)
+    elements += [title_element(center, size, title, text_scale)
+                 for center, size, title, text_scale in zip(centers, sizes, data.titles, data.text_scales)]
+    elements.append('</g>')
+    return ('<svg xmlns="http://www.w3.org/2000/svg" width="%i" height="%i" viewBox="0 0 %.2f %.2f">'
+            '<rect width="100%%" height="100%%" fill="#ffffff"/>%s</svg>\n'
+            % (np.ceil(extent[0]), np.ceil(extent[1]), extent[0], extent[1], ''.join(elements)))
+
+
+def cam_pdf(data):
+    """
+    Draw a CAM as a single page PDF of the size of the CAM (requires weasyprint)
+    """
+    if weasyprint is None:
+        raise ValueError('weasyprint is required for the PDF export')
+    width, height = np.ceil(bounds(data)[1])
+    html = ('<style>@page { size: %ipx %ipx; margin: 0 } body { margin: 0 }</style>%s'
+            % (width, height, cam_svg(data)))
+    return weasyprint.HTML(string=html).write_pdf()
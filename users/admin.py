@@ -4,7 +4,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
 
 from .forms import CustomUserCreationForm, CustomUserChangeForm, ProjectCAMCreationForm, ProjectCreationForm,LogCamActionForm
-from .models import CustomUser, CAM, Project, logCamActions
+from .models import CustomUser, CAM, Project, logCamActions, Job, CAMStats
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
@@ -33,4 +33,13 @@ class logCamActionAdmin(admin.ModelAdmin):
     #add_form = ProjectCreationForm
     list_display = [field.name for field in logCamActions._meta.fields]
     #list_filter = ("last_login", "date_joined")
-    fields = [field for field in LogCamActionForm.Meta.fields]
\ No newline at end of file
+    fields = [field for field in LogCamActionForm.Meta.fields]
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'owner', 'project', 'status', 'progress', 'created', 'finished']
+    list_filter = ("status", "kind")
+
+@admin.register(CAMStats)
+class CAMStatsAdmin(admin.ModelAdmin):
+    list_display = ['cam', 'concepts', 'links', 'mean_valence']
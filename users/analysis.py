@@ -0,0 +1,276 @@
+"""
+Network analysis of CAMs. The concepts and links of a CAM are turned into an undirected graph stored as a compressed
+sparse row (CSR) adjacency with numpy, from which the usual CAM metrics are computed: size, density, degrees, connected
+components, centralities of the concepts and valence.
+
+The blocks and links are read with one query each, for a single CAM (cam_metrics) or for every CAM of a project
+(project_metrics).
+
+The concepts of the CAMs of a project can also be aggregated across participants (project_concepts): titles are
+normalized and indexed to the CAMs using them, giving how often each concept recurs and how its valence varies.
+"""
+import re
+import unicodedata
+from collections import Counter
+import numpy as np
+from block.models import Block
+from link.models import Link
+from users.models import VALENCE
+
+BLOCK_COLUMNS = ('id', 'title', 'shape')
+LINK_COLUMNS = ('starting_block_id', 'ending_block_id')
+
+
+class CAMGraph:
+    """
+    Undirected graph of the concepts and links of a CAM.
+
+    Parameters
+    ----------
+    blocks : list of tuple
+        (id, title, shape) of each block.
+    links : list of tuple
+        (starting_block, ending_block) of each link, with the blocks given by id. Links to missing blocks, links of a
+        block to itself and repeated links are ignored.
+    """
+
+    def __init__(self, blocks, links):
+        blocks = sorted(blocks)
+        self.ids = np.array([block[0] for block in blocks], dtype=np.int64)
+        self.titles = [block[1] for block in blocks]
+        self.shapes = [block[2] for block in blocks]
+        known = set(self.ids.tolist())
+        pairs = np.array([link[:2] for link in links if link[0] in known and link[1] in known],
+                         dtype=np.int64).reshape(-1, 2)
+        pairs = np.searchsorted(self.ids, pairs)
+        pairs = np.unique(np.sort(pairs[pairs[:, 0] != pairs[:, 1]], axis=1), axis=0)
+        self.edges = len(pairs)
+        # Both directions of every edge, sorted by their first node
+        both = np.concatenate([pairs, pairs[:, ::-1]])
+        both = both[np.lexsort((both[:, 1], both[:, 0]))]
+        self.indices = both[:, 1]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(both[:, 0], minlength=len(self.ids)))])
+
+    @property
+    def nodes(self):
+        return len(self.ids)
+
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def neighbors(self, nodes):
+        """
+        Edges leaving a set of nodes, as arrays of their first and second nodes
+        """
+        counts = self.degrees()[nodes]
+        starts = np.repeat(self.indptr[nodes], counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(nodes, counts), self.indices[starts + offsets]
+
+    def components(self):
+        """
+        Label of the connected component of each node (the smallest node of the component)
+        """
+        labels = np.arange(self.nodes)
+        first = np.repeat(np.arange(self.nodes), self.degrees())
+        while True:
+            smallest = labels.copy()
+            np.minimum.at(smallest, first, labels[self.indices])
+            if (smallest == labels).all():
+                return labels
+            labels = smallest[smallest]
+
+    def centralities(self):
+        """
+        Betweenness and harmonic closeness centrality of every node, normalized to [0, 1]. Shortest paths are counted
+        with Brandes' algorithm, running each breadth first search one level at a time.
+        """
+        n = self.nodes
+        betweenness = np.zeros(n)
+        closeness = np.zeros(n)
+        for source in range(n):
+            distance = np.full(n, -1)
+            paths = np.zeros(n)
+            distance[source], paths[source] = 0, 1
+            frontier, depth, levels = np.array([source]), 0, []
+            while len(frontier):
+                depth += 1
+                first, second = self.neighbors(frontier)
+                distance[second[distance[second] < 0]] = depth
+                forward = distance[second] == depth
+                first, second = first[forward], second[forward]
+                np.add.at(paths, second, paths[first])
+                levels.append((first, second))
+                frontier = np.unique(second)
+            reached = distance > 0
+            closeness[source] = (1.0 / distance[reached]).sum()
+            dependency = np.zeros(n)
+            for first, second in reversed(levels):
+                np.add.at(dependency, first, paths[first] / paths[second] * (1 + dependency[second]))
+            dependency[source] = 0
+            betweenness += dependency
+        if n > 2:
+            betweenness /= (n - 1) * (n - 2)  # Each pair is counted from both ends
+        if n > 1:
+            closeness /= n - 1
+        return betweenness, closeness
+
+    def metrics(self, concepts=True):
+        """
+        Metrics of the CAM.
+
+        Parameters
+        ----------
+        concepts : bool
+            Add the degree and centralities of every concept.
+
+        Returns
+        -------
+        dict
+        """
+        n = self.nodes
+        degrees = self.degrees()
+        valences = np.array([VALENCE.get(shape, np.nan) for shape in self.shapes], float)
+        metrics = {
+            'concepts': n,
+            'links': self.edges,
+            'density': 2 * self.edges / (n * (n - 1)) if n > 1 else 0.0,
+            'components': len(np.unique(self.components())),
+            'isolated_concepts': int((degrees == 0).sum()),
+            'mean_degree': float(degrees.mean()) if n else 0.0,
+            'max_degree': int(degrees.max()) if n else 0,
+            'degree_distribution': np.bincount(degrees).tolist(),
+            'mean_valence': float(np.nanmean(valences)) if np.isfinite(valences).any() else None,
+            'positive_concepts': int((valences > 0).sum()),
+            'negative_concepts': int((valences < 0).sum()),
+            'neutral_concepts': self.shapes.count('neutral'),
+            'ambivalent_concepts': self.shapes.count('ambivalent'),
+        }
+        if concepts:
+            betweenness, closeness = self.centralities()
+            metrics['concept_metrics'] = [
+                {'block_id': int(block_id), 'title': title, 'shape': shape, 'degree': int(degree),
+                 'degree_centrality': float(degree / (n - 1)) if n > 1 else 0.0, 'betweenness': float(between),
+                 'closeness': float(close)}
+                for block_id, title, shape, degree, between, close
+                in zip(self.ids, self.titles, self.shapes, degrees, betweenness, closeness)]
+        return metrics
+
+
+def cam_metrics(cam_id, concepts=True):
+    """
+    Metrics of a CAM (see CAMGraph.metrics)
+    """
+    blocks = Block.objects.filter(CAM_id=cam_id).values_list(*BLOCK_COLUMNS)
+    links = Link.objects.filter(CAM_id=cam_id).values_list(*LINK_COLUMNS)
+    return dict(cam_id=int(cam_id), **CAMGraph(list(blocks), list(links)).metrics(concepts))
+
+
+def project_metrics(project, concepts=False):
+    """
+    Metrics of every CAM of a project, reading the blocks and the links of all CAMs with one query each.
+
+    Returns
+    -------
+    dict
+        The metrics of each CAM under 'cams' and their averages over the CAMs under 'mean'.
+    """
+    cam_blocks = {}
+    for row in Block.objects.filter(CAM__project=project).values_list('CAM_id', *BLOCK_COLUMNS):
+        cam_blocks.setdefault(row[0], []).append(row[1:])
+    cam_links = {}
+    for row in Link.objects.filter(CAM__project=project).values_list('CAM_id', *LINK_COLUMNS):
+        cam_links.setdefault(row[0], []).append(row[1:])
+    cams = []
+    for cam_id, username in project.cam_set.order_by('id').values_list('id', 'user__username'):
+        graph = CAMGraph(cam_blocks.get(cam_id, []), cam_links.get(cam_id, []))
+        cams.append(dict(cam_id=cam_id, participant=username, **graph.metrics(concepts)))
+    averaged = ('concepts', 'links', 'density', 'components', 'mean_degree', 'mean_valence')
+    mean = {}
+    for name in averaged:
+        values = [cam[name] for cam in cams if cam[name] is not None]
+        mean[name] = float(np.mean(values)) if values else None
+    return {'project': project.name, 'cams': cams, 'mean': mean}
+
+
+CURSOR_SIZE = 2000  # Rows fetched from the database at a time
+# Suffixes removed by stem, longest first, with their replacement
+SUFFIXES = {
+    'en': [('ies', 'y'), ('es', ''), ('s', '')],
+    'de': [('ern', ''), ('en', ''), ('er', ''), ('e', ''), ('n', ''), ('s', '')],
+}
+MIN_STEM = 3  # Shortest stem left by stem
+
+
+def stem(word, language='en'):
+    """
+    Light stemming of a word: strip the plural and inflection suffixes of the language
+    """
+    for suffix, replacement in SUFFIXES.get(language, []):
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM and not word.endswith('s' + suffix):
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def normalize_title(title, stemming=False, language='en'):
+    """
+    Key of a concept title: case folded, without punctuation and with single spaces, optionally stemmed
+    """
+    title = unicodedata.normalize('NFKC', title or '').casefold()
+    words = re.sub(r'[^\w\s]', ' ', title).split()
+    if stemming:
+        words = [stem(word, language) for word in words]
+    return ' '.join(words)
+
+
+def project_concepts(project, stemming=False, language='en', min_cams=1):
+    """
+    Concepts recurring across the CAMs of a project, computed in one pass over its blocks.
+
+    Parameters
+    ----------
+    project : Project
+        The project.
+    stemming : bool
+        Also group titles differing by their suffixes (see stem).
+    language : str
+        Language of the titles ('en' or 'de'), for stemming.
+    min_cams : int
+        Only return the concepts used in at least this many CAMs.
+
+    Returns
+    -------
+    list of dict
+        For each concept: its key, the titles used for it (most common first), the number of CAMs and occurrences,
+        the ids of the CAMs using it and the mean, standard deviation, minimum and maximum valence of its shapes.
+        Sorted by decreasing number of CAMs.
+    """
+    index = {}
+    rows = Block.objects.filter(CAM__project=project).values_list('CAM_id', 'title', 'shape')
+    for cam_id, title, shape in rows.iterator(CURSOR_SIZE):
+        key = normalize_title(title, stemming, language)
+        if not key:
+            continue
+        concept = index.setdefault(key, {'titles': Counter(), 'cams': set(), 'valences': []})
+        concept['titles'][title.strip()] += 1
+        concept['cams'].add(cam_id)
+        if shape in VALENCE:
+            concept['valences'].append(VALENCE[shape])
+    concepts = []
+    for key, concept in index.items():
+        if len(concept['cams']) < min_cams:
+            continue
+        valences = np.array(concept['valences'])
+        concepts.append({
+            'concept': key,
+            'titles': [title for title, count in concept['titles'].most_common()],
+            'cams': len(concept['cams']),
+            'occurrences': sum(concept['titles'].values()),
+            'cam_ids': sorted(concept['cams']),
+            'mean_valence': float(valences.mean()) if len(valences) else None,
+            'valence_std': float(valences.std()) if len(valences) else None,
+            'min_valence': float(valences.min()) if len(valences) else None,
+            'max_valence': float(valences.max()) if len(valences) else None,
+        })
+    return sorted(concepts, key=lambda concept: (-concept['cams'], -concept['occurrences'], concept['concept']))
+
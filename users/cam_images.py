@@ -0,0 +1,252 @@
+"""
+Images of CAMs rendered on the server (see users/Plots). Each image is named after a hash of the version of the CAM
+and of the render parameters, and CAM.image_version records the version it was drawn for, so an image is only drawn
+again once the CAM has changed. Whether an image is up to date is known from the CAM row alone, without reading its
+blocks and links.
+
+Images are stored under MEDIA_ROOT/CAMS and CAM.cam_image holds their name relative to MEDIA_ROOT. Images drawn by the
+browser (see users.views.Image_CAM) are keyed the same way, so either kind of image is reused while the CAM is unchanged.
+Other versions of an image (thumbnail, print, grayscale) are made from it when they are first asked for.
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+import cv2 as cv
+from io import BytesIO
+from PIL import Image, ImageOps
+from django.conf import settings
+from block.models import Block
+from link.models import Link
+from users.models import CAM
+from users.Plots.DataToPlot import CAMData, render, BLOCK_COLUMNS, LINK_COLUMNS
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+THUMBNAIL_SIZE = 400  # Largest width or height of thumbnails
+PRINT_SCALE = 5  # Upscaling of the printed version
+# Columns telling whether the image of a CAM is current (the project is set on CAMs read through project.cam_set)
+IMAGE_COLUMNS = ('id', 'project', 'version', 'cam_image', 'image_version', 'user__username')
+
+
+def version_hash(version, **params):
+    """
+    Hash of the version of a CAM and of the parameters it is rendered with
+    """
+    return hashlib.sha1(repr((version, sorted(params.items()))).encode()).hexdigest()
+
+
+def image_name(username, cam_id, digest):
+    return 'CAMS/%s_%s_%s.png' % (username, cam_id, digest[:16])
+
+
+def variant_path(path, variant):
+    return '%s_%s.png' % (os.path.splitext(path)[0], variant)
+
+
+def image_path(name):
+    """
+    Path of a CAM image given its name. Images uploaded before the names were made relative to MEDIA_ROOT are stored
+    relative to the working directory.
+    """
+    name = str(name)
+    if os.path.isfile(name):
+        return name
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def save_original(image_data, path):
+    """
+    Store an image uploaded by the browser: png files are written as they are, other formats are converted to png
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if image_data.startswith(PNG_SIGNATURE):
+        with open(path, 'wb') as file:
+            file.write(image_data)
+    else:
+        with Image.open(BytesIO(image_data)) as im:
+            im.save(path, 'PNG')
+
+
+def remove_transparency(im, bg_color=(255, 255, 255)):
+    """
+    Taken from https://stackoverflow.com/a/35859141/7444782
+    """
+    # Only process if image has transparency (http://stackoverflow.com/a/1963146)
+    if im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info):
+
+        # Need to convert to RGBA if LA format due to a bug in PIL (http://stackoverflow.com/a/1963146)
+        alpha = im.convert('RGBA').split()[-1]
+
+        # Create a new background image of our matt color.
+        # Must be RGBA because paste requires both images have the same format
+        # (http://stackoverflow.com/a/8720632  and  http://stackoverflow.com/a/9459208)
+        bg = Image.new("RGBA", im.size, bg_color + (255,))
+        bg.paste(im, mask=alpha)
+        return bg
+    else:
+        return im
+
+
+def thumbnail(im):
+    im = im.copy()
+    im.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+    return im
+
+
+def print_size(im):
+    return im.resize((im.width * PRINT_SCALE, im.height * PRINT_SCALE), Image.LANCZOS)
+
+
+VARIANTS = {'thumbnail': thumbnail, 'print': print_size, 'grayscale': ImageOps.grayscale}
+
+
+def image_variant(name, variant):
+    """
+    Path of a version of a CAM image (see VARIANTS), made from the image the first time it is asked for
+    """
+    path = variant_path(image_path(name), variant)
+    if not os.path.isfile(path):
+        with Image.open(image_path(name)) as im:
+            im = remove_transparency(im).convert('RGB')
+            temporary = '%s.%i.tmp' % (path, os.getpid())
+            VARIANTS[variant](im).save(temporary, 'PNG')
+        os.replace(temporary, path)  # Requests asking for the same version at the same time do not see partial files
+    return path
+
+
+def render_to_file(data, path, scale=1.0, max_size=None):
+    """
+    Render a CAM to a png file (run in the worker processes of render_project)
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cv.imwrite(path, render(data, scale, max_size))
+    return path
+
+
+def image_names(cam, **params):
+    """
+    Names the image of a CAM can have for its current version: drawn on the server with the given parameters, or
+    drawn by the browser
+    """
+    username = cam.user.username
+    return (image_name(username, cam.id, version_hash(cam.version, **params)),
+            image_name(username, cam.id, version_hash(cam.version, source='canvas')))
+
+
+def is_current(cam, names):
+    return (cam.image_version == cam.version and str(cam.cam_image) in names
+            and os.path.isfile(image_path(cam.cam_image)))
+
+
+def replace_image(cam, name):
+    """
+    Point a CAM to a new image drawn for its current version, removing the image (and its other versions) of its
+    previous version
+    """
+    previous = str(cam.cam_image)
+    if previous != name and previous.startswith('CAMS/%s_%s_' % (cam.user.username, cam.id)):
+        path = image_path(previous)
+        for path in [path] + [variant_path(path, variant) for variant in VARIANTS]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    cam.cam_image = name
+    cam.image_version = cam.version
+
+
+def cached_image(cam, data=None, scale=1.0, max_size=None):
+    """
+    Name of the image of a CAM, drawn only if the CAM changed since its image was drawn.
+
+    Parameters
+    ----------
+    cam : CAM
+        The CAM. Its version must have been read before its blocks and links.
+    data : CAMData, optional
+        Its blocks and links, read from the database if not given.
+    scale, max_size
+        Render parameters (see users.Plots.DataToPlot.render).
+    """
+    names = image_names(cam, scale=scale, max_size=max_size)
+    if not is_current(cam, names):
+        data = data if data is not None else CAMData.from_cam(cam.id)
+        render_to_file(data, image_path(names[0]), scale, max_size)
+        replace_image(cam, names[0])
+        CAM.objects.filter(id=cam.id).update(cam_image=names[0], image_version=cam.image_version)
+    return str(cam.cam_image)
+
+
+def project_cam_data(project, cam_ids=None):
+    """
+    Blocks and links of every CAM of a project (or of the given CAMs) read in two queries, as {cam id: CAMData}
+    """
+    blocks = Block.objects.filter(CAM__project=project)
+    links = Link.objects.filter(CAM__project=project)
+    cams = project.cam_set.values_list('id', flat=True)
+    if cam_ids is not None:
+        blocks, links, cams = blocks.filter(CAM_id__in=cam_ids), links.filter(CAM_id__in=cam_ids), cam_ids
+    cam_blocks = {}
+    for row in blocks.values_list('CAM_id', *BLOCK_COLUMNS):
+        cam_blocks.setdefault(row[0], []).append(row[1:])
+    cam_links = {}
+    for row in links.values_list('CAM_id', *LINK_COLUMNS):
+        cam_links.setdefault(row[0], []).append(row[1:])
+    return {cam_id: CAMData(cam_blocks.get(cam_id, []), cam_links.get(cam_id, [])) for cam_id in cams}
+
+
+def current_images(project, cam_ids=None, scale=1.0, max_size=None):
+    """
+    Names of the images of the CAMs of a project (or of the given CAMs) which are up to date, as {cam id: name}.
+    Nothing is drawn and no block or link is read, so this can run while a response is being sent.
+    """
+    cams = project.cam_set.select_related('user').only(*IMAGE_COLUMNS)
+    if cam_ids is not None:
+        cams = cams.filter(id__in=cam_ids)
+    return {cam.id: str(cam.cam_image) for cam in cams
+            if is_current(cam, image_names(cam, scale=scale, max_size=max_size))}
+
+
+def render_project(project, workers=None, force=False, scale=1.0, max_size=None, cam_ids=None):
+    """
+    Render the image of every CAM of a project whose content changed since its image was drawn.
+
+    Parameters
+    ----------
+    project : Project
+        The project whose CAMs are rendered.
+    workers : int, optional
+        Number of processes drawing the images. Defaults to the number of CPUs.
+    force : bool
+        Draw every image even if it is up to date.
+    scale, max_size
+        Render parameters (see users.Plots.DataToPlot.render).
+    cam_ids : list of int, optional
+        Only render these CAMs.
+
+    Returns
+    -------
+    tuple of int
+        Number of images drawn and number of CAMs skipped.
+    """
+    cams = project.cam_set.select_related('user').only(*IMAGE_COLUMNS)
+    if cam_ids is not None:
+        cams = cams.filter(id__in=cam_ids)
+    todo = []
+    for cam in cams:
+        names = image_names(cam, scale=scale, max_size=max_size)
+        if force or not is_current(cam, names):
+            todo.append((cam, names[0]))
+    # Only the CAMs drawn again are read, after their versions
+    data = project_cam_data(project, [cam.id for cam, name in todo]) if todo else {}
+    paths = [os.path.join(settings.MEDIA_ROOT, name) for cam, name in todo]
+    arguments = ([data[cam.id] for cam, name in todo], paths, [scale] * len(todo), [max_size] * len(todo))
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(render_to_file, *arguments, chunksize=max(1, len(todo) // (4 * workers))))
+    else:
+        list(map(render_to_file, *arguments))
+    for cam, name in todo:
+        replace_image(cam, name)
+    CAM.objects.bulk_update([cam for cam, name in todo], ['cam_image', 'image_version'])
+    return len(todo), len(cams) - len(todo)
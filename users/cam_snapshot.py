@@ -0,0 +1,91 @@
+"""
+Load everything the drawing canvas needs to display a CAM. The blocks and links of the CAM are read in two queries (the
+link query joins both of its blocks) and returned as compact dictionaries, so that neither the view nor the templates
+have to walk the relations of each block and link.
+
+Snapshots are cached under the CAM's id and version. Every write to a block or link bumps the version (see
+CAM.bump_version), so a cached snapshot is never served once the CAM has changed.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from block.models import Block
+from link.models import Link
+from users.models import CAM
+
+
+# Columns the canvas needs for each block and link
+BLOCK_FIELDS = ('id', 'num', 'title', 'shape', 'x_pos', 'y_pos', 'width', 'height', 'text_scale', 'comment',
+                'modifiable', 'resizable')
+LINK_FIELDS = ('id', 'line_style', 'arrow_type', 'starting_block_id', 'ending_block_id')
+LINK_BLOCK_FIELDS = ('num', 'x_pos', 'y_pos')
+
+
+class CAMSnapshot:
+    """
+    Snapshot of the blocks and links of a single CAM.
+
+    Parameters
+    ----------
+    cam_id : int
+        The id of the CAM.
+    """
+
+    def __init__(self, cam_id):
+        self.cam_id = cam_id
+        self.blocks = []
+        self.links = []
+        self.load()
+
+    def load(self):
+        """
+        Read the blocks and links of the CAM from the database
+        """
+        blocks = list(Block.objects.filter(CAM_id=self.cam_id).order_by('id').values(*BLOCK_FIELDS))
+        link_columns = LINK_FIELDS + tuple('%s__%s' % (end, field) for end in ('starting_block', 'ending_block')
+                                           for field in LINK_BLOCK_FIELDS)
+        links = Link.objects.filter(CAM_id=self.cam_id).order_by('id').values(*link_columns)
+        # Ids of the links starting and ending at each block
+        links_starting = {block['id']: [] for block in blocks}
+        links_ending = {block['id']: [] for block in blocks}
+        self.links = []
+        for link in links:
+            links_starting.setdefault(link['starting_block_id'], []).append(link['id'])
+            links_ending.setdefault(link['ending_block_id'], []).append(link['id'])
+            self.links.append({
+                'id': link['id'],
+                'line_style': link['line_style'],
+                'arrow_type': link['arrow_type'],
+                'starting_block': link['starting_block__num'],
+                'ending_block': link['ending_block__num'],
+                'start_x': link['starting_block__x_pos'],
+                'start_y': link['starting_block__y_pos'],
+                'end_x': link['ending_block__x_pos'],
+                'end_y': link['ending_block__y_pos'],
+            })
+        for block in blocks:
+            if block['comment'] is None:
+                block['comment'] = ''
+            block['links_starting'] = links_starting[block['id']]
+            block['links_ending'] = links_ending[block['id']]
+        self.blocks = blocks
+        return self
+
+    def as_dict(self):
+        """
+        Return the snapshot as a JSON serializable dictionary
+        """
+        return {'cam': self.cam_id, 'blocks': self.blocks, 'links': self.links}
+
+
+def get_snapshot(cam_id):
+    """
+    Return the snapshot dictionary of a CAM, from the cache when the CAM has not changed since it was stored. Only the
+    CAM's version is read from the database on a cache hit.
+    """
+    version = CAM.objects.filter(id=cam_id).values_list('version', flat=True).first()
+    key = 'cam_snapshot_%s_%s' % (cam_id, version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = CAMSnapshot(cam_id).as_dict()
+        cache.set(key, snapshot, getattr(settings, 'CAM_SNAPSHOT_CACHE_TIMEOUT', 3600))
+    return snapshot
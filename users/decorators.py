@@ -1,5 +1,7 @@
+from functools import wraps
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.decorators import user_passes_test
+from django.http import JsonResponse
 
 
 def participant_required(function=None, redirect_field_name=REDIRECT_FIELD_NAME, login_url='login'):
@@ -29,4 +31,18 @@ def researcher_required(function=None, redirect_field_name=REDIRECT_FIELD_NAME,
     )
     if function:
         return actual_decorator(function)
-    return actual_decorator
\ No newline at end of file
+    return actual_decorator
+
+def integer_pk(view):
+    '''
+    Decorator for views that take the CAM or project in a pk parameter,
+    answers 400 if the pk is not an integer.
+    '''
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            int(request.GET.get('pk', 0))
+        except ValueError:
+            return JsonResponse({'error_message': 'pk must be an integer'}, status=400)
+        return view(request, *args, **kwargs)
+    return wrapper
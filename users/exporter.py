@@ -0,0 +1,343 @@
+"""
+Export CAMs as zip files without holding the archive in memory. The csv files are generated row by row from database
+cursors in the same format as BlockResource/LinkResource (so that they can be imported again, see users/importer.py)
+and the zip file is produced as a stream of chunks which can be sent with a StreamingHttpResponse or written to a file.
+
+A project is exported with a constant number of queries: the blocks and the links of all its CAMs are each read with one
+query ordered by CAM, and the rows are handed out CAM by CAM as the csv files are written (see CAMRows).
+
+Exports can be incremental: given the token of a previous export, only the CAMs changed since then are written (see
+CAM.updated).
+
+For analysis, a project can also be exported as two columnar files holding the blocks and the links of all its CAMs
+(Parquet if pyarrow is installed, csv otherwise) together with a manifest describing them (see analysis_members).
+"""
+import csv
+import datetime
+import json
+import os
+import tempfile
+from zipfile import ZipFile, ZIP_DEFLATED
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from block.models import Block
+from link.models import Link
+from .cam_images import image_path, render_project, current_images
+from .analysis import VALENCE
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Optional, the analysis export falls back to csv
+    pyarrow = None
+
+
+CHUNK_SIZE = 64 * 1024  # Size of the chunks sent to the client
+CURSOR_SIZE = 2000  # Rows fetched from the database at a time
+
+
+class ZipStream:
+    """
+    Write-only file object collecting the bytes written by ZipFile until they are taken with pop()
+    """
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+class Echo:
+    """
+    File object returning what is written to it, so that csv.writer can format one row at a time
+    """
+    def write(self, value):
+        return value
+
+
+def model_columns(model):
+    """
+    Names (as used in the csv header) and attributes of the columns of a model in the order used by import_export
+    """
+    return [(field.name, field.attname) for field in model._meta.concrete_fields]
+
+
+def format_value(value):
+    """
+    Format a value the way import_export writes it to csv
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, datetime.time):
+        return value.strftime('%H:%M:%S')
+    return value
+
+
+def csv_lines(header, rows):
+    """
+    Encoded csv lines of a header and an iterable of rows
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(header).encode()
+    for row in rows:
+        yield writer.writerow([format_value(value) for value in row]).encode()
+
+
+def file_chunks(path):
+    """
+    Contents of a file read in chunks
+    """
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            yield chunk
+
+
+def stream_zip(members):
+    """
+    Yield a zip file in chunks.
+
+    Parameters
+    ----------
+    members : iterable
+        (name, chunks) pairs where chunks is an iterable of the bytes of the file.
+    """
+    buffer = ZipStream()
+    with ZipFile(buffer, 'w', ZIP_DEFLATED) as zf:
+        for name, chunks in members:
+            with zf.open(name, 'w') as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    if buffer.size >= CHUNK_SIZE:
+                        yield buffer.pop()
+            if buffer.size:
+                yield buffer.pop()
+    yield buffer.pop()
+
+
+class CAMRows:
+    """
+    Rows of a model for every CAM of a project, read with a single query ordered by CAM and handed out one CAM at a
+    time. The CAMs must be asked for in increasing order of their ids.
+
+    Parameters
+    ----------
+    model : Block or Link
+        The model whose rows are read.
+    project : Project
+        The project whose CAMs are exported.
+    since : datetime, optional
+        Only read the rows of CAMs changed since then.
+    """
+
+    def __init__(self, model, project, since=None):
+        self.columns = model_columns(model)
+        attnames = [attname for name, attname in self.columns]
+        self.cam_index = attnames.index('CAM_id')
+        queryset = model.objects.filter(CAM__project=project)
+        if since is not None:
+            queryset = queryset.filter(CAM__updated__gte=since)
+        self.queryset = queryset.order_by('CAM_id', 'id').values_list(*attnames)
+        self.rows = None
+        self.next_row = None
+
+    def take(self, cam_id):
+        """
+        Rows belonging to a CAM
+        """
+        if self.rows is None:  # Run the query when the first CAM is written
+            self.rows = self.queryset.iterator(CURSOR_SIZE)
+            self.next_row = next(self.rows, None)
+        while self.next_row is not None and self.next_row[self.cam_index] < cam_id:
+            self.next_row = next(self.rows, None)
+        while self.next_row is not None and self.next_row[self.cam_index] == cam_id:
+            yield self.next_row
+            self.next_row = next(self.rows, None)
+
+    def csv(self, cam_id):
+        """
+        Csv lines of the rows belonging to a CAM
+        """
+        return csv_lines([name for name, attname in self.columns], self.take(cam_id))
+
+
+def project_members(project, name_format, images=False, progress=None, since=None, token=None, render=False):
+    """
+    Zip members with the blocks and links of every CAM of a project. For an incremental export (since is given) only
+    the CAMs whose blocks or links changed since then are included. Every export ends with an export.json recording
+    the token to pass as since to the next export.
+
+    Parameters
+    ----------
+    project : Project
+        The exported project.
+    name_format : str
+        Format of the csv names, given `username`, `cam_id` and 'blocks' or 'links' as `name`.
+    images : bool
+        Add the image of each CAM whose image is up to date (see users/cam_images.py).
+    progress : callable, optional
+        Called with the number of CAMs written and the total number of CAMs.
+    since : datetime, optional
+        Only export the CAMs changed since then (see CAM.updated).
+    token : str, optional
+        Start time of this export, i.e. the since of the next one.
+    render : bool
+        Draw the images which are out of date first. This takes a while for large projects: only background jobs
+        should do it, not a response being streamed.
+    """
+    cams = project.cam_set.order_by('id')
+    if since is not None:
+        cams = cams.filter(updated__gte=since)
+    current = {}
+    if images:
+        if render:  # Only the CAMs changed since their image was drawn are rendered again
+            render_project(project, cam_ids=cams.values_list('id', flat=True))
+        current = current_images(project, cam_ids=cams.values_list('id', flat=True))
+    cams = list(cams.values_list('id', 'user__username'))
+    blocks = CAMRows(Block, project, since)
+    links = CAMRows(Link, project, since)
+    for ct, (cam_id, username) in enumerate(cams):
+        yield name_format.format(username=username, cam_id=cam_id, name='blocks'), blocks.csv(cam_id)
+        yield name_format.format(username=username, cam_id=cam_id, name='links'), links.csv(cam_id)
+        if cam_id in current:
+            yield current[cam_id], file_chunks(image_path(current[cam_id]))
+        if progress:
+            progress(ct + 1, len(cams))
+    info = {'project': project.name, 'since': since.isoformat() if since is not None else None, 'token': token,
+            'cams': [cam[0] for cam in cams]}
+    yield 'export.json', [json.dumps(info, indent=2).encode()]
+
+
+def format_time(value):
+    return value.strftime('%H:%M:%S') if value is not None else None
+
+
+# Columns of the analysis export: (column, type, field, conversion)
+BLOCK_ANALYSIS_COLUMNS = [
+    ('cam_id', 'int64', 'CAM_id', None),
+    ('participant', 'string', 'CAM__user__username', None),
+    ('block_id', 'int64', 'id', None),
+    ('num', 'float64', 'num', None),
+    ('title', 'string', 'title', None),
+    ('shape', 'string', 'shape', None),
+    ('valence', 'float64', 'shape', VALENCE.get),
+    ('x_pos', 'float64', 'x_pos', None),
+    ('y_pos', 'float64', 'y_pos', None),
+    ('width', 'float64', 'width', None),
+    ('height', 'float64', 'height', None),
+    ('comment', 'string', 'comment', None),
+    ('modifiable', 'bool', 'modifiable', None),
+    ('timestamp', 'string', 'timestamp', format_time),
+]
+LINK_ANALYSIS_COLUMNS = [
+    ('cam_id', 'int64', 'CAM_id', None),
+    ('participant', 'string', 'CAM__user__username', None),
+    ('link_id', 'int64', 'id', None),
+    ('starting_block', 'int64', 'starting_block_id', None),
+    ('ending_block', 'int64', 'ending_block_id', None),
+    ('line_style', 'string', 'line_style', None),
+    ('arrow_type', 'string', 'arrow_type', None),
+    ('timestamp', 'string', 'timestamp', format_time),
+]
+ARROW_TYPES = {'int64': 'int64', 'float64': 'float64', 'string': 'string', 'bool': 'bool_'}
+
+
+def analysis_batches(model, project, columns, counter):
+    """
+    Rows of the analysis export of a model for every CAM of a project, in batches of CURSOR_SIZE rows. The number of
+    rows is added to counter['rows'].
+    """
+    fields = list(dict.fromkeys(field for name, type_, field, convert in columns))
+    rows = model.objects.filter(CAM__project=project).order_by('CAM_id', 'id').values(*fields).iterator(CURSOR_SIZE)
+    batch = []
+    for row in rows:
+        batch.append([convert(row[field]) if convert else row[field] for name, type_, field, convert in columns])
+        if len(batch) == CURSOR_SIZE:
+            counter['rows'] += len(batch)
+            yield batch
+            batch = []
+    counter['rows'] += len(batch)
+    yield batch
+
+
+def parquet_chunks(batches, columns):
+    """
+    Parquet file of batches of rows, written one row group per batch
+    """
+    schema = pyarrow.schema([(name, getattr(pyarrow, ARROW_TYPES[type_])()) for name, type_, field, convert in columns])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'export.parquet')
+        with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+            for batch in batches:
+                if batch:
+                    arrays = [pyarrow.array(list(values), type=column.type)
+                              for values, column in zip(zip(*batch), schema)]
+                    writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+        yield from file_chunks(path)
+
+
+def analysis_format(file_format=None):
+    """
+    Check the format of an analysis export. Defaults to parquet if pyarrow is installed and csv otherwise.
+    """
+    file_format = file_format or ('parquet' if pyarrow is not None else 'csv')
+    if file_format not in ('parquet', 'csv'):
+        raise ValueError('Unknown format %s' % file_format)
+    if file_format == 'parquet' and pyarrow is None:
+        raise ValueError('pyarrow is required for the parquet export')
+    return file_format
+
+
+def analysis_members(project, file_format=None):
+    """
+    Zip members of the analysis export of a project: blocks and links of all CAMs as two columnar files and a
+    manifest.json describing them.
+
+    Parameters
+    ----------
+    project : Project
+        The exported project.
+    file_format : str, optional
+        'parquet' or 'csv'. Defaults to parquet if pyarrow is installed.
+    """
+    file_format = analysis_format(file_format)
+    manifest = {'project': project.name, 'project_id': project.id, 'format': file_format,
+                'exported': datetime.datetime.now().isoformat(timespec='seconds'), 'files': {}}
+    for name, model, columns in (('blocks', Block, BLOCK_ANALYSIS_COLUMNS), ('links', Link, LINK_ANALYSIS_COLUMNS)):
+        filename = '%s.%s' % (name, file_format)
+        counter = {'rows': 0}
+        batches = analysis_batches(model, project, columns, counter)
+        if file_format == 'parquet':
+            yield filename, parquet_chunks(batches, columns)
+        else:
+            yield filename, csv_lines([column[0] for column in columns],
+                                      (row for batch in batches for row in batch))
+        manifest['files'][name] = {'file': filename, 'rows': counter['rows'],
+                                   'columns': [{'name': column[0], 'type': column[1]} for column in columns]}
+    yield 'manifest.json', [json.dumps(manifest, indent=2).encode()]
+
+
+def export_since(value):
+    """
+    Parse the since parameter of an incremental export (the token of a previous export, an ISO 8601 time)
+    """
+    if not value:
+        return None
+    since = parse_datetime(value.replace(' ', '+'))  # '+' of the time zone is decoded as a space in query strings
+    if since is None:
+        raise ValueError('Invalid export token %s' % value)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
@@ -0,0 +1,216 @@
+"""
+Import CAMs from the zip files produced by export_CAM (a blocks csv and a links csv). The zip members are read in
+memory, the rows are cleaned and validated column by column with pandas, and the blocks and links are then written with
+one bulk insert each inside a single transaction. The ids stored in the csv files are only used to reconnect the links
+to their new blocks.
+
+A project's initial CAM is parsed once and kept in the cache (see project_template) so that it can be stamped into the
+CAM of every new participant without reading the zip file again.
+"""
+from zipfile import ZipFile, BadZipFile
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+import numpy as np
+import pandas as pd
+from block.models import Block
+from link.models import Link
+from users.models import CAM, CAMStats, count_changes, logCamActions
+from users.journal import delete_contents, operation, record, snapshot
+
+
+# Columns read from the csv files and the value used when a column or a value is missing
+BLOCK_DEFAULTS = {
+    'title': '', 'x_pos': 0.0, 'y_pos': 0.0, 'width': 160.0, 'height': 120.0, 'shape': 'neutral', 'num': 0.0,
+    'comment': '', 'timestamp': None, 'modifiable': True, 'text_scale': 14.0, 'resizable': False,
+}
+LINK_DEFAULTS = {
+    'line_style': 'Solid-Weak', 'num': 0, 'arrow_type': 'none', 'timestamp': None,
+}
+BLOCK_NUMERIC = ('x_pos', 'y_pos', 'width', 'height', 'num', 'text_scale')
+BOOLEAN_VALUES = {'1': True, '1.0': True, 'true': True, '0': False, '0.0': False, 'false': False}
+
+
+class CAMImportError(Exception):
+    """
+    Raised when an uploaded file cannot be read as a CAM
+    """
+    pass
+
+
+class CAMTemplate:
+    """
+    Parsed contents of a CAM zip file.
+
+    Parameters
+    ----------
+    blocks : pandas.DataFrame
+        One row per block. The `id` column holds the block ids of the exported CAM.
+    links : pandas.DataFrame
+        One row per link. `starting_block` and `ending_block` refer to the `id` column of blocks.
+    """
+
+    def __init__(self, blocks, links):
+        self.blocks = blocks
+        self.links = links
+
+
+def to_boolean(column, default):
+    """
+    Convert a csv column holding 1/0/True/False (or nothing) to booleans
+    """
+    values = column.astype(str).str.strip().str.lower().map(BOOLEAN_VALUES)
+    return values.where(values.notna(), default).astype(bool)
+
+
+def clean_blocks(frame):
+    """
+    Validate and clean the rows of a blocks csv. Rows without an id or a position are rejected.
+    """
+    if 'id' not in frame:
+        raise CAMImportError('The concepts file has no id column')
+    blocks = pd.DataFrame({'id': pd.to_numeric(frame['id'], errors='coerce')})
+    for column, default in BLOCK_DEFAULTS.items():
+        blocks[column] = frame[column] if column in frame else default
+    for column in BLOCK_NUMERIC:
+        blocks[column] = pd.to_numeric(blocks[column], errors='coerce')
+    invalid = blocks['id'].isna() | blocks['x_pos'].isna() | blocks['y_pos'].isna()
+    if invalid.any():
+        raise CAMImportError('Error in reading in concepts (rows %s)' % list(frame.index[invalid]))
+    for column in BLOCK_NUMERIC:
+        blocks[column] = blocks[column].fillna(BLOCK_DEFAULTS[column])
+    blocks['id'] = blocks['id'].astype(int)
+    # Numbers are unique within a CAM: repeated ones are moved after the largest
+    repeated = blocks['num'].duplicated()
+    if repeated.any():
+        blocks.loc[repeated, 'num'] = blocks['num'].max() + np.arange(1, repeated.sum() + 1)
+    blocks['title'] = blocks['title'].fillna('').astype(str)
+    shapes = [choice for choice, label in Block.shape_choices]
+    blocks['shape'] = blocks['shape'].where(blocks['shape'].isin(shapes), 'neutral')
+    # Clean up Comments ('none' -> '')
+    comments = blocks['comment'].fillna('').astype(str)
+    blocks['comment'] = comments.where(~comments.str.lower().isin(['none', 'nan']), '')
+    blocks['timestamp'] = blocks['timestamp'].astype(object).where(blocks['timestamp'].notna(), None)
+    blocks['modifiable'] = to_boolean(blocks['modifiable'], True)
+    blocks['resizable'] = to_boolean(blocks['resizable'], False)
+    return blocks
+
+
+def clean_links(frame, block_ids):
+    """
+    Validate and clean the rows of a links csv. Links must connect two blocks of the same file.
+    """
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=['starting_block', 'ending_block'] + list(LINK_DEFAULTS))
+    if 'starting_block' not in frame or 'ending_block' not in frame:
+        raise CAMImportError('The links file has no starting_block or ending_block column')
+    links = pd.DataFrame({column: pd.to_numeric(frame[column], errors='coerce')
+                          for column in ('starting_block', 'ending_block')})
+    for column, default in LINK_DEFAULTS.items():
+        links[column] = frame[column] if column in frame else default
+    invalid = ~(links['starting_block'].isin(block_ids) & links['ending_block'].isin(block_ids))
+    if invalid.any():
+        raise CAMImportError('Error in reading in links (rows %s)' % list(frame.index[invalid]))
+    links[['starting_block', 'ending_block']] = links[['starting_block', 'ending_block']].astype(int)
+    styles = [choice for choice, label in Link.line_style_choices]
+    links['line_style'] = links['line_style'].where(links['line_style'].isin(styles), 'Solid-Weak')
+    arrows = [choice for choice, label in Link.arrow_choices]
+    links['arrow_type'] = links['arrow_type'].where(links['arrow_type'].isin(arrows), 'none')
+    links['num'] = pd.to_numeric(links['num'], errors='coerce').fillna(0).astype(int)
+    links['timestamp'] = links['timestamp'].astype(object).where(links['timestamp'].notna(), None)
+    return links
+
+
+def read_cam_zip(file):
+    """
+    Read a CAM zip file (path or file object) without extracting it to disk
+    """
+    frames = {}
+    try:
+        with ZipFile(file) as z:
+            for filename in z.namelist():
+                if filename.endswith('.csv'):
+                    with z.open(filename) as member:
+                        frames['blocks' if 'blocks' in filename else 'links'] = pd.read_csv(member)
+    except (BadZipFile, pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as error:
+        raise CAMImportError('Could not read the CAM file: %s' % error)
+    if 'blocks' not in frames:
+        raise CAMImportError('The CAM file does not contain a blocks csv')
+    blocks = clean_blocks(frames['blocks'])
+    return CAMTemplate(blocks, clean_links(frames.get('links'), blocks['id']))
+
+
+def assign_ids(objects, queryset):
+    """
+    Set the primary keys of objects inserted with bulk_create on backends that do not return them. The objects are the
+    most recent rows of the queryset and were inserted in order.
+    """
+    if objects and objects[0].pk is None:
+        ids = list(queryset.order_by('-id').values_list('id', flat=True)[:len(objects)])
+        for obj, id_ in zip(objects, reversed(ids)):
+            obj.pk = id_
+
+
+def project_template(project):
+    """
+    Return the parsed initial CAM of a project, or None if the project does not have one. The parsed template is cached
+    under the name of the stored file, which changes whenever a new initial CAM is uploaded.
+    """
+    if not project.Initial_CAM:
+        return None
+    key = 'cam_template_%s' % project.Initial_CAM.name
+    template = cache.get(key)
+    if template is None:
+        with project.Initial_CAM.open('rb') as initial_cam:
+            template = read_cam_zip(initial_cam)
+        cache.set(key, template, getattr(settings, 'CAM_TEMPLATE_CACHE_TIMEOUT', 3600))
+    return template
+
+
+def seed_cams(template, cams, deletable=False):
+    """
+    Write the blocks and links of a template into several CAMs at once, with one bulk insert for all blocks and one
+    for all links. cams is a list of (cam, user) pairs; user becomes the creator of the CAM's blocks and links.
+    """
+    blocks = []
+    for cam, user in cams:
+        for row in template.blocks.to_dict('records'):
+            row.pop('id')
+            if deletable:
+                row['modifiable'] = False
+            blocks.append(Block(creator=user, CAM=cam, **row))
+    Block.objects.bulk_create(blocks)
+    assign_ids(blocks, Block.objects.filter(CAM__in=[cam for cam, user in cams]))
+    # Reconnect the links to the new blocks of each CAM
+    links = []
+    template_ids = list(template.blocks['id'])
+    for index, (cam, user) in enumerate(cams):
+        cam_blocks = blocks[index * len(template_ids):(index + 1) * len(template_ids)]
+        new_ids = dict(zip(template_ids, (block.id for block in cam_blocks)))
+        for row in template.links.to_dict('records'):
+            row['starting_block_id'] = new_ids[row.pop('starting_block')]
+            row['ending_block_id'] = new_ids[row.pop('ending_block')]
+            links.append(Link(creator=user, CAM=cam, **row))
+    Link.objects.bulk_create(links)
+    CAM.bump_version([cam.id for cam, user in cams])
+    # Every CAM received the same concepts and links
+    CAMStats.add([cam.id for cam, user in cams], shapes=count_changes(added=template.blocks['shape']),
+                 line_styles=count_changes(added=template.links['line_style']))
+    return blocks, links
+
+
+def import_cam(template, cam, user, deletable=False, clear=True):
+    """
+    Write the blocks and links of a template into a CAM. The creator of every block and link is set to user, and the
+    blocks are locked against modification if deletable is set. Unless clear is False (e.g. for a CAM that was just
+    created), the current contents of the CAM are removed first and the import is journaled so that it can be undone.
+    """
+    with transaction.atomic():
+        if not clear:
+            return seed_cams(template, [(cam, user)], deletable)
+        # Clear all current blocks and links
+        operations = delete_contents(cam.id)
+        blocks, links = seed_cams(template, [(cam, user)], deletable)
+        operations += [operation(obj, after=snapshot(obj)) for obj in blocks + links]
+        record(cam.id, logCamActions.ADD, logCamActions.BLOCK, operations)
+        return blocks, links
@@ -0,0 +1,141 @@
+"""
+Lightweight background jobs. Operations that can take minutes (creating the participants of a project, exporting all
+CAMs of a project) are stored as rows of the Job table by the view and run by a worker process
+(`python manage.py run_jobs`), so the request returns immediately and the project page polls the job's progress
+(see users/views_jobs.py). No external broker is needed.
+
+Handlers are registered with the `handler` decorator. A handler receives the Job, may report progress with
+job.set_progress and returns either None or a (filename, content) pair which is stored as the job's result file. The
+content is either bytes or an iterable of chunks of bytes.
+
+If JOB_QUEUE_ENABLED is not set (e.g. when developing without a worker), jobs are run as soon as they are queued.
+"""
+import tempfile
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.utils import timezone
+from users.models import Job
+from .importer import project_template, CAMImportError
+from .provisioning import provision_participants
+from .exporter import stream_zip, project_members, analysis_members, export_since
+
+
+JOB_HANDLERS = {}  # kind -> handler
+
+
+def handler(kind):
+    """
+    Register a function as the handler of a kind of job
+    """
+    def register(function):
+        JOB_HANDLERS[kind] = function
+        return function
+    return register
+
+
+def enqueue(kind, owner, project=None, **params):
+    """
+    Queue a job and return it. The job is run straight away if the job queue is disabled.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError('Unknown job %s' % kind)
+    job = Job.objects.create(kind=kind, owner=owner, project=project, params=params)
+    if not getattr(settings, 'JOB_QUEUE_ENABLED', False):
+        Job.objects.filter(id=job.id).update(status=Job.RUNNING, started=timezone.now())
+        job.refresh_from_db()
+        run_job(job)
+    return job
+
+
+def claim_next():
+    """
+    Take the oldest queued job, or return None if there is nothing to do. A job is only claimed by the worker whose
+    update changed its status, so several workers can share the queue.
+    """
+    while True:
+        job_id = Job.objects.filter(status=Job.QUEUED).order_by('id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        if Job.objects.filter(id=job_id, status=Job.QUEUED).update(status=Job.RUNNING, started=timezone.now()):
+            return Job.objects.get(id=job_id)
+
+
+def run_job(job):
+    """
+    Run a claimed job and record its outcome
+    """
+    try:
+        result = JOB_HANDLERS[job.kind](job)
+        if result is not None:
+            filename, content = result
+            if isinstance(content, bytes):
+                job.result.save(filename, ContentFile(content), save=False)
+            else:
+                with tempfile.TemporaryFile() as file:
+                    for chunk in content:
+                        file.write(chunk)
+                    job.result.save(filename, File(file), save=False)
+        job.status = Job.DONE
+        job.progress = 100
+    except Exception as error:
+        print('Error in job %s (%s)' % (job.id, job.kind))
+        print(error)
+        job.status = Job.FAILED
+        job.message = str(error)[:500]
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'progress', 'message', 'params', 'result', 'finished'])
+    return job
+
+
+@handler('create_participants')
+def create_participants(job):
+    """
+    Create the participants of a project and copy the project's initial CAM into their CAMs
+    """
+    job.set_progress(0, 'Reading the initial CAM')
+    try:
+        template = project_template(job.project)
+    except (CAMImportError, OSError) as error:
+        print(error)
+        template = None
+    job.set_progress(10, 'Creating participants')
+    provision_participants(job.project, job.owner.researcher, job.params['num_part'], job.params['call_id'],
+                           job.params.get('language_pref'), template, deletable=job.params.get('deletable', False))
+    job.message = '%s participants created' % job.params['num_part']
+
+
+def report_export(job):
+    """
+    Progress callback for the project exports
+    """
+    return lambda ct, total: job.set_progress(100 * ct / total, 'Exported %i of %i CAMs' % (ct, total))
+
+
+@handler('export_project')
+def export_project(job):
+    """
+    Zip file with the blocks and links of every CAM of a project (see views_Project.download_project)
+    """
+    token = timezone.now().isoformat()
+    members = project_members(job.project, '{username}_{cam_id}_{name}.csv', images=True, render=True,
+                              progress=report_export(job), since=export_since(job.params.get('since')), token=token)
+    job.params['token'] = token  # since of the next incremental export
+    return job.project.name + '_CAM.zip', stream_zip(members)
+
+
+@handler('export_initial_cams')
+def export_initial_cams(job):
+    """
+    Zip file with the blocks and links of every CAM of a project named after their users (see views_CAM.initial_cam)
+    """
+    members = project_members(job.project, '{username}_{name}.csv', progress=report_export(job))
+    return job.owner.username + '_CAM.zip', stream_zip(members)
+
+
+@handler('export_project_analysis')
+def export_project_analysis(job):
+    """
+    Columnar files with the blocks and links of all CAMs of a project (see views_Project.download_project_data)
+    """
+    job.set_progress(0, 'Exporting blocks and links')
+    return job.project.name + '_data.zip', stream_zip(analysis_members(job.project, job.params.get('format')))
@@ -0,0 +1,202 @@
+"""
+Undo and redo of the edits of a CAM. Every user action (adding, updating, moving or deleting blocks and links) is
+recorded as one logCamActions row holding the list of its operations, each with the state of the object before and
+after the action:
+
+    {'model': 'block' or 'link', 'id': <id of the object>, 'before': {field: value} or None, 'after': {...} or None}
+
+A missing before (after) means the object was added (deleted). Undoing an action writes back the before states of its
+operations in reverse order and redoing it writes the after states again. Deleted objects are restored with their
+original ids, so links still refer to the blocks they joined.
+
+The journal of a CAM is a bounded ring: only the last JOURNAL_SIZE actions are kept, and recording a new action drops
+the undone actions (which can no longer be redone). Actions are numbered per CAM (actionId) and looked up through the
+(camId, actionId) index, so undo and redo do not depend on the size of the journal.
+
+Consecutive moves of the same block are journaled as one action (record_move), so that dragging a block around is
+undone in one step and does not write a new action on every drop.
+
+Clearing a CAM (clear_cam) deletes its links and then its blocks and is journaled as a single action, so that it can
+be undone like any other edit.
+"""
+import datetime
+from django.db import transaction
+from django.db.models import Max, Q
+from block.models import Block
+from link.models import Link
+from users.models import CAM, CAMStats, count_changes, logCamActions
+
+JOURNAL_SIZE = 50  # Actions kept per CAM
+MODELS = {'block': Block, 'link': Link}
+COUNTED = {'block': 'shape', 'link': 'line_style'}  # Fields counted by CAMStats
+
+
+def json_value(value):
+    """
+    JSON serializable value of a block or link field
+    """
+    if isinstance(value, datetime.datetime):  # Timestamps are TimeFields but are sometimes given a datetime
+        value = value.time()
+    if isinstance(value, datetime.time):
+        return value.isoformat()
+    return value
+
+
+def snapshot(obj, fields=None):
+    """
+    State of a block or link as a dictionary of column values (all columns but the id by default)
+    """
+    if fields is None:
+        fields = [field.attname for field in obj._meta.concrete_fields if field.attname != 'id']
+    return {field: json_value(getattr(obj, field)) for field in fields}
+
+
+def operation(obj, before=None, after=None):
+    """
+    Operation on a block or link. For updates only the fields whose value changed are kept.
+    """
+    if before is not None and after is not None:
+        changed = [field for field in after if before.get(field) != after[field]]
+        before = {field: before.get(field) for field in changed}
+        after = {field: after[field] for field in changed}
+    return {'model': obj._meta.model_name, 'id': obj.pk, 'before': before, 'after': after}
+
+
+def record(cam_id, action_type, obj_type, operations):
+    """
+    Record an action in the journal of a CAM.
+
+    Parameters
+    ----------
+    cam_id : int
+        The id of the CAM.
+    action_type : int
+        logCamActions.ADD, UPDATE, MOVE or DELETE.
+    obj_type : int
+        logCamActions.BLOCK or LINK, the kind of object the action is about.
+    operations : list of dict
+        The operations of the action (see operation).
+    """
+    operations = [op for op in operations if op['before'] != op['after']]
+    if not operations:
+        return None
+    with transaction.atomic():
+        # Actions of the same CAM are numbered one after the other: the row of the CAM is locked until the action is
+        # written, so concurrent requests cannot take the same actionId
+        list(CAM.objects.select_for_update().filter(id=cam_id).values_list('id', flat=True))
+        last = logCamActions.objects.filter(camId_id=cam_id).aggregate(last=Max('actionId'))['last']
+        action_id = 0 if last is None else last + 1
+        action = logCamActions.objects.create(camId_id=cam_id, actionId=action_id, actionType=action_type,
+                                              objType=obj_type, objDetails=operations)
+        logCamActions.objects.filter(camId_id=cam_id).filter(
+            Q(undone=True) | Q(actionId__lte=action_id - JOURNAL_SIZE)
+        ).delete()
+    return action
+
+
+def record_move(cam_id, op):
+    """
+    Record the move of a block in the journal of a CAM. Consecutive moves of the same block are one action: while the
+    last action of the CAM is still the move of that block, its after state is updated in place (one query to find it
+    and one UPDATE) instead of journaling every drag.
+    """
+    if op['before'] == op['after']:
+        return None
+    last = logCamActions.objects.filter(camId_id=cam_id).order_by('-actionId').first()
+    if (last is not None and not last.undone and last.actionType == logCamActions.MOVE and len(last.objDetails) == 1
+            and (last.objDetails[0]['model'], last.objDetails[0]['id']) == (op['model'], op['id'])):
+        previous = last.objDetails[0]
+        # The first move of the series keeps the state the block had before it
+        last.objDetails = [dict(op, before={**op['before'], **previous['before']},
+                                after={**previous['after'], **op['after']})]
+        # Not written if the action was undone meanwhile
+        if logCamActions.objects.filter(id=last.id, undone=False).update(objDetails=last.objDetails):
+            return last
+    return record(cam_id, logCamActions.MOVE, logCamActions.BLOCK, [op])
+
+
+def replay(operations, side):
+    """
+    Write the before or after state of operations to the database
+    """
+    other = 'after' if side == 'before' else 'before'
+    for op in operations:
+        model = MODELS[op['model']]
+        if op[side] is None:
+            model.objects.filter(id=op['id']).delete()
+        elif op[other] is None:
+            model.objects.bulk_create([model(id=op['id'], **op[side])])
+        else:
+            model.objects.filter(id=op['id']).update(**op[side])
+
+
+def count_operations(cam_id, operations, side):
+    """
+    Update the CAMStats of a CAM once its operations have been written with their `side` state ('before' or 'after')
+    """
+    other = 'before' if side == 'after' else 'after'
+    values = {model: ([], []) for model in COUNTED}  # Values removed and added
+    for op in operations:
+        field = COUNTED[op['model']]
+        for state, changed in ((op[other], values[op['model']][0]), (op[side], values[op['model']][1])):
+            if state is not None and field in state:
+                changed.append(state[field])
+    CAMStats.add(cam_id, shapes=count_changes(*values['block']), line_styles=count_changes(*values['link']))
+
+
+def undo(cam_id):
+    """
+    Undo the last action of a CAM which has not been undone. Returns the action, or None if there is nothing to undo.
+    """
+    with transaction.atomic():
+        action = logCamActions.objects.filter(camId_id=cam_id, undone=False).order_by('-actionId').first()
+        if action is None:
+            return None
+        replay(reversed(action.objDetails), 'before')
+        action.undone = True
+        action.save(update_fields=['undone'])
+        CAM.bump_version(cam_id)
+        count_operations(cam_id, action.objDetails, 'before')
+    return action
+
+
+def redo(cam_id):
+    """
+    Redo the first undone action of a CAM. Returns the action, or None if there is nothing to redo.
+    """
+    with transaction.atomic():
+        action = logCamActions.objects.filter(camId_id=cam_id, undone=True).order_by('actionId').first()
+        if action is None:
+            return None
+        replay(action.objDetails, 'after')
+        action.undone = False
+        action.save(update_fields=['undone'])
+        CAM.bump_version(cam_id)
+        count_operations(cam_id, action.objDetails, 'after')
+    return action
+
+
+def delete_contents(cam_id):
+    """
+    Delete every link and block of a CAM, update its CAMStats and return the operations undoing it. The links go first
+    with a single DELETE, so deleting the blocks finds no links left to cascade to.
+    """
+    links = Link.objects.filter(CAM_id=cam_id)
+    blocks = Block.objects.filter(CAM_id=cam_id)
+    operations = ([operation(link, before=snapshot(link)) for link in links]
+                  + [operation(block, before=snapshot(block)) for block in blocks])
+    links.delete()
+    blocks.delete()
+    count_operations(cam_id, operations, 'after')
+    return operations
+
+
+def clear_cam(cam_id):
+    """
+    Remove all the blocks and links of a CAM as a single action of its journal. Returns the action, or None if the
+    CAM was already empty.
+    """
+    with transaction.atomic():
+        operations = delete_contents(cam_id)
+        CAM.bump_version(cam_id)
+        return record(cam_id, logCamActions.DELETE, logCamActions.BLOCK, operations)
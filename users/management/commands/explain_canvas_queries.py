@@ -0,0 +1,48 @@
+"""
+Show the query plans and timings of the lookups run on every canvas edit (see block.views and link.views), e.g. to
+check that they use the (CAM, num) and (CAM, starting_block)/(CAM, ending_block) indexes before and after migrating
+
+    python manage.py explain_canvas_queries [--cam <id>] [--repeat <n>]
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+from block.models import Block
+from link.models import Link
+from users.models import CAM
+
+
+def canvas_queries(cam_id, block):
+    """
+    The canvas lookups for a block of a CAM, as (name, queryset)
+    """
+    links = Link.objects.filter(CAM_id=cam_id)
+    return [
+        ('block by number', Block.objects.filter(CAM_id=cam_id, num=block.num)),
+        ('links of a block', links.filter(Q(starting_block=block.id) | Q(ending_block=block.id))),
+        ('links of a block by number', links.filter(Q(starting_block__num=block.num) | Q(ending_block__num=block.num))),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Explain and time the queries of the canvas hot path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cam', type=int, default=None, help='Id of the CAM (defaults to the largest one)')
+        parser.add_argument('--repeat', type=int, default=100, help='Number of times each query is timed')
+
+    def handle(self, *args, **options):
+        cam_id = options['cam']
+        if cam_id is None:
+            cam_id = CAM.objects.annotate(blocks=Count('block')).order_by('-blocks').values_list('id', flat=True).first()
+        block = Block.objects.filter(CAM_id=cam_id).order_by('-num').first()
+        if block is None:
+            raise CommandError('There is no CAM with concepts to explain the queries with')
+        self.stdout.write('CAM %i, block %s (%i blocks and %i links in total)'
+                          % (cam_id, block.num, Block.objects.count(), Link.objects.count()))
+        for name, queryset in canvas_queries(cam_id, block):
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(queryset.all())
+            elapsed = (time.perf_counter() - start) / options['repeat']
+            self.stdout.write('\n%s: %.3f ms\n%s' % (name, 1000 * elapsed, queryset.explain()))
@@ -0,0 +1,30 @@
+"""
+Count the concepts and links of every CAM again (see users.models.CAMStats), e.g. after the table was added
+
+    python manage.py rebuild_cam_stats [--project <id or name>]
+"""
+from django.core.management.base import BaseCommand, CommandError
+from users.models import CAM, CAMStats, Project
+
+BATCH_SIZE = 500  # CAMs refreshed at a time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the statistics of the CAMs of a project, or of all CAMs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', default=None, help='Id or name of the project')
+
+    def handle(self, *args, **options):
+        cams = CAM.objects.order_by('id')
+        if options['project'] is not None:
+            project = Project.objects.filter(name=options['project']).first()
+            if project is None and options['project'].isdigit():
+                project = Project.objects.filter(id=int(options['project'])).first()
+            if project is None:
+                raise CommandError('Project %s does not exist' % options['project'])
+            cams = cams.filter(project=project)
+        cam_ids = list(cams.values_list('id', flat=True))
+        for start in range(0, len(cam_ids), BATCH_SIZE):
+            CAMStats.refresh(cam_ids[start:start + BATCH_SIZE])
+        self.stdout.write('Rebuilt the statistics of %i CAMs' % len(cam_ids))
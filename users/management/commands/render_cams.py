@@ -0,0 +1,29 @@
+"""
+Render the image of every CAM of a project on the server
+
+    python manage.py render_cams --project <id or name> [--workers 4] [--force]
+"""
+from django.core.management.base import BaseCommand, CommandError
+from users.models import Project
+from users.cam_images import render_project
+
+
+class Command(BaseCommand):
+    help = 'Render the images of the CAMs of a project whose content changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', required=True, help='Id or name of the project')
+        parser.add_argument('--workers', type=int, default=None, help='Number of rendering processes')
+        parser.add_argument('--force', action='store_true', help='Render every CAM, even if its image is up to date')
+        parser.add_argument('--scale', type=float, default=1.0, help='Pixels per canvas unit')
+        parser.add_argument('--max-size', type=int, default=None, help='Largest width or height of the images')
+
+    def handle(self, *args, **options):
+        project = Project.objects.filter(name=options['project']).first()
+        if project is None and options['project'].isdigit():
+            project = Project.objects.filter(id=int(options['project'])).first()
+        if project is None:
+            raise CommandError('Project %s does not exist' % options['project'])
+        drawn, skipped = render_project(project, options['workers'], options['force'], options['scale'],
+                                        options['max_size'])
+        self.stdout.write('Rendered %i CAMs of %s (%i unchanged)' % (drawn, project.name, skipped))
@@ -0,0 +1,43 @@
+"""
+Worker for the background jobs of users/jobs.py
+
+    python manage.py run_jobs            # Run jobs until stopped
+    python manage.py run_jobs --once     # Run the queued jobs and exit
+"""
+import datetime
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from users.jobs import claim_next, run_job
+from users.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--keep-days', type=int, default=7, help='Remove finished jobs older than this')
+
+    def handle(self, *args, **options):
+        while True:
+            self.purge(options['keep_days'])
+            job = claim_next()
+            while job is not None:
+                run_job(job)
+                self.stdout.write('Job %s (%s): %s' % (job.id, job.kind, job.status))
+                job = claim_next()
+            if options['once']:
+                return
+            time.sleep(options['sleep'])
+
+    def purge(self, keep_days):
+        """
+        Delete old finished jobs together with their result files
+        """
+        cutoff = timezone.now() - datetime.timedelta(days=keep_days)
+        for job in Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished__lt=cutoff):
+            if job.result:
+                job.result.delete(save=False)
+            job.delete()
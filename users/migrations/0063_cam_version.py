@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:17
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0062_auto_20211027_2349'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cam',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='cam',
+            name='creation_date',
+            field=models.CharField(default=datetime.datetime(2026, 10, 18, 18, 17, 31, 615748), max_length=100, verbose_name='Date'),
+        ),
+        migrations.AlterField(
+            model_name='logcamactions',
+            name='objDetails',
+            field=models.CharField(max_length=500),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:24
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0063_cam_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cam',
+            name='creation_date',
+            field=models.CharField(default=datetime.datetime(2026, 10, 18, 19, 24, 29, 258506), max_length=100, verbose_name='Date'),
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10)),
+                ('progress', models.IntegerField(default=0)),
+                ('message', models.CharField(blank=True, default='', max_length=500)),
+                ('result', models.FileField(blank=True, default='', upload_to='jobs/')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='users.project')),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:31
+
+import datetime
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0064_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cam',
+            name='updated',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='cam',
+            name='creation_date',
+            field=models.CharField(default=datetime.datetime(2026, 10, 18, 19, 31, 37, 384827), max_length=100, verbose_name='Date'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:47
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0065_cam_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CAMStats',
+            fields=[
+                ('cam', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='users.cam')),
+                ('concepts', models.IntegerField(default=0)),
+                ('links', models.IntegerField(default=0)),
+                ('shape_counts', models.JSONField(default=dict)),
+                ('line_style_counts', models.JSONField(default=dict)),
+                ('mean_valence', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='cam',
+            name='creation_date',
+            field=models.CharField(default=datetime.datetime(2026, 10, 18, 18, 47, 13, 61338), max_length=100, verbose_name='Date'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:51
+
+import datetime
+from django.db import migrations, models
+
+
+def clear_log(apps, schema_editor):
+    """
+    The old log rows hold python reprs (not JSON) and several rows per action: they cannot be converted
+    """
+    apps.get_model('users', 'logCamActions').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0066_camstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_log, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='logcamactions',
+            name='undone',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='cam',
+            name='creation_date',
+            field=models.CharField(default=datetime.datetime(2026, 10, 18, 18, 51, 32, 797828), max_length=100, verbose_name='Date'),
+        ),
+        migrations.AlterField(
+            model_name='logcamactions',
+            name='objDetails',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddConstraint(
+            model_name='logcamactions',
+            constraint=models.UniqueConstraint(fields=('camId', 'actionId'), name='unique_cam_action'),
+        ),
+    ]
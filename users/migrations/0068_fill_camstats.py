@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500  # CAMs counted at a time
+VALENCE = {'negative strong': -3.0, 'negative': -2.0, 'negative weak': -1.0, 'neutral': 0.0, 'ambivalent': 0.0,
+           'positive weak': 1.0, 'positive': 2.0, 'positive strong': 3.0}
+
+
+def fill_stats(apps, schema_editor):
+    """
+    Count the concepts and links of the CAMs which have no statistics yet (all of them when the table was added)
+    """
+    CAM, CAMStats = apps.get_model('users', 'CAM'), apps.get_model('users', 'CAMStats')
+    Block, Link = apps.get_model('block', 'Block'), apps.get_model('link', 'Link')
+    cam_ids = list(CAM.objects.filter(stats__isnull=True).order_by('id').values_list('id', flat=True))
+    for start in range(0, len(cam_ids), BATCH_SIZE):
+        stats = {cam_id: CAMStats(cam_id=cam_id, shape_counts={}, line_style_counts={})
+                 for cam_id in cam_ids[start:start + BATCH_SIZE]}
+        for model, field, counts in ((Block, 'shape', 'shape_counts'), (Link, 'line_style', 'line_style_counts')):
+            rows = model.objects.filter(CAM_id__in=stats).values('CAM_id', field).annotate(count=models.Count('id'))
+            for row in rows.order_by():
+                getattr(stats[row['CAM_id']], counts)[row[field]] = row['count']
+        for cam_stats in stats.values():
+            cam_stats.concepts = sum(cam_stats.shape_counts.values())
+            cam_stats.links = sum(cam_stats.line_style_counts.values())
+            valences = [(VALENCE[shape], count) for shape, count in cam_stats.shape_counts.items() if shape in VALENCE]
+            if valences:
+                cam_stats.mean_valence = (sum(valence * count for valence, count in valences)
+                                          / sum(count for valence, count in valences))
+        CAMStats.objects.bulk_create(stats.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0067_journal'),
+        ('block', '0029_canvas_indexes'),
+        ('link', '0016_canvas_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,122 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:22
+
+import datetime
+from django.db import migrations, models
+
+BATCH_SIZE = 500  # CAMs converted at a time
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Move the counts of each shape and line style into their own columns
+    """
+    CAMStats = apps.get_model('users', 'CAMStats')
+    cam_ids = list(CAMStats.objects.order_by('cam_id').values_list('cam_id', flat=True))
+    for start in range(0, len(cam_ids), BATCH_SIZE):
+        stats = list(CAMStats.objects.filter(cam_id__in=cam_ids[start:start + BATCH_SIZE]))
+        for cam_stats in stats:
+            for shape, count in cam_stats.shape_counts.items():
+                setattr(cam_stats, shape.replace(' ', '_'), count)
+            for style, count in cam_stats.line_style_counts.items():
+                setattr(cam_stats, style.lower().replace('-', '_'), count)
+        CAMStats.objects.bulk_update(stats, ['negative_strong', 'negative', 'negative_weak', 'neutral', 'ambivalent',
+                                             'positive_weak', 'positive', 'positive_strong', 'solid', 'solid_strong',
+                                             'solid_weak', 'dashed', 'dashed_strong', 'dashed_weak'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0068_fill_camstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camstats',
+            name='ambivalent',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='dashed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='dashed_strong',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='dashed_weak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='negative',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='negative_strong',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='negative_weak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='neutral',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='positive',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='positive_strong',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='positive_weak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='solid',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='solid_strong',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='camstats',
+            name='solid_weak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='cam',
+            name='creation_date',
+            field=models.CharField(default=datetime.datetime(2026, 10, 18, 19, 22, 37, 604049), max_length=100, verbose_name='Date'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='camstats',
+            name='line_style_counts',
+        ),
+        migrations.RemoveField(
+            model_name='camstats',
+            name='mean_valence',
+        ),
+        migrations.RemoveField(
+            model_name='camstats',
+            name='shape_counts',
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:25
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0069_camstats_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cam',
+            name='image_version',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='cam',
+            name='creation_date',
+            field=models.CharField(default=datetime.datetime(2026, 10, 18, 19, 25, 55, 58073), max_length=100, verbose_name='Date'),
+        ),
+    ]
@@ -2,10 +2,12 @@
 from django_mysql.models import ListCharField
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 import datetime
+from collections import Counter
 from django.utils import timezone
 
 class CustomUser(AbstractUser):
@@ -71,10 +73,26 @@ class CAM(models.Model):
     )
     creation_date = models.CharField(_("Date"), max_length=100, default=datetime.datetime.now())  # Create time log for creation of CAM
     description = models.CharField(max_length=500, blank=True, default=' ', null=True)
+    version = models.IntegerField(default=0)  # Bumped on every write to the CAM's blocks or links
+    updated = models.DateTimeField(default=timezone.now)  # Time of the last write to the CAM's blocks or links
+    image_version = models.IntegerField(null=True, blank=True)  # Version of the CAM its image was drawn for
 
     def __str__(self):
         return f"Name: {self.name}"
 
+    @staticmethod
+    def bump_version(cam_id):
+        """Increase the version of a CAM and record the time after its blocks or links have changed. The writes which
+        change the number of concepts or links also update the CAMStats (see CAMStats.add).
+
+        Parameters
+        ----------
+        cam_id : int or list of int
+            The id of the CAM, or the ids of several CAMs.
+        """
+        cam_ids = cam_id if isinstance(cam_id, (list, tuple, set)) else [cam_id]
+        CAM.objects.filter(id__in=cam_ids).update(version=models.F('version') + 1, updated=timezone.now())
+
     def update(self, form_info):
         """Update the model.
 
@@ -127,8 +145,173 @@ class Contact(models.Model):
 
 
 class logCamActions(models.Model):
+    """
+    Journal of the actions on a CAM, for undo and redo (see users/journal.py)
+    """
+    DELETE, ADD, UPDATE, MOVE = 0, 1, 2, 3  # Types of action
+    LINK, BLOCK = 0, 1  # Types of object
     camId = models.ForeignKey(CAM, on_delete=models.CASCADE, default='',blank=False) # Which CAM the action took place
-    actionId = models.IntegerField(blank=False) # Counter to organize the order of actions
-    actionType = models.IntegerField(blank=False) # is the action a deletion? ( = 0 )
+    actionId = models.IntegerField(blank=False) # Counter to organize the order of actions (per CAM)
+    actionType = models.IntegerField(blank=False) # Deletion ( = 0 ), addition ( = 1 ), update ( = 2 ) or move ( = 3 )
     objType = models.IntegerField(blank=False) # Is the object a link ( = 0 ) and a block ( = 1 )
-    objDetails = models.CharField(max_length=500,blank=False) # Details of the object in a python dictionary
+    objDetails = models.JSONField(default=list) # Operations of the action with the states before and after it
+    undone = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['camId', 'actionId'], name='unique_cam_action')]
+
+
+class Job(models.Model):
+    """
+    Long-running operation (participant creation, project exports, imports) queued by a view and run by the
+    `run_jobs` management command. See users/jobs.py
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    status_choices = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+    kind = models.CharField(max_length=50)  # Name of the handler registered in users/jobs.py
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, blank=True, null=True)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=status_choices, default=QUEUED, db_index=True)
+    progress = models.IntegerField(default=0)  # Percentage
+    message = models.CharField(max_length=500, blank=True, default='')
+    result = models.FileField(upload_to='jobs/', blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Job: {self.kind} ({self.status})"
+
+    def set_progress(self, progress, message=''):
+        """Record the progress of a running job so that it can be polled.
+
+        Parameters
+        ----------
+        progress : int
+            Percentage of the work done.
+        message : str
+            Short description of the current step.
+        """
+        self.progress = int(progress)
+        self.message = message[:500]
+        Job.objects.filter(id=self.id).update(progress=self.progress, message=self.message)
+
+
+# Valence of each concept shape on a -3 (strongly negative) to 3 (strongly positive) scale
+VALENCE = {'negative strong': -3.0, 'negative': -2.0, 'negative weak': -1.0, 'neutral': 0.0, 'ambivalent': 0.0,
+           'positive weak': 1.0, 'positive': 2.0, 'positive strong': 3.0}
+
+
+# Line styles of links (see Link.line_style_choices)
+LINE_STYLES = ('Solid', 'Solid-Strong', 'Solid-Weak', 'Dashed', 'Dashed-Strong', 'Dashed-Weak')
+# Column of CAMStats counting each shape and line style
+SHAPE_FIELDS = {shape: shape.replace(' ', '_') for shape in VALENCE}
+LINE_STYLE_FIELDS = {style: style.lower().replace('-', '_') for style in LINE_STYLES}
+
+
+def count_changes(removed=(), added=()):
+    """
+    Change of the counts of shapes (or line styles) when the values removed are replaced by the values added
+    """
+    counts = Counter(added)
+    counts.subtract(removed)
+    return counts
+
+
+class CAMStats(models.Model):
+    """
+    Counts of the concepts and links of a CAM, kept up to date by the block and link write paths (see add) so that the
+    progress of every participant of a project is read with one query. Each shape and line style has its own counter
+    column, so the writes only add to counters and never count the CAM again.
+    """
+    cam = models.OneToOneField(CAM, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    concepts = models.IntegerField(default=0)
+    links = models.IntegerField(default=0)
+    # Number of concepts of each shape
+    negative_strong = models.IntegerField(default=0)
+    negative = models.IntegerField(default=0)
+    negative_weak = models.IntegerField(default=0)
+    neutral = models.IntegerField(default=0)
+    ambivalent = models.IntegerField(default=0)
+    positive_weak = models.IntegerField(default=0)
+    positive = models.IntegerField(default=0)
+    positive_strong = models.IntegerField(default=0)
+    # Number of links of each line style
+    solid = models.IntegerField(default=0)
+    solid_strong = models.IntegerField(default=0)
+    solid_weak = models.IntegerField(default=0)
+    dashed = models.IntegerField(default=0)
+    dashed_strong = models.IntegerField(default=0)
+    dashed_weak = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"CAM: {self.cam_id}"
+
+    @property
+    def shape_counts(self):
+        return {shape: getattr(self, field) for shape, field in SHAPE_FIELDS.items() if getattr(self, field)}
+
+    @property
+    def line_style_counts(self):
+        return {style: getattr(self, field) for style, field in LINE_STYLE_FIELDS.items() if getattr(self, field)}
+
+    @property
+    def mean_valence(self):
+        counts = self.shape_counts
+        if not counts:
+            return None
+        return sum(VALENCE[shape] * count for shape, count in counts.items()) / sum(counts.values())
+
+    @classmethod
+    def add(cls, cam_id, shapes=None, line_styles=None):
+        """Add to the counters of CAMs, with one UPDATE.
+
+        Parameters
+        ----------
+        cam_id : int or list of int
+            The id of the CAM, or the ids of several CAMs which all change the same way.
+        shapes, line_styles : dict, optional
+            Change of the number of concepts of each shape and of links of each line style (see count_changes).
+        """
+        cam_ids = cam_id if isinstance(cam_id, (list, tuple, set)) else [cam_id]
+        changes = {}
+        for counts, total, fields in ((shapes, 'concepts', SHAPE_FIELDS), (line_styles, 'links', LINE_STYLE_FIELDS)):
+            counts = {value: count for value, count in (counts or {}).items() if count}
+            if sum(counts.values()):
+                changes[total] = models.F(total) + sum(counts.values())
+            for value, count in counts.items():
+                if value in fields:
+                    changes[fields[value]] = models.F(fields[value]) + count
+        if changes and cls.objects.filter(cam_id__in=cam_ids).update(**changes) < len(set(cam_ids)):
+            # Some CAMs have no statistics yet: count them (the write is already in the database)
+            cls.refresh(set(cam_ids) - set(cls.objects.filter(cam_id__in=cam_ids).values_list('cam_id', flat=True)))
+
+    @classmethod
+    def refresh(cls, cam_ids):
+        """Count the concepts and links of CAMs again (see the rebuild_cam_stats command).
+
+        Parameters
+        ----------
+        cam_ids : list of int
+            The ids of the CAMs.
+        """
+        Block, Link = apps.get_model('block', 'Block'), apps.get_model('link', 'Link')
+        with transaction.atomic():
+            # Refreshes of the same CAM run one after the other: the rows of the CAMs are locked until the new counts
+            # are written, so a concurrent refresh counts after them instead of inserting the same rows again
+            locked = CAM.objects.select_for_update().filter(id__in=cam_ids).order_by('id')
+            stats = {cam_id: cls(cam_id=cam_id) for cam_id in locked.values_list('id', flat=True)}
+            for model, field, total, fields in ((Block, 'shape', 'concepts', SHAPE_FIELDS),
+                                                (Link, 'line_style', 'links', LINE_STYLE_FIELDS)):
+                rows = model.objects.filter(CAM_id__in=stats).values('CAM_id', field).annotate(count=models.Count('id'))
+                for row in rows.order_by():
+                    cam_stats = stats[row['CAM_id']]
+                    setattr(cam_stats, total, getattr(cam_stats, total) + row['count'])
+                    if row[field] in fields:
+                        setattr(cam_stats, fields[row[field]], row['count'])
+            cls.objects.filter(cam_id__in=stats).delete()
+            cls.objects.bulk_create(stats.values())
@@ -0,0 +1,85 @@
+"""
+Create the participants of a project in bulk. Instead of validating one signup form per participant (which hashes each
+password in turn and issues a dozen queries per user), the accounts, participant profiles and CAMs are written with one
+bulk insert each. The passwords are hashed in a process pool since hashing is by far the most expensive step, and the
+initial CAM of the project is parsed once and stamped into every new CAM (see users/importer.py).
+"""
+import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from users.models import CustomUser, Participant, CAM, CAMStats
+from .importer import assign_ids, seed_cams
+
+
+def hash_passwords(passwords):
+    """
+    Hash a list of passwords. Lists shorter than PROVISIONING_POOL_THRESHOLD are hashed in this process, longer ones
+    are spread over PROVISIONING_WORKERS processes.
+    """
+    workers = getattr(settings, 'PROVISIONING_WORKERS', None) or os.cpu_count() or 1
+    if workers < 2 or len(passwords) < getattr(settings, 'PROVISIONING_POOL_THRESHOLD', 20):
+        return [make_password(password) for password in passwords]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(make_password, passwords, chunksize=max(1, len(passwords) // (4 * workers))))
+    except (OSError, BrokenProcessPool):  # No pool available, e.g. in a restricted container
+        return [make_password(password) for password in passwords]
+
+
+def provision_participants(project, researcher, num_part, call_id, language_pref, template=None, deletable=False):
+    """
+    Create num_part participants for a project, each with their own CAM.
+
+    Parameters
+    ----------
+    project : Project
+        The project the participants belong to.
+    researcher : Researcher
+        The researcher running the project.
+    num_part : int
+        Number of participants to create.
+    call_id : str
+        Naming convention: username = call_id+num and password = call_id+num+call_id.
+    language_pref : str
+        Language preference of the participants.
+    template : CAMTemplate, optional
+        Initial CAM copied into every participant's CAM.
+    deletable : bool
+        Lock the concepts of the initial CAM against modification.
+
+    Returns
+    -------
+    list of CustomUser
+        The new participants.
+    """
+    usernames = [call_id + str(user_num) for user_num in range(int(num_part))]
+    passwords = hash_passwords([username + call_id for username in usernames])
+    with transaction.atomic():
+        # Delete users if they currently exist
+        CustomUser.objects.filter(username__in=usernames).delete()
+        users = [CustomUser(username=username, email=username + '@test.com', password=password, first_name='',
+                            last_name='', language_preference=language_pref or 'en', is_participant=True)
+                 for username, password in zip(usernames, passwords)]
+        CustomUser.objects.bulk_create(users)
+        if users and users[0].pk is None:  # Backend could not return the new ids
+            ids = dict(CustomUser.objects.filter(username__in=usernames).values_list('username', 'id'))
+            for user in users:
+                user.pk = ids[user.username]
+        Participant.objects.bulk_create([Participant(user=user, researcher=researcher, project=project)
+                                         for user in users])
+        creation_date = datetime.datetime.now()
+        cams = [CAM(name=project.name, user=user, project=project, creation_date=creation_date) for user in users]
+        CAM.objects.bulk_create(cams)
+        assign_ids(cams, CAM.objects.filter(project=project))
+        CAMStats.objects.bulk_create([CAMStats(cam=cam) for cam in cams])  # Still empty (see seed_cams)
+        for user, cam in zip(users, cams):
+            user.active_cam_num = cam.id
+        CustomUser.objects.bulk_update(users, ['active_cam_num'])
+        # If we are given an initial import file add the concepts/links
+        if template is not None and cams:
+            seed_cams(template, list(zip(cams, users)), deletable)
+    return users
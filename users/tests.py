@@ -1,8 +1,39 @@
 from django.test import TestCase, override_settings
+from django.contrib.messages import get_messages
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from users.models import CustomUser, Researcher
 from django.urls import reverse
-from .models import Project
+from .models import Project, CAM
+from block.models import Block
+from link.models import Link
+from .cam_snapshot import CAMSnapshot, get_snapshot
+from django.core.cache import cache
+from .importer import read_cam_zip, CAMImportError
+from .views_CAM import upload_cam_participant
+from .provisioning import provision_participants
+from .jobs import enqueue
+from .models import Job, CAMStats
+from .exporter import stream_zip, project_members, pyarrow
+from .cam_images import current_images, render_project
+import pandas as pd
+from .Plots.DataToPlot import CAMData, render
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from unittest import mock
+import tempfile
+import os
+from io import StringIO
+from .resources import BlockResource, LinkResource
+from zipfile import ZipFile
+from io import BytesIO
 import requests
+import json
+import base64
+from PIL import Image as PILImage
+from xml.etree import ElementTree
+from .Plots.Vector import weasyprint
+from .analysis import project_metrics, project_concepts, normalize_title
 # Create your tests here.
 
 
@@ -71,6 +102,22 @@ class UserTestCase(TestCase):
         self.assertTrue(len(projects), 1)
         self.assertTrue(CustomUser.objects.get(username='T1'), 'T1')
 
+    def test_provision_participants(self):
+        """
+        Test that bulk provisioning creates working accounts with their own CAM and replaces existing users
+        """
+        CustomUser.objects.create_user(username='P0', password='old')
+        users = provision_participants(self.project, self.researcher, 3, 'P', 'de')
+        self.assertEqual([user.username for user in users], ['P0', 'P1', 'P2'])
+        for user in CustomUser.objects.filter(username__in=['P0', 'P1', 'P2']):
+            self.assertTrue(user.check_password(user.username + 'P'))
+            self.assertTrue(user.is_participant)
+            self.assertEqual(user.language_preference, 'de')
+            cam = CAM.objects.get(id=user.active_cam_num)
+            self.assertEqual((cam.user_id, cam.project_id), (user.id, self.project.id))
+            self.assertEqual(user.participant.project_id, self.project.id)
+        self.assertTrue(self.client.login(username='P1', password='P1P'))
+
     def test_project_link_test_1(self):
         """
         Test that a user is created with a new cam when using the project login link with cam_op=new
@@ -150,3 +197,730 @@ class UserTestCase(TestCase):
         participant.refresh_from_db()
         # Check that user has only one CAM
         self.assertEqual(len(participant.cam_set.all()), 2)
+
+
+class MutationTestCase(TestCase):
+    def setUp(self):
+        # Set up a user with a CAM containing two concepts
+        self.user = CustomUser.objects.create_user(username='testuser', email='test@test.test', password='12345')
+        self.client.login(username='testuser', password='12345')
+        self.cam = CAM.objects.create(name='testCAM', user=self.user)
+        self.block1 = Block.objects.create(title='Meow1', x_pos=1.0, y_pos=1.0, height=100, width=100,
+                                           creator=self.user, shape='negative', CAM=self.cam, num=1)
+        self.block2 = Block.objects.create(title='Meow2', x_pos=105.0, y_pos=105.0, height=100, width=100,
+                                           creator=self.user, shape='positive', CAM=self.cam, num=2)
+        self.url = reverse('cam_mutations', args=[self.cam.id])
+
+    def post_operations(self, operations):
+        return self.client.post(self.url, json.dumps({'operations': operations}), content_type='application/json')
+
+    def test_batch_add_and_move(self):
+        """
+        Test that a new concept, a link to it and a move are applied in a single request
+        """
+        response = self.post_operations([
+            {'op': 'add_block', 'num': 3, 'title': 'Meow3', 'shape': '5', 'x_pos': 10, 'y_pos': 10,
+             'width': 100, 'height': 100},
+            {'op': 'add_link', 'starting_block': 1, 'ending_block': 3, 'line_style': 'Dashed', 'arrow_type': 'uni'},
+            {'op': 'move_block', 'num': 1, 'x_pos': '50.0px', 'y_pos': '60.0px'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        block3 = self.cam.block_set.get(num=3)
+        self.assertEqual(results[0]['id'], block3.id)
+        self.assertEqual(block3.shape, 'positive')
+        link = self.cam.link_set.get()
+        self.assertEqual((link.starting_block_id, link.ending_block_id), (self.block1.id, block3.id))
+        self.assertEqual(results[1]['id'], link.id)
+        self.block1.refresh_from_db()
+        self.assertEqual((self.block1.x_pos, self.block1.y_pos), (50.0, 60.0))
+        self.assertEqual(results[2]['id'], [link.id])
+        self.assertEqual(results[2]['start_x'], [50.0])
+
+    def test_batch_link_operations(self):
+        """
+        Test updating, swapping and deleting links, and deleting a concept along with its links
+        """
+        link = Link.objects.create(starting_block=self.block1, ending_block=self.block2, creator=self.user,
+                                   CAM=self.cam)
+        response = self.post_operations([
+            {'op': 'update_link', 'link_id': link.id, 'line_style': 'Solid-Strong', 'arrow_type': 'bi'},
+            {'op': 'swap_link', 'link_id': link.id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        link.refresh_from_db()
+        self.assertEqual((link.line_style, link.arrow_type), ('Solid-Strong', 'bi'))
+        self.assertEqual((link.starting_block_id, link.ending_block_id), (self.block2.id, self.block1.id))
+        response = self.post_operations([{'op': 'delete_block', 'num': 2}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cam.link_set.count(), 0)
+        self.assertEqual(list(self.cam.block_set.values_list('num', flat=True)), [1.0])
+
+    def test_batch_reads_referenced_objects(self):
+        """
+        Test that a batch only reads the concepts it refers to and the links attached to them
+        """
+        others = [Block.objects.create(title='Other', creator=self.user, shape='neutral', CAM=self.cam, num=num)
+                  for num in range(3, 6)]
+        Link.objects.create(starting_block=others[0], ending_block=others[1], creator=self.user, CAM=self.cam)
+        link = Link.objects.create(starting_block=self.block1, ending_block=others[2], creator=self.user, CAM=self.cam)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_operations([{'op': 'move_block', 'num': 1, 'x_pos': '50.0px', 'y_pos': '60.0px'}])
+        self.assertEqual(response.json()['results'][0]['id'], [link.id])
+        reads = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')
+                 and ('"block_block"' in query['sql'] or '"link_link"' in query['sql'])]
+        # Block 1, its link and the other end of the link
+        self.assertEqual(len(reads), 3)
+        self.assertTrue(all('WHERE' in sql for sql in reads))
+
+    def test_batch_move_stats(self):
+        """
+        Test that moving concepts does not count the concepts and links of the CAM again, unlike changing a shape
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.post_operations([{'op': 'move_block', 'num': 1, 'x_pos': '50.0px', 'y_pos': '60.0px'}])
+        self.assertFalse([query for query in queries.captured_queries if 'users_camstats' in query['sql']])
+        self.post_operations([{'op': 'update_block', 'num': 1, 'shape': '5'}])
+        self.assertEqual(CAMStats.objects.get(cam=self.cam).shape_counts, {'positive': 2})
+
+    def test_batch_rejected(self):
+        """
+        Test that a batch containing an invalid operation is not applied at all
+        """
+        response = self.post_operations([
+            {'op': 'move_block', 'num': 1, 'x_pos': '50.0px', 'y_pos': '60.0px'},
+            {'op': 'delete_block', 'num': 42},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['index'], 1)
+        self.assertEqual(self.post_operations(5).status_code, 400)
+        self.block1.refresh_from_db()
+        self.assertEqual(self.block1.x_pos, 1.0)
+
+
+class JournalTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', email='test@test.test', password='12345')
+        self.client.login(username='testuser', password='12345')
+        self.cam = CAM.objects.create(name='testCAM', user=self.user)
+        self.user.active_cam_num = self.cam.id
+        self.user.save()
+        self.block1 = Block.objects.create(title='Meow1', x_pos=1.0, y_pos=1.0, height=100, width=100,
+                                           creator=self.user, shape='negative', CAM=self.cam, num=1)
+        self.block2 = Block.objects.create(title='Meow2', x_pos=105.0, y_pos=105.0, height=100, width=100,
+                                           creator=self.user, shape='positive', CAM=self.cam, num=2)
+        self.link = Link.objects.create(starting_block=self.block1, ending_block=self.block2, creator=self.user,
+                                        CAM=self.cam, line_style='Dashed')
+
+    def drag(self, x_pos, num=1):
+        self.client.post('/block/drag_function', {'drag_valid': True, 'block_id': num, 'x_pos': '%spx' % x_pos,
+                                                  'y_pos': '1.0px', 'width': '100px', 'height': '100px'})
+
+    def test_undo_redo(self):
+        """
+        Test that a move and a deletion are undone in reverse order and redone again
+        """
+        self.drag(50.0)
+        self.client.post('/block/delete_block', {'delete_valid': True, 'block_id': 2})
+        self.assertEqual(self.cam.link_set.count(), 0)
+        self.client.post(reverse('undo_action'))
+        restored = self.cam.link_set.get()
+        self.assertEqual((restored.id, restored.ending_block.title), (self.link.id, 'Meow2'))
+        self.client.post(reverse('undo_action'))
+        self.block1.refresh_from_db()
+        self.assertEqual(self.block1.x_pos, 1.0)
+        self.assertEqual(self.client.post(reverse('undo_action')).json()['message'], 'Nothing to undo')
+        self.client.post(reverse('redo_action'))
+        self.block1.refresh_from_db()
+        self.assertEqual(self.block1.x_pos, 50.0)
+        self.drag(70.0)  # A new action forgets the undone deletion
+        self.assertEqual(self.client.post(reverse('redo_action')).json()['message'], 'Nothing to redo')
+        self.assertEqual(self.cam.block_set.count(), 2)
+
+    def test_batch_undo(self):
+        """
+        Test that a batch of canvas operations is undone as a single action
+        """
+        self.client.post(reverse('cam_mutations', args=[self.cam.id]), json.dumps({'operations': [
+            {'op': 'add_block', 'num': 3, 'title': 'Meow3', 'shape': '5'},
+            {'op': 'add_link', 'starting_block': 3, 'ending_block': 1},
+            {'op': 'update_block', 'num': 1, 'title': 'Woof'},
+            {'op': 'delete_block', 'num': 2},
+        ]}), content_type='application/json')
+        self.assertEqual(self.cam.logcamactions_set.count(), 1)
+        self.client.post(reverse('undo_action'))
+        self.assertEqual(sorted(self.cam.block_set.values_list('title', flat=True)), ['Meow1', 'Meow2'])
+        self.assertEqual(list(self.cam.link_set.values_list('id', flat=True)), [self.link.id])
+
+    def test_clear_cam(self):
+        """
+        Test that clearing a CAM deletes its links and then its blocks, with one statement for all blocks, and can be
+        undone
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('clear_CAM'), {'clear_cam_valid': True})
+        deletes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('DELETE FROM "block')
+                   or query['sql'].startswith('DELETE FROM "link')]
+        self.assertTrue(deletes[0].startswith('DELETE FROM "link_link" WHERE "link_link"."CAM_id"'))
+        self.assertEqual(len([sql for sql in deletes if sql.startswith('DELETE FROM "block')]), 1)
+        self.assertFalse(self.cam.link_set.exists())
+        self.assertFalse(self.cam.block_set.exists())
+        self.client.post(reverse('undo_action'))
+        self.assertEqual(self.cam.block_set.count(), 2)
+        self.assertEqual(list(self.cam.link_set.values_list('id', flat=True)), [self.link.id])
+        self.assertEqual(CAMStats.objects.get(cam=self.cam).concepts, 2)
+
+    def test_journal_size(self):
+        """
+        Test that only the last JOURNAL_SIZE actions are kept
+        """
+        with mock.patch('users.journal.JOURNAL_SIZE', 3):
+            for x_pos in range(5):
+                self.drag(float(x_pos), num=1 + x_pos % 2)  # Moves of the same block in a row are one action
+        self.assertEqual(list(self.cam.logcamactions_set.values_list('actionId', flat=True).order_by('actionId')),
+                         [2, 3, 4])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SnapshotTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', email='test@test.test', password='12345')
+        self.client.login(username='testuser', password='12345')
+        self.cam = CAM.objects.create(name='testCAM', user=self.user)
+        self.user.active_cam_num = self.cam.id
+        self.user.save()
+        self.blocks = [Block.objects.create(title='Meow%i' % num, x_pos=10.0*num, y_pos=1.0, creator=self.user,
+                                            shape='neutral', CAM=self.cam, num=num) for num in range(1, 21)]
+        for start, end in zip(self.blocks[:-1], self.blocks[1:]):
+            Link.objects.create(starting_block=start, ending_block=end, creator=self.user, CAM=self.cam)
+        cache.clear()
+
+    def test_snapshot_queries(self):
+        """
+        Test that the snapshot loads the CAM in two queries regardless of its size
+        """
+        with self.assertNumQueries(2):
+            snapshot = CAMSnapshot(self.cam.id)
+        self.assertEqual(len(snapshot.blocks), 20)
+        self.assertEqual(len(snapshot.links), 19)
+        link = snapshot.links[0]
+        self.assertEqual((link['starting_block'], link['ending_block'], link['end_x']), (1.0, 2.0, 20.0))
+        self.assertEqual(snapshot.blocks[1]['links_ending'], [link['id']])
+
+    def test_snapshot_cache(self):
+        """
+        Test that a cached snapshot is served until a block or link of the CAM changes
+        """
+        get_snapshot(self.cam.id)
+        with self.assertNumQueries(1):  # Only the CAM version is read
+            snapshot = get_snapshot(self.cam.id)
+        self.assertEqual(snapshot['blocks'][0]['title'], 'Meow1')
+        self.blocks[0].update({'title': 'Woof'})
+        self.assertEqual(get_snapshot(self.cam.id)['blocks'][0]['title'], 'Woof')
+        self.cam.link_set.first().delete()
+        self.assertEqual(len(get_snapshot(self.cam.id)['links']), 18)
+
+    def test_snapshot_json(self):
+        """
+        Test the JSON variant of the snapshot and that other users cannot read it
+        """
+        response = self.client.get(reverse('cam_snapshot'), {'pk': self.cam.id})
+        self.assertEqual(len(response.json()['blocks']), 20)
+        self.assertEqual(self.client.get(reverse('cam_snapshot'), {'pk': 'abc'}).status_code, 400)
+        CustomUser.objects.create_user(username='other', password='12345')
+        self.client.login(username='other', password='12345')
+        response = self.client.get(reverse('cam_snapshot'), {'pk': self.cam.id})
+        self.assertEqual(response.status_code, 403)
+
+    def test_index(self):
+        """
+        Test that the canvas renders the existing concepts and links
+        """
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'place_concept("Meow20"')
+
+
+class ImportTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', email='test@test.test', password='12345')
+        self.client.login(username='testuser', password='12345')
+        # CAM to export
+        self.source = CAM.objects.create(name='sourceCAM', user=self.user)
+        blocks = [Block.objects.create(title='Meow%i' % num, x_pos=10.0*num, y_pos=1.0, creator=self.user,
+                                       shape='positive', CAM=self.source, num=num, comment='None')
+                  for num in range(1, 4)]
+        Link.objects.create(starting_block=blocks[0], ending_block=blocks[1], creator=self.user, CAM=self.source,
+                            line_style='Dashed')
+        Link.objects.create(starting_block=blocks[2], ending_block=blocks[0], creator=self.user, CAM=self.source)
+        self.cam = CAM.objects.create(name='testCAM', user=self.user)
+        self.user.active_cam_num = self.cam.id
+        self.user.save()
+        Block.objects.create(title='Old', creator=self.user, shape='neutral', CAM=self.cam, num=1)
+
+    def export_zip(self):
+        """
+        Zip file in the format produced by export_CAM
+        """
+        outfile = BytesIO()
+        with ZipFile(outfile, 'w') as zf:
+            zf.writestr('blocks.csv', BlockResource().export(self.source.block_set.all()).csv)
+            zf.writestr('links.csv', LinkResource().export(self.source.link_set.all()).csv)
+        outfile.seek(0)
+        outfile.name = 'CAM.zip'
+        return outfile
+
+    def test_import_cam(self):
+        """
+        Test that an exported CAM replaces the current CAM's contents with its links reconnected
+        """
+        self.client.post('/users/import_CAM', {'myfile': self.export_zip(), 'Deletable': 'on'})
+        blocks = {block.num: block for block in self.cam.block_set.all()}
+        self.assertEqual(sorted(blocks), [1.0, 2.0, 3.0])
+        self.assertEqual(blocks[1.0].title, 'Meow1')
+        self.assertEqual(blocks[1.0].comment, '')
+        self.assertFalse(blocks[1.0].modifiable)
+        links = {(link.starting_block.num, link.ending_block.num): link for link in self.cam.link_set.all()}
+        self.assertEqual(sorted(links), [(1.0, 2.0), (3.0, 1.0)])
+        self.assertEqual(links[(1.0, 2.0)].line_style, 'Dashed')
+        self.assertEqual(self.source.block_set.count(), 3)  # The exported CAM is untouched
+        self.client.post(reverse('undo_action'))
+        self.assertEqual(list(self.cam.block_set.values_list('title', flat=True)), ['Old'])
+
+    def test_import_invalid_cam(self):
+        """
+        Test that a file with a broken link leaves the current CAM as it was
+        """
+        outfile = BytesIO()
+        with ZipFile(outfile, 'w') as zf:
+            zf.writestr('blocks.csv', 'id,title,x_pos,y_pos,num\n1,Meow,1.0,1.0,1\n')
+            zf.writestr('links.csv', 'id,starting_block,ending_block\n1,1,2\n')
+        outfile.seek(0)
+        with self.assertRaises(CAMImportError):
+            read_cam_zip(outfile)
+        # The view reports the error to the user
+        outfile.seek(0)
+        response = self.client.post('/users/import_CAM', {'myfile': outfile})
+        self.assertEqual([str(message) for message in get_messages(response.wsgi_request)],
+                         ['Error in reading in links (rows [0])'])
+        self.assertEqual(list(self.cam.block_set.values_list('title', flat=True)), ['Old'])
+        outfile = BytesIO()
+        with ZipFile(outfile, 'w') as zf:
+            zf.writestr('blocks.csv', '')  # Empty file
+        outfile.seek(0)
+        with self.assertRaises(CAMImportError):
+            read_cam_zip(outfile)
+
+    def test_import_empty_cam(self):
+        """
+        Test that the export of an empty CAM can be imported again
+        """
+        self.source.link_set.all().delete()
+        self.source.block_set.all().delete()
+        response = self.client.post('/users/import_CAM', {'myfile': self.export_zip()})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(self.cam.block_set.exists())
+
+    def test_import_repeated_numbers(self):
+        """
+        Test that concepts sharing a number are renumbered, since numbers are unique within a CAM
+        """
+        outfile = BytesIO()
+        with ZipFile(outfile, 'w') as zf:
+            zf.writestr('blocks.csv', 'id,title,x_pos,y_pos,num\n1,Meow,1.0,1.0,2\n2,Woof,1.0,1.0,2\n3,Moo,1.0,1.0\n')
+        outfile.seek(0)
+        self.assertEqual(list(read_cam_zip(outfile).blocks['num']), [2.0, 3.0, 0.0])
+
+    def test_project_template(self):
+        """
+        Test that every participant joining a project gets the initial CAM, which is only parsed once
+        """
+        cache.clear()
+        project = Project.objects.create(name='TemplateProject', researcher=self.user, name_participants='TMP')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            project.Initial_CAM.save('CAM.zip', ContentFile(self.export_zip().read()))
+            with mock.patch('users.importer.read_cam_zip', wraps=read_cam_zip) as reader:
+                for num in range(2):
+                    participant = CustomUser.objects.create_user(username='participant%i' % num,
+                                                                 email='p%i@test.test' % num, password='12345')
+                    upload_cam_participant(participant, project)
+                    cam = CAM.objects.get(id=participant.active_cam_num)
+                    self.assertEqual(sorted(cam.block_set.values_list('num', flat=True)), [1.0, 2.0, 3.0])
+                    self.assertEqual(cam.link_set.count(), 2)
+                    self.assertFalse(cam.link_set.exclude(creator=participant).exists())
+            self.assertEqual(reader.call_count, 1)
+
+
+class JobTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', email='test@test.test', password='12345')
+        self.researcher = Researcher.objects.create(user=self.user, affiliation='UdeM')
+        self.client.login(username='testuser', password='12345')
+        self.project = Project.objects.create(name='JobProject', researcher=self.user, name_participants='J')
+        self.user.active_project_num = self.project.id
+        self.user.save()
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+
+    @override_settings(JOB_QUEUE_ENABLED=True)
+    def test_queued_job(self):
+        """
+        Test that a queued job waits for the worker, reports its progress and offers its result for download
+        """
+        with override_settings(MEDIA_ROOT=self.media_root.name):
+            job = enqueue('create_participants', self.user, self.project, num_part=2, call_id='J', language_pref='en')
+            self.assertEqual(job.status, Job.QUEUED)
+            self.assertFalse(CustomUser.objects.filter(username='J0').exists())
+            call_command('run_jobs', once=True)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.progress), (Job.DONE, 100))
+            self.assertEqual(CAM.objects.filter(project=self.project).count(), 2)
+            # Export the new CAMs
+            response = self.client.get('/users/download_project', {'pk': self.project.id})
+            self.assertRedirects(response, '/users/project_page', fetch_redirect_response=False)
+            call_command('run_jobs', once=True)
+            job = Job.objects.get(kind='export_project')
+            status = self.client.get('/users/job/%i' % job.id).json()
+            self.assertEqual(status['status'], Job.DONE)
+            response = self.client.get(status['result_url'])
+            with ZipFile(BytesIO(b''.join(response.streaming_content))) as z:
+                self.assertEqual(len(z.namelist()), 7)  # With the export.json
+
+    def test_failed_job(self):
+        """
+        Test that an exception in a job marks it as failed instead of reaching the user
+        """
+        job = enqueue('create_participants', self.user, self.project, num_part=1)  # No call_id
+        self.assertEqual(job.status, Job.FAILED)
+        other = CustomUser.objects.create_user(username='other', password='12345')
+        self.client.login(username='other', password='12345')
+        self.assertEqual(self.client.get('/users/job/%i' % job.id).status_code, 404)
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', email='test@test.test', password='12345')
+        self.client.login(username='testuser', password='12345')
+        self.project = Project.objects.create(name='ExportProject', researcher=self.user, name_participants='E')
+        self.cams = []
+        for num in range(2):
+            participant = CustomUser.objects.create_user(username='E%i' % num, password='12345')
+            cam = CAM.objects.create(name='ExportProject', user=participant, project=self.project)
+            start = Block.objects.create(title='Meow, "%i"' % num, x_pos=1.5, creator=participant, shape='positive',
+                                         CAM=cam, num=1, comment=None)
+            end = Block.objects.create(title='Woof', creator=participant, shape='negative', CAM=cam, num=2,
+                                       modifiable=False)
+            Link.objects.create(starting_block=start, ending_block=end, creator=participant, CAM=cam)
+            self.cams.append(cam)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_download_project(self):
+        """
+        Test that the streamed project export matches the per-CAM csv export and can be imported again
+        """
+        response = self.client.get('/users/download_project', {'pk': self.project.id})
+        with ZipFile(BytesIO(b''.join(response.streaming_content))) as z:
+            self.assertEqual(len(z.namelist()), 5)  # export.json; images are not drawn while the response is sent
+        render_project(self.project, workers=1)
+        response = self.client.get('/users/download_project', {'pk': self.project.id})
+        self.assertTrue(response.streaming)
+        with ZipFile(BytesIO(b''.join(response.streaming_content))) as z:
+            self.assertEqual(len(z.namelist()), 7)  # Blocks, links and image of each CAM and export.json
+            for cam in self.cams:
+                name = '%s_%i_' % (cam.user.username, cam.id)
+                self.assertEqual(z.read(name + 'blocks.csv').decode(),
+                                 BlockResource().export(cam.block_set.all()).csv)
+                self.assertEqual(z.read(name + 'links.csv').decode(), LinkResource().export(cam.link_set.all()).csv)
+            outfile = BytesIO()
+            with ZipFile(outfile, 'w') as zf:
+                for member in ('blocks', 'links'):
+                    zf.writestr('%s.csv' % member, z.read('E0_%i_%s.csv' % (self.cams[0].id, member)))
+        template = read_cam_zip(outfile)
+        self.assertEqual(list(template.blocks['title']), ['Meow, "0"', 'Woof'])
+        self.assertEqual(len(template.links), 1)
+
+    def test_project_export_queries(self):
+        """
+        Test that the number of queries of a project export does not depend on the number of CAMs
+        """
+        CAM.objects.create(name='ExportProject', user=self.user, project=self.project)  # CAM without concepts
+        with self.assertNumQueries(3):
+            content = b''.join(stream_zip(project_members(self.project, '{username}_{cam_id}_{name}.csv')))
+        with ZipFile(BytesIO(content)) as z:
+            self.assertEqual(len(z.namelist()), 7)  # With the export.json
+            for cam in self.cams:
+                self.assertEqual(z.read('%s_%i_links.csv' % (cam.user.username, cam.id)).decode(),
+                                 LinkResource().export(cam.link_set.all()).csv)
+
+    def test_download_project_data(self):
+        """
+        Test that the analysis export holds every block and link of the project in one file each plus a manifest
+        """
+        for file_format in ('csv', 'parquet'):
+            if file_format == 'parquet' and pyarrow is None:
+                continue
+            response = self.client.get('/users/download_project_data', {'pk': self.project.id, 'format': file_format})
+            with ZipFile(BytesIO(b''.join(response.streaming_content))) as z:
+                manifest = json.loads(z.read('manifest.json'))
+                self.assertEqual(manifest['format'], file_format)
+                self.assertEqual((manifest['files']['blocks']['rows'], manifest['files']['links']['rows']), (4, 2))
+                with z.open('blocks.' + file_format) as member:
+                    blocks = pd.read_csv(member) if file_format == 'csv' else pd.read_parquet(BytesIO(member.read()))
+            self.assertEqual(list(blocks['participant']), ['E0', 'E0', 'E1', 'E1'])
+            self.assertEqual(list(blocks['valence']), [2.0, -2.0, 2.0, -2.0])
+        response = self.client.get('/users/download_project_data', {'pk': self.project.id, 'format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/users/download_project_data', {'pk': 0}).status_code, 404)
+        self.client.login(username='E0', password='12345')
+        self.assertEqual(self.client.get('/users/download_project_data', {'pk': self.project.id}).status_code, 403)
+        self.client.logout()
+        response = self.client.get('/users/download_project_data', {'pk': self.project.id})
+        self.assertEqual(response.status_code, 302)  # Sent to the login page
+
+    def test_incremental_export(self):
+        """
+        Test that an export given the token of a previous export only holds the CAMs changed since then
+        """
+        response = self.client.get('/users/download_project', {'pk': self.project.id})
+        token = response['X-Export-Token']
+        with ZipFile(BytesIO(b''.join(response.streaming_content))) as z:
+            self.assertEqual(json.loads(z.read('export.json'))['token'], token)  # Full exports also give the token
+        block = self.cams[1].block_set.get(num=2)
+        block.title = 'Changed'
+        block.save()
+        render_project(self.project, workers=1)
+        response = self.client.get('/users/download_project', {'pk': self.project.id, 'since': token})
+        with ZipFile(BytesIO(b''.join(response.streaming_content))) as z:
+            name = 'E1_%i_' % self.cams[1].id
+            image = str(CAM.objects.get(id=self.cams[1].id).cam_image)
+            self.assertEqual(sorted(z.namelist()),
+                             sorted(['export.json', name + 'blocks.csv', name + 'links.csv', image]))
+            self.assertIn('Changed', z.read(name + 'blocks.csv').decode())
+            self.assertEqual(json.loads(z.read('export.json'))['token'], response['X-Export-Token'])
+        response = self.client.get('/users/download_project', {'pk': self.project.id, 'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RenderTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', email='test@test.test', password='12345')
+        self.cam = CAM.objects.create(name='testCAM', user=self.user)
+        shapes = ['neutral', 'positive', 'negative strong', 'ambivalent']
+        blocks = [Block.objects.create(title='Meow %i' % num, x_pos=200.0 * num, y_pos=100.0 * (num % 2),
+                                       creator=self.user, shape=shape, CAM=self.cam, num=num)
+                  for num, shape in enumerate(shapes)]
+        for start, end, style, arrow in ((0, 1, 'Solid-Strong', 'none'), (1, 2, 'Dashed', 'uni'),
+                                         (3, 0, 'Dashed-Weak', 'bi')):
+            Link.objects.create(starting_block=blocks[start], ending_block=blocks[end], creator=self.user,
+                                CAM=self.cam, line_style=style, arrow_type=arrow)
+
+    def test_render(self):
+        """
+        Test that a CAM is drawn at the requested resolution and fits thumbnails in their maximum size
+        """
+        with self.assertNumQueries(2):
+            data = CAMData.from_cam(self.cam.id)
+        self.assertEqual((len(data.ids), len(data.line_styles)), (4, 3))
+        image = render(data)
+        self.assertEqual(image.shape, (100 + 120 + 40, 600 + 160 + 40, 3))
+        self.assertTrue((image < 255).any())
+        self.assertEqual(max(render(data, scale=2, max_size=200).shape[:2]), 200)
+        self.assertEqual(render(CAMData([], [])).shape, (40, 40, 3))  # Empty CAM
+
+    def test_render_cams(self):
+        """
+        Test that the render_cams command draws every CAM of a project and only redraws the ones that changed
+        """
+        project = Project.objects.create(name='RenderProject', researcher=self.user, name_participants='R')
+        CAM.objects.filter(id=self.cam.id).update(project=project)
+        other = CAM.objects.create(name='RenderProject', user=self.user, project=project)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            call_command('render_cams', project='RenderProject', workers=1, stdout=StringIO())
+            self.cam.refresh_from_db()
+            first = str(self.cam.cam_image)
+            self.assertTrue(os.path.isfile(os.path.join(media_root, first)))
+            self.assertTrue(os.path.isfile(os.path.join(media_root, str(CAM.objects.get(id=other.id).cam_image))))
+            with self.assertNumQueries(1):  # The versions of the CAMs tell which images are current
+                self.assertEqual(set(current_images(project)), {self.cam.id, other.id})
+            block = self.cam.block_set.get(num=0)
+            block.title = 'Changed'
+            block.save()
+            output = StringIO()
+            call_command('render_cams', project=str(project.id), workers=1, stdout=output)
+            self.assertIn('Rendered 1 CAMs of RenderProject (1 unchanged)', output.getvalue())
+            self.cam.refresh_from_db()
+            self.assertNotEqual(str(self.cam.cam_image), first)
+            self.assertEqual(self.cam.image_version, self.cam.version)
+            self.assertFalse(os.path.isfile(os.path.join(media_root, first)))
+
+    def test_image_cache(self):
+        """
+        Test that the image of a CAM is only saved again once the CAM changes and that its other versions are made
+        on request
+        """
+        self.user.active_cam_num = self.cam.id
+        self.user.save()
+        self.client.login(username='testuser', password='12345')
+        buffer = BytesIO()
+        PILImage.new('RGBA', (4, 3)).save(buffer, 'PNG')
+        image = 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            name = self.client.post(reverse('image_CAM'), {'html_to_convert': image}).json()['file_name']
+            self.cam.refresh_from_db()
+            path = os.path.join(media_root, str(self.cam.cam_image))
+            self.assertTrue(name.endswith(str(self.cam.cam_image)))
+            self.assertEqual(PILImage.open(path).size, (4, 3))  # The upload is stored as is
+            # Other versions are made on the first request
+            response = self.client.get(reverse('image_CAM_variant', args=['print']))
+            self.assertEqual(PILImage.open(BytesIO(b''.join(response.streaming_content))).size, (20, 15))
+            response = self.client.get(reverse('image_CAM_variant', args=['grayscale']), {'pk': self.cam.id})
+            self.assertEqual(PILImage.open(BytesIO(b''.join(response.streaming_content))).mode, 'L')
+            self.assertEqual(self.client.get(reverse('image_CAM_variant', args=['huge'])).status_code, 404)
+            response = self.client.get(reverse('image_CAM_variant', args=['print']), {'pk': 'abc'})
+            self.assertEqual(response.status_code, 400)
+            # Unchanged CAM: the image is neither decoded nor saved again
+            response = self.client.post(reverse('image_CAM'), {'html_to_convert': 'invalid'})
+            self.assertEqual(response.json()['file_name'], name)
+            # download_cam reuses the image drawn by the browser
+            response = self.client.get(reverse('download_cam'), {'pk': self.cam.id})
+            with ZipFile(BytesIO(response.content)) as z:
+                self.assertIn(str(self.cam.cam_image), z.namelist())
+            self.cam.block_set.get(num=0).update({'title': 'Changed'})
+            self.client.post(reverse('image_CAM'), {'html_to_convert': image})
+            self.assertFalse(os.path.isfile(path))
+            self.assertFalse(os.path.isfile(path[:-len('.png')] + '_print.png'))
+
+    def test_vector_export(self):
+        """
+        Test the SVG export of a CAM and that the PDF export needs weasyprint
+        """
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('export_CAM_vector', args=['svg']), {'pk': self.cam.id})
+        svg = ElementTree.fromstring(response.content)
+        namespace = '{http://www.w3.org/2000/svg}'
+        self.assertEqual(svg.get('viewBox'), '0 0 800.00 260.00')
+        self.assertEqual(len(svg.findall('.//%sline' % namespace)), 3)
+        self.assertEqual(len(svg.findall('%sg/%spolygon' % (namespace, namespace))), 3)  # Arrow heads
+        self.assertEqual(len(svg.findall('%sellipse' % namespace)), 2)  # Positive and ambivalent concepts
+        self.assertEqual([text.text for text in svg.iter('%stspan' % namespace)],
+                         ['Meow 0', 'Meow 1', 'Meow 2', 'Meow 3'])
+        response = self.client.get(reverse('export_CAM_vector', args=['svg']), {'pk': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('export_CAM_vector', args=['pdf']), {'pk': self.cam.id})
+        if weasyprint is None:
+            self.assertEqual(response.status_code, 501)
+        else:
+            self.assertTrue(response.content.startswith(b'%PDF'))
+        other = CustomUser.objects.create_user(username='other', password='12345')
+        self.client.login(username='other', password='12345')
+        response = self.client.get(reverse('export_CAM_vector', args=['svg']), {'pk': self.cam.id})
+        self.assertEqual(response.status_code, 403)
+
+
+class AnalysisTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='testuser', email='test@test.test', password='12345')
+        self.client.login(username='testuser', password='12345')
+        self.project = Project.objects.create(name='AnalysisProject', researcher=self.user, name_participants='A')
+        self.cam = CAM.objects.create(name='AnalysisProject', user=self.user, project=self.project)
+        CAM.objects.create(name='AnalysisProject', user=self.user, project=self.project)  # CAM without concepts
+        shapes = ['positive strong', 'neutral', 'negative', 'ambivalent', 'positive']
+        blocks = [Block.objects.create(title='Meow %i' % num, creator=self.user, shape=shape, CAM=self.cam, num=num)
+                  for num, shape in enumerate(shapes)]
+        # A path 0 - 1 - 2 - 3 with a repeated link and an isolated concept 4
+        for start, end in ((0, 1), (1, 2), (2, 3), (2, 1)):
+            Link.objects.create(starting_block=blocks[start], ending_block=blocks[end], creator=self.user, CAM=self.cam)
+
+    def test_cam_metrics(self):
+        """
+        Test the metrics of a CAM and of its concepts
+        """
+        metrics = self.client.get(reverse('cam_analysis'), {'pk': self.cam.id}).json()
+        self.assertEqual((metrics['concepts'], metrics['links'], metrics['components']), (5, 3, 2))
+        self.assertAlmostEqual(metrics['density'], 0.3)
+        self.assertEqual(metrics['degree_distribution'], [1, 2, 2])
+        self.assertAlmostEqual(metrics['mean_valence'], 0.6)
+        self.assertEqual((metrics['positive_concepts'], metrics['negative_concepts']), (2, 1))
+        concepts = {concept['title']: concept for concept in metrics['concept_metrics']}
+        self.assertAlmostEqual(concepts['Meow 1']['betweenness'], 1 / 3)  # Between 0 and 2, 0 and 3
+        self.assertAlmostEqual(concepts['Meow 0']['closeness'], (1 + 1 / 2 + 1 / 3) / 4)
+        self.assertEqual(concepts['Meow 4']['degree'], 0)
+
+    def test_project_metrics(self):
+        """
+        Test that the metrics of a project are computed with a constant number of queries
+        """
+        with self.assertNumQueries(3):
+            metrics = project_metrics(self.project)
+        self.assertEqual([cam['concepts'] for cam in metrics['cams']], [5, 0])
+        self.assertEqual(metrics['mean']['links'], 1.5)
+        self.assertAlmostEqual(metrics['mean']['mean_valence'], 0.6)  # CAMs without concepts have no valence
+        response = self.client.get(reverse('project_analysis'), {'pk': self.project.id, 'concepts': '1'})
+        self.assertEqual(len(response.json()['cams'][0]['concept_metrics']), 5)
+        CustomUser.objects.create_user(username='other', password='12345')
+        self.client.login(username='other', password='12345')
+        self.assertEqual(self.client.get(reverse('project_analysis'), {'pk': self.project.id}).status_code, 403)
+        self.assertEqual(self.client.get(reverse('cam_analysis'), {'pk': self.cam.id}).status_code, 403)
+        for view in ('cam_analysis', 'project_analysis'):
+            self.assertEqual(self.client.get(reverse(view), {'pk': '1.5'}).status_code, 400)
+
+    def test_cam_stats(self):
+        """
+        Test that the statistics of a CAM follow the writes to its blocks and links and can be rebuilt
+        """
+        stats = CAMStats.objects.get(cam=self.cam)
+        self.assertEqual((stats.concepts, stats.links), (5, 4))
+        self.assertEqual(stats.shape_counts['positive strong'], 1)
+        self.assertEqual(stats.line_style_counts, {'Solid-Weak': 4})
+        self.assertAlmostEqual(stats.mean_valence, 0.6)
+        block = self.cam.block_set.get(num=4)
+        with CaptureQueriesContext(connection) as queries:
+            block.update({'shape': 'negative strong'})
+            block.update({'x_pos': 10.0})  # Moving a concept does not count it again
+            self.cam.link_set.first().delete()
+        # The writes add to the counters instead of counting the CAM again
+        self.assertFalse([query for query in queries.captured_queries if 'COUNT(' in query['sql']])
+        stats.refresh_from_db()
+        self.assertEqual((stats.concepts, stats.links, stats.mean_valence), (5, 3, -0.4))
+        # The project page reads the statistics of every CAM with the CAMs
+        self.user.active_project_num = self.project.id
+        self.user.save()
+        with override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+            response = self.client.get(reverse('project_page'))
+        self.assertEqual([cam.stats.links for cam in response.context['cams'] if cam.id == self.cam.id], [3])
+        CAMStats.objects.all().delete()
+        output = StringIO()
+        call_command('rebuild_cam_stats', project='AnalysisProject', stdout=output)
+        self.assertIn('Rebuilt the statistics of 2 CAMs', output.getvalue())
+        self.assertEqual(CAMStats.objects.get(cam=self.cam).links, 3)
+        self.assertEqual(CAMStats.objects.exclude(cam=self.cam).get().concepts, 0)
+        # Deleting a concept also uncounts its links, which go with it
+        self.cam.link_set.first().starting_block.delete()
+        counts = CAMStats.objects.filter(cam=self.cam).values().get()
+        self.assertEqual((counts['concepts'], counts['links']), (4, self.cam.link_set.count()))
+        CAMStats.refresh([self.cam.id])
+        self.assertEqual(CAMStats.objects.filter(cam=self.cam).values().get(), counts)
+
+    def test_project_concepts(self):
+        """
+        Test that the concepts of a project are grouped across CAMs by their normalized titles
+        """
+        other = CAM.objects.exclude(id=self.cam.id).get()
+        concepts = (('  meow,  0 ', 'negative strong'), ('Meows 0', 'positive'), ('Woof', 'neutral'))
+        for num, (title, shape) in enumerate(concepts):
+            Block.objects.create(title=title, creator=self.user, shape=shape, CAM=other, num=num)
+        self.assertEqual(normalize_title('  Big  Stress! '), 'big stress')
+        self.assertEqual(normalize_title('Ängste und Sorgen', stemming=True, language='de'), 'ängst und sorg')
+        concepts = project_concepts(self.project)
+        self.assertEqual((concepts[0]['concept'], concepts[0]['cams'], concepts[0]['occurrences']), ('meow 0', 2, 2))
+        self.assertEqual(concepts[0]['titles'], ['Meow 0', 'meow,  0'])
+        self.assertEqual((concepts[0]['mean_valence'], concepts[0]['valence_std']), (0.0, 3.0))
+        self.assertEqual(len(concepts), 7)
+        response = self.client.get(reverse('project_concept_analysis'), {'pk': self.project.id, 'stem': '1',
+                                                                         'language': 'en', 'min_cams': 2})
+        concepts = response.json()['concepts']
+        self.assertEqual([(concept['concept'], concept['occurrences']) for concept in concepts], [('meow 0', 3)])
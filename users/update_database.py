@@ -4,6 +4,9 @@ This file is for manually run database updates
 
 from block.models import Block
 from link.models import Link
+from users.models import CAM, CAMStats, logCamActions
+
+BATCH_SIZE = 500  # CAMs whose version and statistics are updated at a time
 
 
 def Clear_users_cam(Block, Link):
@@ -11,20 +14,20 @@ def Clear_users_cam(Block, Link):
     This function will clear all blocks and links
     :return:
     """
-    # Get all Blocks and Delete them
-    all_blocks = Block.objects.all()
-    for block in all_blocks:
-        try:
-            block.delete()
-        except Exception:
-            print(Exception)
-    # Get all Links and Delete them
-    all_links = Link.objects.all()
-    for link in all_links:
-        try:
-            link.delete()
-        except Exception:
-            print(Exception)
+    # CAMs that are cleared, whose version and statistics are updated afterwards
+    cam_ids = sorted(set(Block.objects.values_list('CAM_id', flat=True).distinct())
+                     | set(Link.objects.values_list('CAM_id', flat=True).distinct()))
+    # Delete all Links, then all Blocks: with the links gone first, nothing is left to cascade to
+    Link.objects.all().delete()
+    Block.objects.all().delete()
+    # The journals cannot be undone anymore
+    logCamActions.objects.all().delete()
+    for start in range(0, len(cam_ids), BATCH_SIZE):
+        CAM.bump_version(cam_ids[start:start + BATCH_SIZE])
+    # Every CAM is now empty
+    CAMStats.objects.all().delete()
+    CAMStats.objects.bulk_create([CAMStats(cam_id=cam_id) for cam_id in CAM.objects.values_list('id', flat=True)],
+                                 batch_size=BATCH_SIZE)
     return None
 
 
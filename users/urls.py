@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views, views_CAM, views_Project, views_undo
+from . import views, views_CAM, views_Project, views_undo, views_mutations, views_jobs, views_analysis
 
 urlpatterns = [
     path('index/', views.index, name='index'),
@@ -12,8 +12,10 @@ urlpatterns = [
     path('Background',views.background, name='Background'),
     path('Background_German',views.background_german, name='Background_German'),
     path('image_CAM', views.Image_CAM, name ='image_CAM'),
+    path('image_CAM/<str:variant>', views.image_CAM_variant, name='image_CAM_variant'),
     path('view_pdf', views.view_pdf, name='view_pdf'),
     path('export_CAM', views.export_CAM, name='export_CAM'),
+    path('export_CAM/<str:file_format>', views.export_CAM_vector, name='export_CAM_vector'),
     path('import_CAM', views.import_CAM, name='import_CAM'),
     path('contact_form', views.contact_form, name='contact_form'),
     path('language_change', views.language_change, name='language_change'),
@@ -25,6 +27,7 @@ urlpatterns = [
     path('load_cam', views_CAM.load_cam, name='load_cam'),
     path('delete_cam', views_CAM.delete_cam, name='delete_cam'),
     path('download_cam', views_CAM.download_cam, name='download_cam'),
+    path('cam_snapshot', views_CAM.cam_snapshot, name='cam_snapshot'),
     path('update_cam_name', views_CAM.update_cam_name, name='update_cam_name'),
     path('join_project', views_Project.join_project, name='join_project'),
     path('create_project', views_Project.create_project, name='create_project'),
@@ -34,6 +37,13 @@ urlpatterns = [
     path('load_project', views_Project.load_project, name='load_project'),
     path('delete_project', views_Project.delete_project, name='delete_project'),
     path('download_project', views_Project.download_project, name='download_project'),
+    path('download_project_data', views_Project.download_project_data, name='download_project_data'),
+    path('cam_analysis', views_analysis.cam_analysis, name='cam_analysis'),
+    path('project_analysis', views_analysis.project_analysis, name='project_analysis'),
+    path('project_concept_analysis', views_analysis.project_concept_analysis, name='project_concept_analysis'),
+    path('initial_cam', views_CAM.initial_cam, name='initial_cam'),
+    path('job/<int:job_id>', views_jobs.job_status, name='job_status'),
+    path('job/<int:job_id>/result', views_jobs.job_result, name='job_result'),
     path('language_change_anonymous', views.language_change_anonymous, name='language_change_anonymous'),
     path('tutorials', views.tutorials, name='tutorials'),
     path('instructions', views.instructions, name='instructions'),
@@ -43,4 +53,6 @@ urlpatterns = [
     path('FAQ', views.FAQ, name='FAQ'),
     path('clone_cam', views_CAM.clone_CAM, name='clone_cam'),
     path('undo_action', views_undo.undo_action, name='undo_action'),
+    path('redo_action', views_undo.redo_action, name='redo_action'),
+    path('cam/<int:cam_id>/mutations', views_mutations.cam_mutations, name='cam_mutations'),
 ]
@@ -2,7 +2,8 @@ from django.shortcuts import render, redirect
 from users.forms import CustomUserCreationForm
 from block.models import Block
 from link.models import Link
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, FileResponse
+from django.urls import reverse
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
@@ -12,19 +13,25 @@ from django.conf import settings as settings_dj
 from .resources import BlockResource, LinkResource
 from zipfile import ZipFile
 from io import BytesIO
-from tablib import Dataset
-from PIL import Image, ImageOps
-import pandas as pd
-import numpy as np
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.forms import AuthenticationForm
+from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.decorators import login_required
+from users.decorators import integer_pk
 from users.models import CAM, Project, CustomUser
 from .views_CAM import upload_cam_participant, create_individual_cam, create_individual_cam_randomUser
+from .cam_snapshot import get_snapshot
+from .importer import read_cam_zip, import_cam, CAMImportError
+from .journal import clear_cam
+from .cam_images import image_names, image_path, is_current, replace_image, save_original, image_variant, \
+    VARIANTS
+from users.Plots.DataToPlot import CAMData
+from users.Plots.Vector import cam_svg, cam_pdf, weasyprint
 import datetime
 from random_username.generate import generate_username
+import os
 import re
 import base64
 User = get_user_model()
@@ -46,27 +53,19 @@ def index(request):
     if request.method == 'POST':
         print('nope!')
     else:  # request.method = "GET"
-        user = User.objects.get(username=request.user.username)
+        user = request.user
         translation.activate(user.language_preference)
         #request.session[translation.LANGUAGE_SESSION_KEY] = user.language_preference
         response = HttpResponse(...)
         response.set_cookie(settings_dj.LANGUAGE_COOKIE_NAME, user.language_preference)
         if user.is_authenticated:
-            current_cam = CAM.objects.get(id=user.active_cam_num)
-            blocks = current_cam.block_set.all()
-            blocks_ = []
-            for block in blocks:
-                if block.comment is None:
-                    block.comment = ''
-                blocks_.append(block)
-            lines = current_cam.link_set.all()
-            lines_ = []
-            for line in lines:
-                lines_.append(line)
+            # Blocks and links of the current CAM (cached until the CAM changes)
+            snapshot = get_snapshot(user.active_cam_num)
             content = {
                 'user':user,
-                'existing_blocks':blocks_,
-                'existing_lines':lines_
+                'existing_blocks':snapshot['blocks'],
+                'existing_lines':snapshot['links'],
+                'drag_coalesce_window': getattr(settings_dj, 'DRAG_COALESCE_WINDOW', 200),
             }
             return render(request, 'base/index.html', content)
         else:
@@ -325,69 +324,51 @@ def create_researcher(request):
 
 def clear_CAM(request):
     """
-    Function to clear a CAM. This function simply deletes all the blocks and links in a current CAM. After this function,
-     the user's page will be refreshed and they will have a blank CAM. The CAM name/id does not change.
+    Function to clear a CAM. This function simply deletes all the blocks and links in a current CAM (one statement
+    each, see users/journal.py). After this function, the user's page will be refreshed and they will have a blank CAM.
+    The CAM name/id does not change, and the clearing can be undone.
     """
     clear_cam_valid = request.POST.get('clear_cam_valid')  # clear cam
     if clear_cam_valid:
-        # clear blocks associated with user
-        user = CustomUser.objects.get(username=request.user.username)
-        current_cam = CAM.objects.get(id=user.active_cam_num)
-        blocks = current_cam.block_set.all()
-        for block in blocks:
-            block.delete()
-        # clear links associated with user
-        links = current_cam.link_set.all()
-        for link in links:
-            link.delete()
+        # clear blocks and links associated with user
+        current_cam = CAM.objects.get(id=request.user.active_cam_num)
+        clear_cam(current_cam.id)
         return HttpResponse()
 
-def remove_transparency(im, bg_color=(255, 255, 255)):
+def Image_CAM(request):
     """
-    Taken from https://stackoverflow.com/a/35859141/7444782
+    Save the image of the active CAM drawn by the browser. The upload is decoded once and stored as is; the thumbnail,
+    print and grayscale versions are made when they are first asked for (see image_CAM_variant). The image is named
+    after the version of the CAM (see users/cam_images.py) so it is only saved again once the CAM has changed.
     """
-    # Only process if image has transparency (http://stackoverflow.com/a/1963146)
-    if im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info):
-
-        # Need to convert to RGBA if LA format due to a bug in PIL (http://stackoverflow.com/a/1963146)
-        alpha = im.convert('RGBA').split()[-1]
-
-        # Create a new background image of our matt color.
-        # Must be RGBA because paste requires both images have the same format
-        # (http://stackoverflow.com/a/8720632  and  http://stackoverflow.com/a/9459208)
-        bg = Image.new("RGBA", im.size, bg_color + (255,))
-        bg.paste(im, mask=alpha)
-        return bg
-    else:
-        return im
+    current_cam = CAM.objects.select_related('user').get(id=request.user.active_cam_num)
+    names = image_names(current_cam)
+    if not is_current(current_cam, names):
+        image_data = request.POST.get('html_to_convert')
+        dataUrlPattern = re.compile('data:image/(png|jpeg);base64,(.*)$')
+        image_data = dataUrlPattern.match(image_data).group(2)
+        save_original(base64.b64decode(image_data.encode()), image_path(names[1]))
+        replace_image(current_cam, names[1])
+        CAM.objects.filter(id=current_cam.id).update(cam_image=names[1], image_version=current_cam.image_version)
+    return JsonResponse({'file_name': media_url + str(current_cam.cam_image),
+                         'print_url': reverse('image_CAM_variant', args=['print']) + '?pk=%i' % current_cam.id})
 
 
-def Image_CAM(request):
-    image_data = request.POST.get('html_to_convert')
-    dataUrlPattern = re.compile('data:image/(png|jpeg);base64,(.*)$')
-    image_data = dataUrlPattern.match(image_data).group(2)
-    image_data = image_data.encode()
-    image_data = base64.b64decode(image_data)
-    user = CustomUser.objects.get(username=request.user.username)
-    file_name = media_url[1:]+'CAMS/'+request.user.username+'_'+str(user.active_cam_num)+'.png'
-    print(media_url)
-    with open(file_name, 'wb') as f:
-        f.write(image_data)
-    with open(file_name, "rb") as image_file:
-        data = base64.b64encode(image_file.read())
-    im = Image.open(BytesIO(base64.b64decode(data)))
-    if im.mode in ('RGBA', 'LA'):
-        im = remove_transparency(im)
-        im = im.convert('RGB')
-    im = im.resize((im.width*5, im.height*5), Image.ANTIALIAS)
-    im.save(file_name, 'PNG', quality=1000)
-    gray_image = ImageOps.grayscale(im)
-    gray_image.save(media_url[1:]+'CAMS/'+request.user.username+'_'+str(user.active_cam_num)+'_grayscale.png', 'PNG')
-    current_cam = CAM.objects.get(id=user.active_cam_num)
-    current_cam.cam_image = file_name
-    current_cam.save()
-
-    return JsonResponse({'file_name': file_name})
+@login_required(login_url='loginpage')
+@integer_pk
+def image_CAM_variant(request, variant):
+    """
+    Return a version of the image of a CAM (see users.cam_images.VARIANTS), made on the first request. The CAM is given
+    by the pk parameter and defaults to the user's active CAM.
+    """
+    if variant not in VARIANTS:
+        return JsonResponse({'error_message': 'Unknown image %s' % variant}, status=404)
+    current_cam = CAM.objects.filter(id=request.GET.get('pk', request.user.active_cam_num)).first()
+    if current_cam is None or not current_cam.cam_image or not os.path.isfile(image_path(current_cam.cam_image)):
+        return JsonResponse({'error_message': "This CAM doesn't have an image!"}, status=404)
+    if request.user.id not in (current_cam.user_id, current_cam.project and current_cam.project.researcher_id):
+        return JsonResponse({'error_message': 'You do not have access to this CAM'}, status=403)
+    return FileResponse(open(image_variant(current_cam.cam_image, variant), 'rb'), content_type='image/png')
 
 def view_pdf(request):
     print('meow meow')
@@ -421,85 +402,49 @@ def export_CAM(request):
     return response
 
 
+@login_required(login_url='loginpage')
+@integer_pk
+def export_CAM_vector(request, file_format):
+    """
+    Download a CAM drawn on the server as SVG or PDF. The CAM is given by the pk parameter and defaults to the user's
+    active CAM.
+    """
+    current_cam = CAM.objects.filter(id=request.GET.get('pk', request.user.active_cam_num)).select_related('user').first()
+    if current_cam is None:
+        return JsonResponse({'error_message': "This CAM doesn't exist!"}, status=404)
+    if request.user.id not in (current_cam.user_id, current_cam.project and current_cam.project.researcher_id):
+        return JsonResponse({'error_message': 'You do not have access to this CAM'}, status=403)
+    data = CAMData.from_cam(current_cam.id)
+    if file_format == 'svg':
+        response = HttpResponse(cam_svg(data), content_type='image/svg+xml')
+    elif file_format == 'pdf':
+        try:
+            response = HttpResponse(cam_pdf(data), content_type='application/pdf')
+        except ValueError as error:
+            return JsonResponse({'error_message': str(error)}, status=501)
+    else:
+        return JsonResponse({'error_message': 'Unknown format %s' % file_format}, status=404)
+    response['Content-Disposition'] = 'attachment; filename="%s_CAM.%s"' % (current_cam.user.username, file_format)
+    return response
+
+
 def import_CAM(request):
     """
-    Functionality to import a CAM. The workflos is as follows:
+    Functionality to import a CAM. The workflow is as follows:
     1 - Read in file from Jquery/Ajax call. This file is in the format of a zip file containing csvs for both the
     blocks and links. The input here is the output of the export_CAM function.
-    2 - Clear any blocks/links from the current CAM in case any exist
-    3 -
+    2 - Read and validate the csvs in memory (see users/importer.py)
+    3 - Replace the blocks/links of the current CAM with the imported ones in a single transaction
     """
     if request.method == 'POST':
-        block_resource = BlockResource()
-        link_resource = LinkResource()
-        dataset = Dataset()
         uploaded_CAM = request.FILES['myfile']
         deletable = request.POST.get('Deletable')
-        # Clear all current blocks and links
-        user = CustomUser.objects.get(username=request.user.username)
-        current_cam = CAM.objects.get(id=user.active_cam_num)
-        user = request.user
-        blocks = current_cam.block_set.all()
-        for block in blocks:
-            block.delete()
-        links = current_cam.link_set.all()
-        for link in links:
-            link.delete()
-        ct = 0
-        #try:
-        # Read zip file
-        with ZipFile(uploaded_CAM) as z:
-            for filename in z.namelist():
-                # Step through csv file
-                if filename.endswith('.csv'):
-                    data = z.extract(filename)
-                    test = pd.read_csv(data)
-                    # Set creator and CAM to the current user and their CAM
-                    #test['id'] = test['id'].apply(lambda x: ' ')  # Must be empty to auto id
-                    test['creator'] = test['creator'].apply(lambda x: request.user.id)
-                    test['CAM'] = test['CAM'].apply(lambda x: current_cam.id)
-                    if 'blocks' in filename:
-                        test['text_scale'] = test['text_scale'].apply(lambda x: x if ~np.isnan(x) else 14)
-                    # Read in information from csvs
-                    test.to_csv(data)
-                    imported_data = dataset.load(open(data).read())
-                    if 'blocks' in filename:  # first csv is blocks.csv
-                        result = block_resource.import_data(imported_data, dry_run=True)  # Test the data import
-                        print(result)
-                        if not result.has_errors():
-                            block_resource.import_data(imported_data, dry_run=False)  # Actually import now
-                        else:
-                            print('Error in reading in concepts')
-                            print(result.row_errors())
-                    else:  # Second csv is links.csv
-                        result = link_resource.import_data(imported_data, dry_run=True)  # Test the data import
-                        if not result.has_errors():
-                            link_resource.import_data(imported_data, dry_run=False)  # Actually import now
-                        else:
-                            print('Error in reading in links')
-                            print(result.row_errors())
-                            for row in result.rows:
-                                print(row)
-                    ct += 1
-                else:
-                    pass
-        #except:
-       # print('Import didnt work')
-        # We now have to clean up the blocks' links...
-        blocks_imported = current_cam.block_set.all()
-        for block in blocks_imported:
-            # Clean up Comments ('none' -> '')
-            if block.comment == 'None' or block.comment == 'none':
-                block.comment = ''
-            if deletable is not None:
-                block.modifiable = False
-            # Change block creator to current user
-            block.creator = request.user
-            block.save()
-        links_imported = current_cam.link_set.all()
-        for link in links_imported:
-            link.creator = request.user
-            link.save()
+        current_cam = CAM.objects.get(id=request.user.active_cam_num)
+        try:
+            template = read_cam_zip(uploaded_CAM)
+            import_cam(template, current_cam, request.user, deletable=deletable is not None)
+        except CAMImportError as error:
+            messages.error(request, str(error))  # Shown above the canvas
         return redirect('/')
 
 
@@ -545,7 +490,11 @@ def send_cam(request):
     link_resource = LinkResource().export(Link.objects.filter(creator=user_id)).csv
     message.attach(username+'_blocks.csv', block_resource, 'text/csv')
     message.attach(username+'_links.csv', link_resource, 'text/csv')
-    message.attach(username+'_CAM.pdf', open('media/'+username+'.pdf', 'rb').read())
+    data = CAMData.from_cam(request.user.active_cam_num)
+    if weasyprint is not None:
+        message.attach(username+'_CAM.pdf', cam_pdf(data), 'application/pdf')
+    else:
+        message.attach(username+'_CAM.svg', cam_svg(data), 'image/svg+xml')
     message.send()
     return redirect('/')
 
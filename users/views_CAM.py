@@ -1,17 +1,21 @@
-from django.shortcuts import render
+from django.shortcuts import render, redirect
 from .forms import IndividualCAMCreationForm, ProjectCAMCreationForm
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
 from users.models import CAM, Project
 from block.models import Block
 from .resources import BlockResource, LinkResource
+from .cam_snapshot import get_snapshot
+from .importer import project_template, import_cam, CAMImportError
+from .jobs import enqueue
+from .exporter import stream_zip, project_members
+from .cam_images import cached_image, image_path
 from zipfile import ZipFile
 from io import BytesIO
-import pandas as pd
-from tablib import Dataset
-from django.forms.models import model_to_dict
-from django.conf import settings
 import datetime
 from django.contrib.auth import get_user_model
+from django.contrib.auth.decorators import login_required
+from users.decorators import integer_pk
 
 User = get_user_model()
 
@@ -59,75 +63,19 @@ def create_project_cam(user, project):
 
 def upload_cam_participant(participant, project):
     """
-    Assign CAM to participant when they make a linked account
+    Assign CAM to participant when they make a linked account. If the project has an initial CAM, its concepts and
+    links are copied into the participant's new CAM (the initial CAM is only parsed once per project, see
+    users/importer.py)
     """
     cam = create_project_cam(participant, project.id)
-    try:
-        # If we are given an initial import file add the concepts/links
-        if project.Initial_CAM:
-            # Save input file and set to Project
-            block_resource = BlockResource()
-            link_resource = LinkResource()
-            dataset = Dataset()
-            current_cam = CAM.objects.get(id=participant.active_cam_num)
-            # Clear all current blocks and links
-            blocks = current_cam.block_set.all()
-            for block in blocks:
-                block.delete()
-            links = current_cam.link_set.all()
-            for link in links:
-                link.delete()
-            ct = 0
-            project_cam_name = project.Initial_CAM.name.split('/')[-2] + '/' + project.Initial_CAM.name.split('/')[-1]
-            with ZipFile(settings.MEDIA_ROOT+'/'+project_cam_name) as z:
-                for filename in z.namelist():
-                    if filename.endswith('.csv'):
-                        data = z.extract(filename)
-                        test = pd.read_csv(data)
-                        # Set creator and CAM to the current user and their CAM
-                        test['id'] = test['id'].apply(lambda x: ' ')  # Must be empty to auto id
-                        test['creator'] = test['creator'].apply(lambda x: participant.id)
-                        test['CAM'] = test['CAM'].apply(lambda x: current_cam.id)
-                        # Read in information from csvs
-                        test.to_csv(data)
-                        imported_data = dataset.load(open(data).read())
-                        blocks_imported = current_cam.block_set.all()
-                        print([block.id for block in blocks_imported])
-                        if ct == 0:  # first csv is blocks.csv
-                            result = block_resource.import_data(imported_data, dry_run=True)  # Test the data import
-                            if not result.has_errors():
-                                block_resource.import_data(imported_data, dry_run=False)  # Actually import now
-                            else:
-                                print('Error in reading in concepts')
-                                print(result.row_errors())
-                        else:  # Second csv is links.csv
-                            result = link_resource.import_data(imported_data, dry_run=True)  # Test the data import
-                            if not result.has_errors():
-                                link_resource.import_data(imported_data, dry_run=False)  # Actually import now
-                            else:
-                                print('Error in reading in links')
-                                print(result.row_errors())
-                        ct += 1
-                    else:
-                        pass
-
-                    # We now have to clean up the blocks' links...
-            blocks_imported = cam.block_set.all()
-            for block in blocks_imported:
-                # Clean up Comments ('none' -> '')
-                if block.comment == 'None' or block.comment == 'none':
-                    block.comment = ''
-                #if deletable is not None:
-                #    block.modifiable = False
-                # Change block creator to current user
-                block.creator = participant
-                block.save()
-            links_imported = current_cam.link_set.all()
-            for link in links_imported:
-                link.creator = participant
-                link.save()
-    except:
-        pass
+    if cam is not None:
+        try:
+            template = project_template(project)
+            if template is not None:
+                import_cam(template, cam, participant, clear=False)
+        except (CAMImportError, OSError) as error:
+            print('Error in reading in the initial CAM')
+            print(error)
     participant.save()
 
 
@@ -179,29 +127,40 @@ def download_cam(request):
         for resource in [block_resource, link_resource]:
             zf.writestr("{}.csv".format(names[ct]), resource)
             ct += 1
-        if current_cam.cam_image:
-            try:
-                zf.write(str(current_cam.cam_image))
-            except:
-                pass
+        image = cached_image(current_cam)  # Only drawn if the CAM changed since its image was drawn
+        zf.write(image_path(image), image)
     response = HttpResponse(outfile.getvalue(), content_type='application/octet-stream')
     response['Content-Disposition'] = 'attachment; filename="' + current_cam.user.username + '_CAM.zip"'
     return response
 
 
+@login_required(login_url='loginpage')
+@integer_pk
+def cam_snapshot(request):
+    """
+    Return the blocks and links of a CAM as JSON so the canvas (or a researcher previewing a participant's CAM) can
+    fetch them directly. The CAM is given by the pk parameter and defaults to the user's active CAM.
+    """
+    cam_id = request.GET.get('pk', request.user.active_cam_num)
+    owners = CAM.objects.filter(id=cam_id).values_list('user_id', 'project__researcher_id').first()
+    if owners is None:
+        return JsonResponse({'error_message': "This CAM doesn't exist!"}, status=404)
+    if request.user.id not in owners:
+        return JsonResponse({'error_message': 'You do not have access to this CAM'}, status=403)
+    return JsonResponse(get_snapshot(int(cam_id)))
+
+
 def initial_cam(request):
+    """
+    Export the CAMs of a project named after their users, in the background if the job queue is enabled (see
+    jobs.export_initial_cams) and streamed otherwise
+    """
     current_project = Project.objects.get(id=request.GET.get('pk'))
-    outfile = BytesIO()  # io.BytesIO() for python 3
-    with ZipFile(outfile, 'w') as zf:
-        for current_cam in current_project.cam_set.all():
-            block_resource = BlockResource().export(current_cam.block_set.all()).csv
-            link_resource = LinkResource().export(current_cam.link_set.all()).csv
-            names = ['blocks', 'links']
-            ct = 0
-            for resource in [block_resource, link_resource]:
-                zf.writestr("{}.csv".format(current_cam.user.username + '_' + names[ct]), resource)
-                ct += 1
-    response = HttpResponse(outfile.getvalue(), content_type='application/octet-stream')
+    if getattr(settings, 'JOB_QUEUE_ENABLED', False):
+        enqueue('export_initial_cams', request.user, current_project)
+        return redirect('project_page')
+    members = project_members(current_project, '{username}_{name}.csv')
+    response = StreamingHttpResponse(stream_zip(members), content_type='application/octet-stream')
     response['Content-Disposition'] = 'attachment; filename="' + request.user.username + '_CAM.zip"'
     return response
 
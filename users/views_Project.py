@@ -1,17 +1,16 @@
 from django.shortcuts import render, redirect
+from django.contrib.auth.decorators import login_required
 from .forms import ProjectCreationForm
-from .create_users import create_users
-from django.http import HttpResponse, JsonResponse
-from .models import Project, CAM
-from .resources import BlockResource, LinkResource
-from zipfile import ZipFile
-from io import BytesIO
+from .jobs import enqueue
+from .exporter import stream_zip, project_members, analysis_members, analysis_format, export_since
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from .models import Project, CAM, Job
 from .views_CAM import upload_cam_participant, create_individual_cam, clone_CAM_call
 from django.contrib.auth import login, authenticate
 from .forms import ParticipantSignupForm
 from users.forms import CustomUserCreationForm
 from users.models import CustomUser
-from django.utils import translation
+from django.utils import translation, timezone
 from django.conf import settings as settings_dj
 from django.http import HttpResponse
 from django.contrib.auth import get_user_model
@@ -29,7 +28,9 @@ def project_page(request):
     project = Project.objects.get(id=user_.active_project_num)
     context = {
         'user': user_,
-        'active_project': project
+        'active_project': project,
+        'cams': project.cam_set.select_related('user', 'stats'),  # One query for the progress of every participant
+        'jobs': Job.objects.filter(project=project, owner=user_).order_by('-id')[:5]
     }
     return render(request, "project_page.html", context=context)
 
@@ -56,19 +57,22 @@ def create_project(request):
             input_file = False
         if form.is_valid():
             project = form.save()
-            project.Initial_CAM = input_file
-            project.save()
-            print(project.Initial_CAM)
+            if input_file:
+                project.Initial_CAM = input_file
+                project.save()
             # Check if we need to create users
             if request.POST.get('participantType') == 'auto_participants':
-                # Call creation function found in create_users.py
-                create_users(project, user_.researcher, project.num_part, request.POST.get('name_participants'),
-                             request.POST.get('languagePreference'), input_file,
-                             request.POST.get('conceptDelete'))
+                # Participants are created in the background (see jobs.create_participants)
+                enqueue('create_participants', user_, project, num_part=project.num_part,
+                        call_id=request.POST.get('name_participants'),
+                        language_pref=request.POST.get('languagePreference'),
+                        deletable=request.POST.get('conceptDelete') is not None)
             context = {
                 'user': user_,
                 'active_project': project,
                 'form': form,
+                'cams': project.cam_set.select_related('user', 'stats'),
+                'jobs': Job.objects.filter(project=project, owner=user_).order_by('-id')[:5]
                 }
 
             return render(request, "project_page.html", context=context)
@@ -261,24 +265,51 @@ def delete_project(request):
 
 
 def download_project(request):
+    """
+    Export every CAM of a project, or with since=<token of a previous export> only the CAMs changed since then. With
+    the job queue enabled the zip file is built by a background job (see
+    jobs.export_project) and the user is sent to the project page which shows its progress. Otherwise the zip file is
+    streamed to the user as it is generated.
+    """
     current_project = Project.objects.get(id=request.GET.get('pk'))
-    outfile = BytesIO()  # io.BytesIO() for python 3
-    with ZipFile(outfile, 'w') as zf:
-        for current_cam in current_project.cam_set.all():
-            block_resource = BlockResource().export(current_cam.block_set.all()).csv
-            link_resource = LinkResource().export(current_cam.link_set.all()).csv
-            names = ['blocks', 'links']
-            ct = 0
-            for resource in [block_resource, link_resource]:
-                zf.writestr("{}.csv".format(current_cam.user.username+'_'+str(current_cam.id)+'_'+names[ct]), resource)
-                ct += 1
-            if current_cam.cam_image:
-                try:
-                    zf.write(str(current_cam.cam_image))
-                except:
-                    pass
-    response = HttpResponse(outfile.getvalue(), content_type='application/octet-stream')
+    try:
+        since = export_since(request.GET.get('since'))
+    except ValueError as error:
+        return JsonResponse({'error_message': str(error)}, status=400)
+    if getattr(settings_dj, 'JOB_QUEUE_ENABLED', False):
+        enqueue('export_project', request.user, current_project, images=True, since=request.GET.get('since'))
+        return redirect('project_page')
+    token = timezone.now().isoformat()
+    members = project_members(current_project, '{username}_{cam_id}_{name}.csv', images=True, since=since,
+                              token=token)
+    response = StreamingHttpResponse(stream_zip(members), content_type='application/octet-stream')
     response['Content-Disposition'] = 'attachment; filename="' + current_project.name + '_CAM.zip"'
+    response['X-Export-Token'] = token  # Pass as since to only download the CAMs changed after this export
+    return response
+
+
+@login_required(login_url='loginpage')
+def download_project_data(request):
+    """
+    Export the blocks and links of all CAMs of a project as two columnar files for analysis (Parquet, or csv with
+    format=csv) plus a manifest, in the background if the job queue is enabled (see jobs.export_project_analysis).
+    Only the researcher of the project can export it.
+    """
+    current_project = Project.objects.filter(id=request.GET.get('pk')).first()
+    if current_project is None:
+        return JsonResponse({'error_message': "This project doesn't exist!"}, status=404)
+    if current_project.researcher_id != request.user.id:
+        return JsonResponse({'error_message': 'You do not have access to this project'}, status=403)
+    try:
+        file_format = analysis_format(request.GET.get('format'))
+    except ValueError as error:
+        return JsonResponse({'error_message': str(error)}, status=400)
+    if getattr(settings_dj, 'JOB_QUEUE_ENABLED', False):
+        enqueue('export_project_analysis', request.user, current_project, format=file_format)
+        return redirect('project_page')
+    members = analysis_members(current_project, file_format)
+    response = StreamingHttpResponse(stream_zip(members), content_type='application/octet-stream')
+    response['Content-Disposition'] = 'attachment; filename="' + current_project.name + '_data.zip"'
     return response
 
 
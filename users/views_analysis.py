@@ -0,0 +1,62 @@
+"""
+Network metrics of CAMs (see users/analysis.py) for the researchers of a project and the owners of the CAMs.
+"""
+from django.contrib.auth.decorators import login_required
+from users.decorators import integer_pk
+from django.http import JsonResponse
+from users.models import CAM, Project
+from .analysis import cam_metrics, project_metrics, project_concepts
+
+
+@login_required(login_url='loginpage')
+@integer_pk
+def cam_analysis(request):
+    """
+    Return the metrics of a CAM and of each of its concepts. The CAM is given by the pk parameter and defaults to the
+    user's active CAM.
+    """
+    cam_id = request.GET.get('pk', request.user.active_cam_num)
+    owners = CAM.objects.filter(id=cam_id).values_list('user_id', 'project__researcher_id').first()
+    if owners is None:
+        return JsonResponse({'error_message': "This CAM doesn't exist!"}, status=404)
+    if request.user.id not in owners:
+        return JsonResponse({'error_message': 'You do not have access to this CAM'}, status=403)
+    return JsonResponse(cam_metrics(cam_id))
+
+
+@login_required(login_url='loginpage')
+@integer_pk
+def project_analysis(request):
+    """
+    Return the metrics of every CAM of a project and their averages. With concepts=1 the metrics of each concept are
+    added.
+    """
+    project = Project.objects.filter(id=request.GET.get('pk', request.user.active_project_num)).first()
+    if project is None:
+        return JsonResponse({'error_message': "This project doesn't exist!"}, status=404)
+    if project.researcher_id != request.user.id:
+        return JsonResponse({'error_message': 'You do not have access to this project'}, status=403)
+    return JsonResponse(project_metrics(project, concepts=request.GET.get('concepts') == '1'))
+
+
+@login_required(login_url='loginpage')
+@integer_pk
+def project_concept_analysis(request):
+    """
+    Return the concepts recurring across the CAMs of a project with their frequency and valence. Parameters: stem=1 to
+    group titles differing by their suffixes, language ('en' or 'de', defaults to the user's language) and min_cams.
+    """
+    project = Project.objects.filter(id=request.GET.get('pk', request.user.active_project_num)).first()
+    if project is None:
+        return JsonResponse({'error_message': "This project doesn't exist!"}, status=404)
+    if project.researcher_id != request.user.id:
+        return JsonResponse({'error_message': 'You do not have access to this project'}, status=403)
+    try:
+        min_cams = int(request.GET.get('min_cams', 1))
+    except ValueError:
+        return JsonResponse({'error_message': 'min_cams must be an integer'}, status=400)
+    concepts = project_concepts(project, stemming=request.GET.get('stem') == '1',
+                                language=request.GET.get('language', request.user.language_preference),
+                                min_cams=min_cams)
+    return JsonResponse({'project': project.name, 'concepts': concepts})
+
@@ -0,0 +1,43 @@
+"""
+Status and results of background jobs (see users/jobs.py). The project page polls job_status until a job is finished
+and then offers its result for download.
+"""
+import os
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, FileResponse
+from django.urls import reverse
+from users.models import Job
+
+
+def job_info(job):
+    """
+    JSON serializable description of a job
+    """
+    info = {'id': job.id, 'kind': job.kind, 'status': job.status, 'progress': job.progress, 'message': job.message,
+            'result_url': None, 'token': job.params.get('token')}
+    if job.status == Job.DONE and job.result:
+        info['result_url'] = reverse('job_result', args=[job.id])
+    return info
+
+
+@login_required(login_url='loginpage')
+def job_status(request, job_id):
+    """
+    Return the status and progress of one of the user's jobs
+    """
+    job = Job.objects.filter(id=job_id, owner=request.user).first()
+    if job is None:
+        return JsonResponse({'error_message': "This job doesn't exist!"}, status=404)
+    return JsonResponse(job_info(job))
+
+
+@login_required(login_url='loginpage')
+def job_result(request, job_id):
+    """
+    Download the file produced by one of the user's jobs
+    """
+    job = Job.objects.filter(id=job_id, owner=request.user, status=Job.DONE).first()
+    if job is None or not job.result:
+        return JsonResponse({'error_message': "This job doesn't have a result!"}, status=404)
+    return FileResponse(job.result.open('rb'), as_attachment=True, filename=os.path.basename(job.result.name),
+                        content_type='application/octet-stream')
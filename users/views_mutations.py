@@ -0,0 +1,342 @@
+"""
+This view handles batched canvas mutations. Rather than firing one synchronous ajax call per drag, resize or style
+change, the canvas queues its edits (see templates/base/mutation-queue.js) and sends them here as an ordered list of
+operations. The operations are replayed against an in-memory copy of the blocks and links they refer to and the final
+state is then written back with a handful of bulk queries inside a single transaction.
+
+Supported operations (block references use the block's `num`, link references use `link_id` or the pair
+`starting_block`/`ending_block`):
+    add_block, update_block, move_block, delete_block, add_link, update_link, swap_link, delete_link
+"""
+import json
+import math
+from datetime import datetime
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse
+from block.models import Block
+from block.views import trans_slide_to_shape, link_geometry
+from link.models import Link
+from users.models import CAM, logCamActions
+from users.journal import count_operations, record, operation, snapshot
+
+
+BLOCK_UPDATE_FIELDS = ('title', 'shape', 'comment', 'x_pos', 'y_pos', 'width', 'height', 'text_scale')
+BLOCK_MOVE_FIELDS = ('x_pos', 'y_pos', 'width', 'height', 'text_scale')
+LINK_UPDATE_FIELDS = ('line_style', 'arrow_type')
+FLOAT_FIELDS = ('x_pos', 'y_pos', 'width', 'height', 'text_scale')
+
+
+class MutationError(Exception):
+    """
+    Raised when an operation cannot be applied. The whole batch is rejected.
+    """
+    pass
+
+
+def to_float(value):
+    """
+    Convert a canvas value (which may carry a trailing 'px') to a float
+    """
+    if isinstance(value, str) and value.endswith('px'):
+        value = value[:-2]
+    return float(value)
+
+
+class CAMState:
+    """
+    In-memory copy of the blocks and links of a CAM that a batch of operations refers to. Operations are applied to
+    this state and the differences are written back to the database by flush().
+    """
+    def __init__(self, cam, user, operations):
+        self.cam = cam
+        self.user = user
+        blocks, links = self.load(operations)
+        self.blocks = {block.num: block for block in blocks}  # num -> Block
+        nums = {block.id: num for num, block in self.blocks.items()}
+        self.links = []
+        for link in links:
+            link.start_num = nums.get(link.starting_block_id)
+            link.end_num = nums.get(link.ending_block_id)
+            self.links.append(link)
+        # State of the objects when the batch started, journaled as one action once it is written (see flush)
+        self.original = {('block', block.id): snapshot(block) for block in self.blocks.values()}
+        self.original.update({('link', link.id): snapshot(link) for link in self.links})
+        self.dirty_blocks = {}  # num -> set of updated fields
+        self.dirty_links = {}  # id(link) -> (link, set of updated fields)
+        self.deleted_blocks = []
+        self.deleted_links = []
+
+    def load(self, operations):
+        """
+        Read the blocks the operations refer to by number (including the numbers of new blocks, to find the ones that
+        are taken), every link attached to them or referred to by id, and the other blocks of these links. The rest of
+        the CAM is not read.
+        """
+        nums, link_ids = set(), set()
+        for operation in operations:
+            if not isinstance(operation, dict):
+                continue  # Rejected by apply_operation
+            for field in ('num', 'starting_block', 'ending_block'):
+                try:
+                    num = to_float(operation.get(field))
+                except (TypeError, ValueError):
+                    continue
+                if math.isfinite(num):
+                    nums.add(num)
+            try:
+                link_ids.add(int(operation.get('link_id')))
+            except (TypeError, ValueError):
+                pass
+        blocks = list(self.cam.block_set.filter(num__in=nums)) if nums else []
+        ids = {block.id for block in blocks}
+        links = []
+        if ids or link_ids:
+            links = list(self.cam.link_set.filter(
+                Q(starting_block_id__in=ids) | Q(ending_block_id__in=ids) | Q(id__in=link_ids)
+            ))
+        ends = {link.starting_block_id for link in links} | {link.ending_block_id for link in links}
+        if ends - ids:
+            blocks += list(self.cam.block_set.filter(id__in=ends - ids))
+        return blocks, links
+
+    def get_block(self, num):
+        try:
+            return self.blocks[to_float(num)]
+        except (KeyError, TypeError, ValueError):
+            raise MutationError('Block %s does not exist' % num)
+
+    def get_link(self, operation):
+        if operation.get('link_id') is not None:
+            for link in self.links:
+                if link.pk is not None and str(link.pk) == str(operation['link_id']):
+                    return link
+            raise MutationError('Link %s does not exist' % operation['link_id'])
+        start = self.get_block(operation.get('starting_block')).num
+        end = self.get_block(operation.get('ending_block')).num
+        for link in self.links:
+            if link.start_num == start and link.end_num == end:
+                return link
+        raise MutationError('Link between %s and %s does not exist' % (start, end))
+
+    def mark_block(self, block, fields):
+        if block.pk is not None:
+            self.dirty_blocks.setdefault(block.num, set()).update(fields)
+
+    def mark_link(self, link, fields):
+        if link.pk is not None:
+            self.dirty_links.setdefault(id(link), (link, set()))[1].update(fields)
+
+    def add_block(self, operation):
+        num = to_float(operation.get('num'))
+        if num in self.blocks:
+            raise MutationError('Block %s already exists' % operation.get('num'))
+        block = Block(title=operation.get('title', ''), shape=trans_slide_to_shape(str(operation.get('shape'))),
+                      num=num, x_pos=to_float(operation.get('x_pos', 0)), y_pos=to_float(operation.get('y_pos', 0)),
+                      width=to_float(operation.get('width', 160)), height=to_float(operation.get('height', 120)),
+                      comment=operation.get('comment', ''), timestamp=datetime.now(), creator=self.user,
+                      CAM=self.cam)
+        self.blocks[num] = block
+        return block
+
+    def update_block(self, operation, allowed_fields):
+        block = self.get_block(operation.get('num'))
+        fields = set()
+        for field in allowed_fields:
+            if operation.get(field) is not None:
+                value = operation[field]
+                if field in FLOAT_FIELDS:
+                    value = to_float(value)
+                elif field == 'shape':
+                    value = trans_slide_to_shape(str(value))
+                elif field == 'comment':
+                    value = value.strip('\n')
+                setattr(block, field, value)
+                fields.add(field)
+        block.timestamp = datetime.now()
+        fields.add('timestamp')
+        self.mark_block(block, fields)
+        return block
+
+    def delete_block(self, operation):
+        block = self.get_block(operation.get('num'))
+        del self.blocks[block.num]
+        self.dirty_blocks.pop(block.num, None)
+        if block.pk is not None:
+            self.deleted_blocks.append(block)
+        # Links attached to the block go with it
+        for link in [link for link in self.links if block.num in (link.start_num, link.end_num)]:
+            self.remove_link(link)
+        return block
+
+    def add_link(self, operation):
+        start = self.get_block(operation.get('starting_block'))
+        end = self.get_block(operation.get('ending_block'))
+        for link in self.links:
+            if link.start_num == start.num and link.end_num == end.num:
+                return link  # Link already exists
+        link = Link(line_style=operation.get('line_style') or 'Solid-Weak',
+                    arrow_type=operation.get('arrow_type') or 'none', timestamp=datetime.now(), creator=self.user,
+                    CAM=self.cam)
+        link.start_num = start.num
+        link.end_num = end.num
+        self.links.append(link)
+        return link
+
+    def update_link(self, operation):
+        link = self.get_link(operation)
+        fields = {field for field in LINK_UPDATE_FIELDS if operation.get(field) is not None}
+        for field in fields:
+            setattr(link, field, operation[field])
+        link.timestamp = datetime.now()
+        self.mark_link(link, fields | {'timestamp'})
+        return link
+
+    def swap_link(self, operation):
+        link = self.get_link(operation)
+        link.start_num, link.end_num = link.end_num, link.start_num
+        link.timestamp = datetime.now()
+        self.mark_link(link, {'starting_block', 'ending_block', 'timestamp'})
+        return link
+
+    def remove_link(self, link):
+        self.links.remove(link)
+        self.dirty_links.pop(id(link), None)
+        if link.pk is not None:
+            self.deleted_links.append(link)
+
+    def delete_link(self, operation):
+        link = self.get_link(operation)
+        self.remove_link(link)
+        return link
+
+    def flush(self):
+        """
+        Write the final state back to the database. Deletes, inserts and updates are each issued as one statement per
+        model.
+        """
+        if self.deleted_links:
+            Link.objects.filter(id__in=[link.id for link in self.deleted_links]).delete()
+        if self.deleted_blocks:
+            Block.objects.filter(id__in=[block.id for block in self.deleted_blocks]).delete()
+        new_blocks = [block for block in self.blocks.values() if block.pk is None]
+        if new_blocks:
+            Block.objects.bulk_create(new_blocks)
+            if any(block.pk is None for block in new_blocks):  # Backend could not return the new ids
+                ids = dict(self.cam.block_set.filter(num__in=[block.num for block in new_blocks])
+                           .values_list('num', 'id'))
+                for block in new_blocks:
+                    block.pk = ids[block.num]
+        if self.dirty_blocks:
+            fields = set().union(*self.dirty_blocks.values())
+            Block.objects.bulk_update([self.blocks[num] for num in self.dirty_blocks], list(fields))
+        # Now that every block has an id we can resolve the end points of the links we write
+        new_links = [link for link in self.links if link.pk is None]
+        for link in new_links + [link for link, fields in self.dirty_links.values()]:
+            link.starting_block_id = self.blocks[link.start_num].id
+            link.ending_block_id = self.blocks[link.end_num].id
+        if new_links:
+            Link.objects.bulk_create(new_links)
+            if any(link.pk is None for link in new_links):
+                ids = {(start, end): id_ for id_, start, end in self.cam.link_set.filter(
+                    starting_block_id__in=[link.starting_block_id for link in new_links]
+                ).values_list('id', 'starting_block_id', 'ending_block_id')}
+                for link in new_links:
+                    link.pk = ids[(link.starting_block_id, link.ending_block_id)]
+        if self.dirty_links:
+            fields = set().union(*[fields for link, fields in self.dirty_links.values()])
+            Link.objects.bulk_update([link for link, fields in self.dirty_links.values()], list(fields))
+        CAM.bump_version(self.cam.id)
+        operations = self.operations(new_blocks, new_links)
+        count_operations(self.cam.id, operations, 'after')
+        record(self.cam.id, logCamActions.UPDATE, logCamActions.BLOCK, operations)
+
+    def operations(self, new_blocks, new_links):
+        """
+        Journal operations of the batch, ordered so that undoing them (in reverse) restores the deleted objects before
+        the links that refer to them
+        """
+        updated = [self.blocks[num] for num in self.dirty_blocks] + [link for link, fields in self.dirty_links.values()]
+        return ([operation(obj, after=snapshot(obj)) for obj in new_blocks + new_links]
+                + [operation(obj, self.original[(obj._meta.model_name, obj.id)], snapshot(obj)) for obj in updated]
+                + [operation(obj, before=self.original[(obj._meta.model_name, obj.id)])
+                   for obj in self.deleted_links + self.deleted_blocks])
+
+    def link_geometry(self, block):
+        """
+        Geometry of the links attached to a block in the format returned by block.views.drag_function
+        """
+        return link_geometry(
+            (link.id, link.line_style, self.blocks[link.start_num], self.blocks[link.end_num])
+            for link in self.links if block.num in (link.start_num, link.end_num)
+        )
+
+
+def apply_operation(state, operation):
+    """
+    Apply a single operation to the in-memory state and return a function producing the operation's result once the
+    state has been flushed (ids of new objects are only known at that point).
+    """
+    op = operation.get('op')
+    if op == 'add_block':
+        block = state.add_block(operation)
+        return lambda: {'id': block.id, 'num': block.num, 'shape': block.shape}
+    elif op == 'update_block':
+        block = state.update_block(operation, BLOCK_UPDATE_FIELDS)
+        return lambda: {'id': block.id, 'num': block.num, 'shape': block.shape}
+    elif op == 'move_block':
+        block = state.update_block(operation, BLOCK_MOVE_FIELDS)
+        return lambda: state.link_geometry(block)
+    elif op == 'delete_block':
+        block = state.delete_block(operation)
+        return lambda: {'num': block.num}
+    elif op in ('add_link', 'update_link', 'swap_link'):
+        link = getattr(state, op)(operation)
+
+        def link_result():
+            start = state.blocks.get(link.start_num)
+            end = state.blocks.get(link.end_num)
+            if start is None or end is None:  # Removed later in the same batch
+                return {'id': link.id}
+            return {'id': link.id, 'line_style': link.line_style, 'arrow_type': link.arrow_type,
+                    'starting_block': start.num, 'ending_block': end.num, 'start_x': start.x_pos,
+                    'start_y': start.y_pos, 'end_x': end.x_pos, 'end_y': end.y_pos}
+        return link_result
+    elif op == 'delete_link':
+        link = state.delete_link(operation)
+        return lambda: {'id': link.id}
+    raise MutationError('Unknown operation %s' % op)
+
+
+@login_required(login_url='loginpage')
+def cam_mutations(request, cam_id):
+    """
+    Apply an ordered list of canvas operations to a CAM in one transaction. The request body is JSON of the form
+    {"operations": [{"op": "move_block", "num": 3, "x_pos": "10px", ...}, ...]}. The response contains one result per
+    operation, in the same order.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error_message': 'Mutations must be sent as a POST'}, status=405)
+    try:
+        operations = json.loads(request.body)['operations']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error_message': 'Malformed operation list'}, status=400)
+    if not isinstance(operations, list):
+        return JsonResponse({'error_message': 'Malformed operation list'}, status=400)
+    with transaction.atomic():
+        try:
+            cam = CAM.objects.select_for_update().get(id=cam_id)
+        except CAM.DoesNotExist:
+            return JsonResponse({'error_message': "This CAM doesn't exist!"}, status=404)
+        if cam.user_id != request.user.id:
+            return JsonResponse({'error_message': 'You can only modify your own CAM'}, status=403)
+        state = CAMState(cam, request.user, operations)
+        results = []
+        for index, operation in enumerate(operations):
+            try:
+                results.append(apply_operation(state, operation))
+            except (MutationError, ValueError, TypeError, AttributeError) as error:
+                return JsonResponse({'error_message': str(error), 'index': index}, status=400)
+        state.flush()
+    return JsonResponse({'message': 'Success', 'results': [result() for result in results]})
@@ -1,80 +1,36 @@
 """
-This view handles the undo button actions. At the moment (October 23, 2021), the only permitted undo action is the
-"delete" action
+This view handles the undo and redo buttons. Every edit of a CAM is recorded in its journal (see users/journal.py):
+undoing writes back the state of the objects before the last action and redoing writes the state after it again.
 """
-from users.models import CAM
-from link.models import Link
-from block.forms import BlockForm
-from link.forms import LinkForm
 from django.http import JsonResponse
-import ast
-import yaml
-#import logging
-#import cognitiveAffectiveMaps.log_config
-import json
-from django.contrib.auth import get_user_model
-User = get_user_model()
-#logger = logging.getLogger(__name__)
+from users import journal
+
+
+def journal_action(request, step, verb):
+    """
+    Undo or redo (step) an action on the active CAM of the user
+    """
+    if request.method != 'POST':
+        return JsonResponse({"message": 'Failed to %s previous action' % verb})
+    cam_id = request.user.active_cam_num
+    if not request.user.cam_set.filter(id=cam_id).exists():
+        return JsonResponse({'error_message': "This CAM doesn't exist!"}, status=404)
+    if step(cam_id) is None:
+        return JsonResponse({"message": 'Nothing to %s' % verb})
+    return JsonResponse({"message": '%s previous action' % ('Undoing' if verb == 'undo' else 'Redoing')})
 
 
 def undo_action(request):
     """
-    This function will be triggered when a user hits the undo button. At that time, we will look at the users log
-    which is stored in a database. We then read the last action from that database. In the case of delete, the last
-    action will contain the node deleted and the links associated with that node. We will then read in the node
-    and link information as dictionaries. We can then pass those directly to BlockForm and LinkForm to recreate the
-    objects. The page will then be refreshed via the jquery/ajax call.
+    This function will be triggered when a user hits the undo button. The last action of the active CAM which has not
+    been undone is reverted. The page is then refreshed via the jquery/ajax call.
+    """
+    return journal_action(request, journal.undo, 'undo')
+
+
+def redo_action(request):
+    """
+    This function will be triggered when a user hits the redo button. The last undone action of the active CAM is
+    applied again, as long as no other edit was made since it was undone.
     """
-    if request.method == 'POST':  # Trigger action for undo
-        message = 'Undoing previous action'
-        message_type = 'Warning'
-        user_ = User.objects.get(username=request.user.username)
-        current_cam = CAM.objects.get(id=user_.active_cam_num)
-        # Get the latest action ID associated with the user's log. We need this since several rows could correspond to the same actionID
-        latest_action_id = current_cam.logcamactions_set.latest('actionId').actionId
-        action_set = current_cam.logcamactions_set.filter(actionId=latest_action_id)  # Set of all actions associated with the most recent actionID
-        for action_ in action_set:  # Step through each action
-            if action_.actionType == 0:  # Delete action
-                if action_.objType == 1:  # Concept Object
-                    concept_info = yaml.load(action_.objDetails)
-                    form_block = BlockForm(concept_info)  # Getting our block form
-                    try:
-                        block = form_block.save()  # Saving the form and getting the block
-                    except:
-                        message = 'Block form failed.\n %s'%form_block.errors
-                        message_type = 'Error'
-                elif action_.objType == 0:  # Link object
-                    link_info = yaml.load(action_.objDetails)
-                    # Check if newly added block is starting or ending
-                    start_block_bool = True  # Assume it is
-                    try:
-                        Link.objects.filter(ending_block=link_info['ending_block'])
-                        link_info['starting_block'] = block.id
-                    except:
-                        # ending block doesn't exist which means it was deleted. Therefore the newly added block is the ending block
-                        start_block_bool = False
-                        link_info['ending_block'] = block.id
-                    form_link = LinkForm(link_info)  # Getting our block form
-                    # Update link info block
-                    try:
-                        form_link.save()  # Saving the form and getting the block
-                    except:
-                        message = 'Link form failed.\n %s' % form_link.errors
-                        message_type = 'Error'
-                else:
-                    message = 'Only concepts and links can be deleted!'
-                    message_type = 'Warning'
-            else:  # Any other action than deletion
-                message = 'We only allow the undo of deleted nodes and its associated links'
-                message_type = 'Warning'
-            # Delete action from logger
-            #action_.delete()
-    else:
-        message = 'Failed to undo previous action'
-        message_type = 'Warning'
-    # Add message to log
-    '''if message_type == 'Error':
-        logger.error(message)
-    else:
-        logger.warning(message)'''
-    return JsonResponse({"message": message})
+    return journal_action(request, journal.redo, 'redo')